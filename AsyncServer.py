@@ -0,0 +1,307 @@
+"""
+Event-Loop RTSP Server
+Serves every RTSP connection and RTP stream from a single asyncio thread,
+pacing all playing sessions from one shared timer wheel
+"""
+
+import asyncio
+import socket
+
+from ServerWorker import ServerWorker
+from BatchSender import BatchSender
+from BroadcastChannel import BroadcastChannel, configureMulticast
+from Rtcp import RtcpEndpoint
+import config
+
+
+class TimerWheel:
+    """Hashed timer wheel that schedules sessions a whole number of ticks ahead"""
+    
+    def __init__(self, slots=config.TIMER_WHEEL_SLOTS):
+        """Initialize an empty wheel"""
+        self.slots = [dict() for _ in range(slots)]
+        self.position = 0
+        self.entries = {}  # item -> slot it is waiting in
+    
+    def __len__(self):
+        """Return number of scheduled items"""
+        return len(self.entries)
+    
+    def schedule(self, item, ticks=1):
+        """Fire item after the given number of ticks (at least one)"""
+        self.cancel(item)
+        ticks = max(1, ticks)
+        slot = (self.position + ticks) % len(self.slots)
+        rounds = (ticks - 1) // len(self.slots)
+        self.slots[slot][item] = rounds
+        self.entries[item] = slot
+    
+    def cancel(self, item):
+        """Remove item from the wheel if it is scheduled"""
+        slot = self.entries.pop(item, None)
+        if slot is not None:
+            del self.slots[slot][item]
+    
+    def advance(self):
+        """Move the wheel one tick forward and return the items that are due"""
+        self.position = (self.position + 1) % len(self.slots)
+        bucket = self.slots[self.position]
+        due = []
+        for item, rounds in list(bucket.items()):
+            if rounds == 0:
+                del bucket[item]
+                del self.entries[item]
+                due.append(item)
+            else:
+                bucket[item] = rounds - 1
+        return due
+
+
+class StreamSocket:
+    """Socket-like wrapper so ServerWorker can reply through an asyncio stream"""
+    
+    def __init__(self, writer):
+        """Wrap an asyncio StreamWriter"""
+        self.writer = writer
+    
+    def send(self, data):
+        """Queue data on the stream (never blocks)"""
+        self.writer.write(data)
+        return len(data)
+    
+    def close(self):
+        """Close the underlying stream"""
+        self.writer.close()
+
+
+class AsyncSession(ServerWorker):
+    """RTSP session served by the event loop
+    
+    Request parsing and replies are inherited unchanged from ServerWorker;
+    only the streaming hooks differ. Instead of a thread per PLAY, the session
+    is placed on the server's timer wheel, and RTP goes out through the
+    server's single non-blocking UDP socket.
+    """
+    
+    def __init__(self, clientInfo, server):
+        """Initialize session owned by an AsyncServer"""
+        super().__init__(clientInfo)
+        self.server = server
+    
+    def openChannel(self, filename, startFrame, multicast):
+        """Attach to the shared channel, paced by the server's timer wheel"""
+        return AsyncChannel.acquire(filename, startFrame, multicast, server=self.server)
+    
+    def openRtpSocket(self):
+        """Use the server's shared UDP socket"""
+        return self.server.rtpSocket
+    
+    def openRtpSender(self, rtpSocket):
+        """Queue packets on the server's shared batch sender"""
+        return self.server.sender
+    
+    def closeRtpSocket(self, rtpSocket):
+        """The shared UDP socket outlives the session"""
+        pass
+    
+    def startStreaming(self):
+        """Put the session on the timer wheel"""
+        print('[RTP] Starting video stream')
+        self.startPacer(self.server.nextTick)
+        self.server.wheel.schedule(self, 1)
+    
+    def stopStreaming(self):
+        """Take the session off the timer wheel"""
+        if self in self.server.wheel.entries:
+            self.server.wheel.cancel(self)
+            self.stopPacer()
+            print('[RTP] Stopped video stream')
+    
+    def queuePacedFrame(self):
+        """Queue the frames due at this tick, applying the pacing policy"""
+        pacer = self.clientInfo['pacer']
+        while True:
+            skip = pacer.frameDue()
+            if skip:
+                self.skipFrames(skip)
+            # The wheel fires once per tick, so CATCHUP bursts happen here
+            if not pacer.overdue():
+                break
+            # Packet headers live in the encoder's buffer until its next frame,
+            # so each frame of a burst is sent before the next is packetized
+            self.sendFrame()
+        self.queueFrame()
+
+
+class AsyncChannel(BroadcastChannel):
+    """Live or multicast channel served by the event loop
+    
+    Sends through the server's UDP socket and batch sender, and is paced
+    from the timer wheel alongside the unicast sessions.
+    """
+    
+    def __init__(self, stream, startFrame, slot, server):
+        """Initialize channel owned by an AsyncServer"""
+        self.server = server
+        super().__init__(stream, startFrame, slot)
+    
+    def openRtpSocket(self):
+        """Use the server's shared UDP socket"""
+        return self.server.rtpSocket
+    
+    def openRtpSender(self, rtpSocket):
+        """Queue packets on the server's shared batch sender"""
+        return self.server.sender
+    
+    def closeRtpSocket(self, rtpSocket):
+        """The shared UDP socket outlives the channel"""
+        pass
+    
+    def startStreaming(self):
+        """Put the channel on the timer wheel"""
+        print(f'[CHANNEL] Starting stream {self.name}')
+        self.pacer.restart(self.server.nextTick)
+        self.server.wheel.schedule(self, 1)
+    
+    def stopStreaming(self):
+        """Take the channel off the timer wheel"""
+        self.server.wheel.cancel(self)
+        self.pacer.pause()
+        print(f'[CHANNEL] Stopped stream {self.name}. Pacing: {self.pacer.summary()}')
+
+
+class RtcpProtocol(asyncio.DatagramProtocol):
+    """Hands receiver reports arriving on the event loop to their sessions"""
+    
+    def datagram_received(self, data, addr):
+        """Dispatch one RTCP datagram"""
+        try:
+            RtcpEndpoint.dispatch(data, addr)
+        except Exception as e:
+            print(f'[RTCP] Error handling report from {addr}: {e}')
+
+
+class AsyncServer:
+    """RTSP server running all sessions on a single asyncio event loop"""
+    
+    def __init__(self):
+        """Initialize server"""
+        self.host = config.SERVER_HOST
+        self.port = config.RTSP_PORT
+        self.wheel = TimerWheel()
+        self.rtpSocket = None
+        self.sender = None
+        self.rtcpTask = None
+        self.tickInterval = 1.0 / config.FRAME_RATE
+        self.nextTick = None  # loop.time() the wheel next fires at
+    
+    def start(self):
+        """Start the RTSP server"""
+        print(f'[SERVER] Starting event-loop RTSP server on {self.host}:{self.port}')
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print('\n[SERVER] Server interrupted by user')
+        except Exception as e:
+            print(f'[SERVER] Error: {e}')
+        finally:
+            print('[SERVER] Shutting down server...')
+            if self.rtpSocket:
+                self.rtpSocket.close()
+    
+    async def serve(self):
+        """Accept RTSP connections and drive the timer wheel"""
+        self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rtpSocket.setblocking(False)
+        configureMulticast(self.rtpSocket)
+        self.sender = BatchSender(self.rtpSocket)
+        
+        # RTCP for all clients goes through one UDP port
+        try:
+            await asyncio.get_running_loop().create_datagram_endpoint(
+                RtcpProtocol, sock=RtcpEndpoint.openSocket())
+            self.rtcpTask = asyncio.create_task(self.runRtcp())
+        except OSError as e:
+            print(f'[RTCP] Could not open port {config.RTCP_PORT}, RTCP disabled: {e}')
+        
+        server = await asyncio.start_server(self.handleClient, self.host, self.port,
+                                            reuse_address=True)
+        print(f'[SERVER] RTSP server ready. Waiting for connections...')
+        
+        async with server:
+            await self.runWheel()
+    
+    async def runWheel(self):
+        """
+        Fire due sessions once per frame interval on absolute deadlines
+        
+        Pacers are started on this tick grid (loop.time() is the monotonic
+        clock they use), so their lateness is how late the wheel fired, not
+        where within a tick PLAY arrived.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        self.nextTick = deadline + self.tickInterval
+        
+        while True:
+            deadline += self.tickInterval
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -self.tickInterval:
+                # Fell more than a tick behind; drop the missed ticks instead of
+                # bursting, keeping the grid the pacers are aligned to
+                deadline += (-delay // self.tickInterval) * self.tickInterval
+            self.nextTick = deadline + self.tickInterval
+            
+            # Queue every due session's (and channel's) packets, then send them all at once
+            for session in self.wheel.advance():
+                session.queuePacedFrame()
+                self.wheel.schedule(session, 1)
+            
+            try:
+                self.sender.flush()
+            except Exception as e:
+                print(f'[RTP] Error sending frames: {e}')
+    
+    async def runRtcp(self):
+        """Send the sessions' sender reports every RTCP_INTERVAL"""
+        while True:
+            await asyncio.sleep(config.RTCP_INTERVAL)
+            try:
+                RtcpEndpoint.sendReports()
+            except Exception as e:
+                print(f'[RTCP] Error sending reports: {e}')
+    
+    async def handleClient(self, reader, writer):
+        """Receive and handle RTSP requests for one connection"""
+        addr = writer.get_extra_info('peername')
+        clientInfo = {
+            'socket': StreamSocket(writer),
+            'addr': addr,
+            'rtpPort': 0,
+            'session': 0
+        }
+        session = AsyncSession(clientInfo, self)
+        name = f'Client-{addr[0]}:{addr[1]}'
+        print(f'[{name}] Connection from: {addr}')
+        
+        while True:
+            try:
+                data = await asyncio.wait_for(reader.read(256), timeout=30)
+                if data:
+                    print(f'[{name}] Received from client: {data.decode("utf-8")}')
+                    session.processRtspRequest(data.decode("utf-8"))
+                    await writer.drain()
+                else:
+                    break
+            except asyncio.TimeoutError:
+                print(f'[{name}] Client timeout')
+                break
+            except Exception as e:
+                print(f'[{name}] Error: {e}')
+                break
+        
+        session.cleanup()
+        writer.close()
+        print(f'[{name}] Connection closed')
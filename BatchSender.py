@@ -0,0 +1,265 @@
+"""
+Batched UDP Sender
+Collects the RTP packets of one tick and sends them with a single sendmmsg()
+system call where the platform provides it, falling back to one sendto() per
+packet elsewhere
+"""
+
+import sys
+import errno
+import socket
+import struct
+import ctypes
+import ctypes.util
+from itertools import accumulate, chain, repeat
+
+import config
+
+
+# Linux x86-64/arm64 layouts of struct iovec and struct mmsghdr (which wraps
+# struct msghdr), packed with struct rather than built field by field in ctypes
+_IOVEC = struct.Struct('=QQ')                   # iov_base, iov_len
+_MMSGHDR = struct.Struct('=QI4xQQQQi4xI4x')     # name, namelen, iov, iovlen,
+                                                # control, controllen, flags, msg_len
+
+
+class _PyBuffer(ctypes.Structure):
+    """CPython's Py_buffer, filled in by PyObject_GetBuffer"""
+    _fields_ = [('buf', ctypes.c_void_p), ('obj', ctypes.c_void_p), ('len', ctypes.c_ssize_t),
+                ('itemsize', ctypes.c_ssize_t), ('readonly', ctypes.c_int), ('ndim', ctypes.c_int),
+                ('format', ctypes.c_char_p), ('shape', ctypes.c_void_p), ('strides', ctypes.c_void_p),
+                ('suboffsets', ctypes.c_void_p), ('internal', ctypes.c_void_p)]
+
+
+def _loadBufferApi():
+    """Return CPython's PyObject_GetBuffer and PyBuffer_Release, or None on other interpreters"""
+    pythonapi = getattr(ctypes, 'pythonapi', None)
+    if pythonapi is None or not hasattr(pythonapi, 'PyObject_GetBuffer'):
+        return None
+    getBuffer = pythonapi.PyObject_GetBuffer
+    getBuffer.argtypes = [ctypes.py_object, ctypes.POINTER(_PyBuffer), ctypes.c_int]
+    getBuffer.restype = ctypes.c_int
+    releaseBuffer = pythonapi.PyBuffer_Release
+    releaseBuffer.argtypes = [ctypes.POINTER(_PyBuffer)]
+    releaseBuffer.restype = None
+    return getBuffer, releaseBuffer
+
+
+_bufferApi = _loadBufferApi()
+
+
+def _loadSendmmsg():
+    """Return libc's sendmmsg function, or None where it is unavailable"""
+    if (not sys.platform.startswith('linux') or ctypes.sizeof(ctypes.c_void_p) != 8
+            or _bufferApi is None):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _loadSendmmsg()
+
+
+def _address(buffer):
+    """Return the address of a bytearray's storage (it must not be resized while in use)"""
+    return ctypes.addressof(ctypes.c_char.from_buffer(buffer))
+
+
+def _bufferAddress(buffer, pinned, held):
+    """
+    Return the address of a buffer's memory without copying it
+    
+    Writable buffers (the encoders' header buffers) and bytes objects are
+    addressed through ctypes. Other read-only buffers, such as slices of
+    the ACCESS_READ video maps, are addressed through the buffer protocol,
+    which ctypes' from_buffer refuses them; those buffers are appended to
+    held for _releaseBuffers once the send returns. Whatever else holds
+    the memory is appended to pinned, which the caller keeps alive.
+    """
+    if not len(buffer):
+        return 0
+    if type(buffer) is bytes:
+        ref = ctypes.c_char_p(buffer)
+        pinned.append(ref)
+        return ctypes.cast(ref, ctypes.c_void_p).value
+    if not (buffer.readonly if type(buffer) is memoryview else memoryview(buffer).readonly):
+        ref = ctypes.c_char.from_buffer(buffer)
+        pinned.append(ref)
+        return ctypes.addressof(ref)
+    view = _PyBuffer()
+    _bufferApi[0](buffer, view, 0)  # PyBUF_SIMPLE: contiguous, read-only access
+    held.append(view)
+    return view.buf
+
+
+def _releaseBuffers(held):
+    """Release the buffers held by _bufferAddress"""
+    release = _bufferApi[1]
+    for view in held:
+        release(view)
+
+
+def _sockaddr(addr):
+    """Pack an IPv4 (host, port) tuple as a struct sockaddr_in"""
+    return (struct.pack('=H', socket.AF_INET) + struct.pack('!H', addr[1]) +
+            socket.inet_aton(addr[0]) + bytes(8))
+
+
+def sendmmsgAvailable():
+    """Return True if batched sends use sendmmsg on this platform"""
+    return _sendmmsg is not None
+
+
+class BatchSender:
+    """Queues UDP datagrams and sends them together on flush()"""
+    
+    def __init__(self, sock, maxBatch=None, useSendmmsg=True):
+        """
+        Initialize sender
+        
+        Args:
+            sock: UDP socket to send from
+            maxBatch: Most datagrams per sendmmsg call (defaults to config.SENDMMSG_BATCH)
+            useSendmmsg: Set False to force the portable sendto loop
+        """
+        self.socket = sock
+        self.maxBatch = maxBatch or config.SENDMMSG_BATCH
+        self.useSendmmsg = useSendmmsg and _sendmmsg is not None
+        self.packets = []
+        self.destinations = []
+        self.gather = False  # True once a scatter/gather tuple is queued
+        self.addresses = {}  # addr -> (sockaddr buffer, its address)
+        
+        # Statistics
+        self.syscalls = 0
+        self.packetsSent = 0
+        self.packetsDropped = 0
+    
+    def __len__(self):
+        """Return number of queued datagrams"""
+        return len(self.packets)
+    
+    def add(self, packet, addr):
+        """
+        Queue one datagram
+        
+        Args:
+            packet: bytes-like object, or a tuple of them sent as one
+                    datagram with scatter/gather I/O
+            addr: (host, port) destination
+        """
+        if type(packet) is tuple:
+            self.gather = True
+        self.packets.append(packet)
+        self.destinations.append(addr)
+    
+    def addMany(self, packets, addr):
+        """Queue several datagrams (e.g. the fragments of one frame) for one destination"""
+        if not self.gather and any(type(p) is tuple for p in packets):
+            self.gather = True
+        self.packets.extend(packets)
+        self.destinations.extend(repeat(addr, len(packets)))
+    
+    def flush(self):
+        """Send every queued datagram; returns the number sent"""
+        if not self.packets:
+            return 0
+        
+        packets, destinations, gather = self.packets, self.destinations, self.gather
+        self.packets, self.destinations, self.gather = [], [], False
+        
+        if self.useSendmmsg:
+            sent = 0
+            for start in range(0, len(packets), self.maxBatch):
+                sent += self._sendBatch(packets[start:start + self.maxBatch],
+                                        destinations[start:start + self.maxBatch], gather)
+        else:
+            sent = self._sendLoop(packets, destinations)
+        
+        self.packetsSent += sent
+        self.packetsDropped += len(packets) - sent
+        return sent
+    
+    def _sendLoop(self, packets, destinations):
+        """Portable path: one system call per datagram"""
+        sent = 0
+        for packet, addr in zip(packets, destinations):
+            try:
+                if type(packet) is tuple:
+                    self.socket.sendmsg(packet, (), 0, addr)
+                else:
+                    self.socket.sendto(packet, addr)
+                sent += 1
+            except BlockingIOError:
+                pass  # Send buffer full: drop, as UDP would
+            finally:
+                self.syscalls += 1
+        return sent
+    
+    def _sendBatch(self, packets, destinations, gather):
+        """Linux path: send up to maxBatch datagrams with sendmmsg()"""
+        # One iovec per part, pointing at the part's own memory (the session's
+        # header buffer and the frame's mapping), so no datagram is copied
+        if gather:
+            parts = list(chain.from_iterable(p if type(p) is tuple else (p,) for p in packets))
+            iovCounts = [len(p) if type(p) is tuple else 1 for p in packets]
+        else:
+            parts = packets
+            iovCounts = repeat(1)
+        pinned, held = [], []
+        try:
+            addresses = [_bufferAddress(part, pinned, held) for part in parts]
+            return self._sendMessages(parts, addresses, destinations, iovCounts, gather)
+        finally:
+            _releaseBuffers(held)
+    
+    def _sendMessages(self, parts, addresses, destinations, iovCounts, gather):
+        """Build the iovec and mmsghdr arrays for addressed parts and send them"""
+        count = len(destinations)
+        iovecs = bytearray(_IOVEC.size * len(parts))
+        messages = bytearray(_MMSGHDR.size * count)
+        iovBase = _address(iovecs)
+        msgBase = _address(messages)
+        
+        struct.pack_into('=' + _IOVEC.format[1:] * len(parts), iovecs, 0,
+                         *chain.from_iterable(zip(addresses, map(len, parts))))
+        if gather:
+            iovAddresses = accumulate((n * _IOVEC.size for n in iovCounts), initial=iovBase)
+        else:
+            iovAddresses = range(iovBase, iovBase + len(iovecs), _IOVEC.size)
+        struct.pack_into('=' + _MMSGHDR.format[1:] * count, messages, 0,
+                         *chain.from_iterable(zip(self._sockaddrs(destinations), repeat(16),
+                                                  iovAddresses, iovCounts,
+                                                  repeat(0), repeat(0), repeat(0), repeat(0))))
+        
+        # sendmmsg may send fewer messages than asked; resend the rest
+        done = 0
+        while done < count:
+            self.syscalls += 1
+            result = _sendmmsg(self.socket.fileno(), msgBase + done * _MMSGHDR.size, count - done, 0)
+            if result < 0:
+                err = ctypes.get_errno()
+                if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    break  # Send buffer full: drop the rest, as UDP would
+                raise OSError(err, f'sendmmsg failed: {errno.errorcode.get(err, err)}')
+            done += result
+        return done
+    
+    def _sockaddrs(self, destinations):
+        """Return addresses of cached struct sockaddr_in buffers, one per destination"""
+        missing = set(destinations).difference(self.addresses)
+        if missing:
+            if len(self.addresses) + len(missing) > 4096:
+                self.addresses.clear()
+                missing = set(destinations)
+            for addr in missing:
+                name = ctypes.create_string_buffer(_sockaddr(addr), 16)
+                self.addresses[addr] = (name, ctypes.addressof(name))
+        addresses = self.addresses
+        return [addresses[addr][1] for addr in destinations]
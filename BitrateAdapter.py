@@ -0,0 +1,80 @@
+"""
+Bitrate Adapter
+Chooses which rendition of a ladder a session sends, from the receiver
+reports its client returns. Loss steps down one rendition at a time; a run
+of clean reports steps back up. The report after a switch is ignored, since
+it still covers packets of the previous rendition.
+"""
+
+import config
+
+
+class BitrateAdapter:
+    """Rendition choice of one session, driven by RTCP receiver reports"""
+    
+    def __init__(self, renditions, start=None):
+        """
+        Initialize adapter
+        
+        Args:
+            renditions: Rendition entries from the ladder manifest, highest first
+            start: Index of the first rendition sent (defaults to config.ABR_START_RENDITION)
+        """
+        self.renditions = renditions
+        start = config.ABR_START_RENDITION if start is None else start
+        self.current = self.target = max(0, min(start, len(renditions) - 1))
+        self.cleanReports = 0
+        self.lastHighestSeq = None
+        self.holdReports = 0
+        self.switches = 0
+    
+    def name(self, index=None):
+        """Return the name of a rendition (the current one by default)"""
+        return self.renditions[self.current if index is None else index]['name']
+    
+    def resume(self):
+        """
+        Forget the highest sequence number seen before a PAUSE
+        
+        The first report after PLAY can go out before any new packet
+        arrives; compared with the last report before the pause, it would
+        look stalled.
+        """
+        self.lastHighestSeq = None
+    
+    def update(self, report):
+        """
+        Take one receiver report into account
+        
+        Args:
+            report: Rtcp.ReceiverReport from the session's client
+        
+        Returns:
+            True if the target rendition changed
+        """
+        # No new packets since the last report: the stream is stalled, as bad as full loss
+        stalled = report.highestSeq == self.lastHighestSeq
+        self.lastHighestSeq = report.highestSeq
+        
+        if self.target != self.current:
+            return False  # Switch not made yet
+        if self.holdReports:
+            self.holdReports -= 1
+            return False
+        
+        if stalled or report.fractionLost >= config.ABR_LOSS_DOWN:
+            self.cleanReports = 0
+            if self.target < len(self.renditions) - 1:
+                self.target += 1
+                self.holdReports = 1
+                return True
+        elif report.fractionLost <= config.ABR_LOSS_UP:
+            self.cleanReports += 1
+            if self.cleanReports >= config.ABR_UP_REPORTS and self.target > 0:
+                self.cleanReports = 0
+                self.target -= 1
+                self.holdReports = 1
+                return True
+        else:
+            self.cleanReports = 0
+        return False
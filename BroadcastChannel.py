@@ -0,0 +1,266 @@
+"""
+Broadcast Channel
+One shared playhead per video file (and start position) that reads and
+packetizes each frame once for every session attached to it. Live channels
+send the same packets to each viewer's unicast port; multicast channels send
+them once to a group that every viewer joins.
+"""
+
+import socket
+import threading
+import ipaddress
+
+from RtpPacket import RtpEncoder
+from FrameStore import FrameStore
+from FramePacer import FramePacer
+from BatchSender import BatchSender
+import config
+
+
+def configureMulticast(sock):
+    """Set the multicast TTL, loopback and egress interface of a sending socket"""
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, config.MULTICAST_TTL)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                    socket.inet_aton(config.MULTICAST_INTERFACE))
+
+
+class BroadcastChannel:
+    """Shared RTP sender for all sessions of one file and start position
+    
+    Sessions hold a reference from SETUP until TEARDOWN and are players while
+    in PLAYING. The channel streams while it has at least one player; a
+    session that joins late picks the stream up at the current frame.
+    """
+    
+    _channels = {}   # (filename, startFrame, multicast) -> channel
+    _slots = set()   # Multicast group slots in use
+    _lock = threading.Lock()
+    
+    def __init__(self, stream, startFrame, slot=None):
+        """
+        Initialize channel
+        
+        Args:
+            stream: Video stream the channel owns
+            startFrame: Zero-based frame the channel starts at
+            slot: Index of the channel's multicast group and port in the
+                  configured range, or None for a live unicast channel
+        """
+        self.stream = stream
+        self.filename = stream.filename
+        self.startFrame = startFrame
+        self.slot = slot
+        self.multicast = slot is not None
+        if self.multicast:
+            self.group = str(ipaddress.IPv4Address(config.MULTICAST_GROUP) + slot)
+            self.port = config.MULTICAST_PORT + 2 * slot  # RTP port; RTCP would use port + 1
+            self.name = f'{self.filename}@{startFrame} -> {self.group}:{self.port}'
+            self.destinations = [(self.group, self.port)]
+        else:
+            self.group = self.port = None
+            self.name = f'{self.filename}@{startFrame} (live)'
+            self.destinations = []  # Players' unicast RTP addresses
+        self.refCount = 0
+        self.players = set()
+        self.playLock = threading.Lock()
+        
+        self.encoder = RtpEncoder()
+        self.mediaFrame = 0  # Frames sent or skipped; sets the RTP timestamps
+        self.pacer = FramePacer()
+        self.rtpSocket = self.openRtpSocket()
+        self.sender = self.openRtpSender(self.rtpSocket)
+        self.event = None
+        self.worker = None
+        
+        stream.seekFrame(startFrame)
+    
+    @classmethod
+    def acquire(cls, filename, startFrame=0, multicast=False, **options):
+        """
+        Return the channel for a file and start position, creating it on first use
+        
+        Args:
+            filename: Video file name from the SETUP request
+            startFrame: Zero-based start frame (clamped to the video)
+            multicast: Send to a multicast group instead of each player
+            options: Extra constructor arguments for a new channel
+        
+        Raises:
+            IOError: If the video file cannot be opened
+            RuntimeError: If every multicast group is already in use
+        """
+        stream = FrameStore.open(filename)
+        startFrame = min(max(0, startFrame), max(0, stream.frameCount() - 1))
+        key = (filename, startFrame, multicast)
+        
+        with cls._lock:
+            channel = cls._channels.get(key)
+            if channel is None:
+                slot = None
+                if multicast:
+                    free = [slot for slot in range(config.MULTICAST_GROUPS) if slot not in cls._slots]
+                    if not free:
+                        stream.close()
+                        raise RuntimeError('No free multicast group')
+                    slot = free[0]
+                channel = cls(stream, startFrame, slot, **options)
+                cls._channels[key] = channel
+                if multicast:
+                    cls._slots.add(slot)
+                print(f'[CHANNEL] Opened {channel.name}')
+            else:
+                stream.close()
+            channel.refCount += 1
+            return channel
+    
+    @classmethod
+    def release(cls, channel):
+        """Drop one session's reference; the channel closes when nobody uses it"""
+        key = (channel.filename, channel.startFrame, channel.multicast)
+        with cls._lock:
+            channel.refCount -= 1
+            if channel.refCount > 0:
+                return
+            if cls._channels.get(key) is channel:
+                del cls._channels[key]
+            cls._slots.discard(channel.slot)
+        channel.close()
+    
+    def transport(self):
+        """Return the Transport header value announced in the SETUP reply, if any"""
+        if not self.multicast:
+            return None
+        return (f'RTP/UDP;multicast;destination={self.group};'
+                f'port={self.port}-{self.port + 1};ttl={config.MULTICAST_TTL}')
+    
+    def join(self, session):
+        """Add a playing session, starting the stream for the first one"""
+        with self.playLock:
+            if session in self.players:
+                return
+            self.players.add(session)
+            self.updateDestinations()
+            if len(self.players) == 1:
+                self.startStreaming()
+        print(f'[CHANNEL] {self.name}: {len(self.players)} viewer(s)')
+    
+    def leave(self, session):
+        """Remove a session, stopping the stream when nobody is playing"""
+        with self.playLock:
+            if session not in self.players:
+                return
+            self.players.discard(session)
+            self.updateDestinations()
+            if not self.players:
+                self.stopStreaming()
+        print(f'[CHANNEL] {self.name}: {len(self.players)} viewer(s)')
+    
+    def updateDestinations(self):
+        """Rebuild the list of players' RTP addresses (live channels)"""
+        if not self.multicast:
+            # Replaced rather than mutated, so a sending thread never sees it change
+            self.destinations = [(player.clientInfo['addr'][0], player.clientInfo['rtpPort'])
+                                 for player in self.players]
+    
+    def openRtpSocket(self):
+        """Create the UDP socket the channel sends from"""
+        rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.multicast:
+            configureMulticast(rtpSocket)
+        return rtpSocket
+    
+    def openRtpSender(self, rtpSocket):
+        """Create the batch sender that sends each frame's packets together"""
+        return BatchSender(rtpSocket)
+    
+    def startStreaming(self):
+        """Start a thread that sends video frames"""
+        self.pacer.restart()
+        self.event = threading.Event()
+        self.worker = threading.Thread(target=self.sendRtp, daemon=True)
+        self.worker.start()
+    
+    def stopStreaming(self):
+        """Stop the sending thread and wait for it to finish"""
+        self.event.set()
+        if self.worker is not threading.current_thread():
+            self.worker.join()
+    
+    def sendRtp(self):
+        """Send video frames on the pacer's deadlines"""
+        print(f'[CHANNEL] Starting stream {self.name}')
+        
+        while True:
+            skip = self.pacer.wait(self.event)
+            if skip is None:
+                break
+            
+            if skip:
+                self.skipFrames(skip)
+            self.sendFrame()
+        
+        self.pacer.pause()
+        print(f'[CHANNEL] Stopped stream {self.name}. Pacing: {self.pacer.summary()}')
+    
+    def queuePacedFrame(self):
+        """Queue the frames due now, applying the pacing policy (CATCHUP may queue several)"""
+        while True:
+            skip = self.pacer.frameDue()
+            if skip:
+                self.skipFrames(skip)
+            if not self.pacer.overdue():
+                break
+            # Packet headers live in the encoder's buffer until its next frame,
+            # so each frame of a burst is sent before the next is packetized
+            self.sendFrame()
+        self.queueFrame()
+    
+    def sendFrame(self):
+        """Send the next frame to every destination"""
+        self.queueFrame()
+        try:
+            self.sender.flush()
+        except Exception as e:
+            print(f'[CHANNEL] Error sending frame: {e}')
+    
+    def skipFrames(self, count):
+        """Advance the playhead past frames that are already overdue"""
+        self.mediaFrame += count
+        self.stream.seekFrame((self.stream.frameNbr() + count) % max(1, self.stream.frameCount()))
+    
+    def queueFrame(self):
+        """Read and packetize the next frame once and queue it for every destination"""
+        data = self.stream.nextFrame()
+        
+        if data:
+            try:
+                fragments = self.stream.fragments(self.stream.frameNbr() - 1)
+                timestamp = self.encoder.frameTimestamp(self.mediaFrame)
+                self.mediaFrame += 1
+                if fragments is not None:
+                    packets = self.encoder.encodeFragments(fragments, timestamp)
+                else:
+                    packets = self.encoder.encodeFrame(data, timestamp)
+                for destination in self.destinations:
+                    self.sender.addMany(packets, destination)
+            except Exception as e:
+                print(f'[CHANNEL] Error sending frame: {e}')
+        else:
+            # End of video, loop the playhead; the empty tick still passes media time
+            self.stream.reset()
+            self.mediaFrame += 1
+    
+    def close(self):
+        """Stop streaming and release the video and socket"""
+        with self.playLock:
+            if self.players:
+                self.players.clear()
+                self.stopStreaming()
+        self.closeRtpSocket(self.rtpSocket)
+        self.stream.close()
+        print(f'[CHANNEL] Closed {self.name}')
+    
+    def closeRtpSocket(self, rtpSocket):
+        """Close the channel's UDP socket"""
+        rtpSocket.close()
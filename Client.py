@@ -11,8 +11,13 @@ from tkinter import messagebox, ttk
 from PIL import Image, ImageTk
 import io
 import time
+import queue
+from random import getrandbits
+from concurrent.futures import ThreadPoolExecutor
 
 from RtpPacket import RtpPacket
+from JitterBuffer import JitterBuffer
+from Rtcp import ReceptionStats, SenderReport, packReceiverReport, parseRtcp
 import config
 
 
@@ -30,8 +35,16 @@ class Client:
     PAUSE = 'PAUSE'
     TEARDOWN = 'TEARDOWN'
     
-    def __init__(self, master, serveraddr, serverport, rtpport, filename):
-        """Initialize client with GUI"""
+    # DISPLAY_RESAMPLE names, fastest last
+    RESAMPLE_FILTERS = {
+        'lanczos': Image.Resampling.LANCZOS,
+        'bicubic': Image.Resampling.BICUBIC,
+        'bilinear': Image.Resampling.BILINEAR,
+        'nearest': Image.Resampling.NEAREST
+    }
+    
+    def __init__(self, master, serveraddr, serverport, rtpport, filename, multicast=False):
+        """Initialize client with GUI (multicast: join the server's shared stream)"""
         self.master = master
         self.master.protocol("WM_DELETE_WINDOW", self.handler)
         self.master.title("Video Streaming - YouTube Style")
@@ -47,6 +60,7 @@ class Client:
         self.serverPort = int(serverport)
         self.rtpPort = int(rtpport)
         self.fileName = filename
+        self.multicast = multicast
         self.rtspSeq = 0
         self.sessionId = 0
         self.requestSent = -1
@@ -55,6 +69,26 @@ class Client:
         self.frameNbr = 0
         self.rtpSocket = None
         self.rtspSocket = None
+        self.jitterBuffer = JitterBuffer()
+        self.rtpThread = None
+        self.playoutThread = None
+        
+        # Decode pipeline: playout thread -> decoder pool -> display queue -> Tk mainloop
+        self.displaySize = (640, 480)
+        self.resample = self.RESAMPLE_FILTERS.get(config.DISPLAY_RESAMPLE, Image.Resampling.BILINEAR)
+        self.decoder = ThreadPoolExecutor(max_workers=config.DECODE_WORKERS, thread_name_prefix='decode')
+        self.decodeLock = threading.Lock()
+        self.decodePending = 0
+        self.decodeSeq = 0
+        self.shownSeq = 0
+        self.framesStale = 0
+        self.displayQueue = queue.Queue(maxsize=config.DISPLAY_QUEUE_SIZE)
+        
+        # RTCP return channel (receiver reports), if the server announces one
+        self.rtcpSocket = None
+        self.rtcpAddr = None
+        self.ssrc = getrandbits(32)
+        self.receptionStats = ReceptionStats()
         
         # Statistics
         self.totalBytes = 0
@@ -65,6 +99,9 @@ class Client:
         # Create GUI
         self.createWidgets()
         
+        # Decoded frames are shown from the Tk mainloop
+        self.master.after(config.DISPLAY_POLL_MS, self.drainFrames)
+        
     def createWidgets(self):
         """Create all GUI widgets"""
         # Set background color
@@ -183,6 +220,18 @@ class Client:
                              font=('Helvetica', 9), 
                              fg='#aaaaaa', bg='#212121')
         self.fpsLabel.grid(row=0, column=3, padx=20)
+        
+        self.qosLabel = Label(infoContainer, 
+                             text="Loss: 0.0% | Jitter: 0.0 ms", 
+                             font=('Helvetica', 9), 
+                             fg='#aaaaaa', bg='#212121')
+        self.qosLabel.grid(row=0, column=4, padx=20)
+        
+        self.bufferLabel = Label(infoContainer, 
+                                text="Buffer: 0 | Underruns: 0 | Late: 0 | Stale: 0", 
+                                font=('Helvetica', 9), 
+                                fg='#aaaaaa', bg='#212121')
+        self.bufferLabel.grid(row=0, column=5, padx=20)
     
     def showPlaceholder(self):
         """Show placeholder when no video is playing"""
@@ -220,8 +269,13 @@ class Client:
     def playMovie(self):
         """Send PLAY request"""
         if self.state == self.READY:
-            # Create RTP socket
-            threading.Thread(target=self.listenRtp, daemon=True).start()
+            # Start receiving and playout (once; they idle while paused)
+            self.jitterBuffer.reset()
+            if self.rtpThread is None:
+                self.rtpThread = threading.Thread(target=self.listenRtp, daemon=True)
+                self.rtpThread.start()
+                self.playoutThread = threading.Thread(target=self.playout, daemon=True)
+                self.playoutThread.start()
             self.sendRtspRequest(self.PLAY)
             self.startTime = time.time()
             self.updateStatus("Playing...")
@@ -235,29 +289,137 @@ class Client:
                     if data:
                         rtpPacket = RtpPacket()
                         rtpPacket.decode(data)
+                        self.totalBytes += len(data)
+                        self.receptionStats.update(rtpPacket.seqNum(), rtpPacket.timestamp(),
+                                                   rtpPacket.ssrc(), len(rtpPacket.getPayload()))
                         
-                        currFrameNbr = rtpPacket.seqNum()
-                        
-                        if currFrameNbr > self.frameNbr:
-                            self.frameNbr = currFrameNbr
-                            self.updateMovie(rtpPacket.getPayload())
-                            self.updateStatistics(len(data))
+                        # Hold the packet until its frame is due for playout
+                        self.jitterBuffer.push(rtpPacket)
                 else:
                     time.sleep(0.1)
             except:
                 if self.teardownAcked == 1:
                     break
     
-    def updateMovie(self, imageData):
-        """Update the video display"""
+    def playout(self):
+        """Show frames as the jitter buffer releases them on the media clock"""
+        while self.teardownAcked == 0:
+            if self.state != self.PLAYING:
+                time.sleep(0.1)
+                continue
+            
+            for frame in self.jitterBuffer.pop():
+                self.submitFrame(frame)
+            
+            # Sleep until the next frame is due, checking back for new arrivals
+            due = self.jitterBuffer.nextPlayoutTime()
+            delay = config.PLAYOUT_POLL_INTERVAL
+            if due is not None:
+                delay = min(delay, max(0.0, due - time.monotonic()))
+            time.sleep(delay)
+    
+    def runRtcp(self):
+        """Take in the server's sender reports and send a receiver report every RTCP_INTERVAL while playing"""
+        self.rtcpSocket.settimeout(config.RTCP_INTERVAL)
+        nextReport = time.time() + config.RTCP_INTERVAL
+        while self.teardownAcked == 0:
+            try:
+                data, addr = self.rtcpSocket.recvfrom(config.MAX_PACKET_SIZE)
+                for report in parseRtcp(data):
+                    if isinstance(report, SenderReport):
+                        self.receptionStats.senderReport(report)
+            except socket.timeout:
+                pass
+            except OSError:
+                break
+            
+            if time.time() < nextReport:
+                continue
+            nextReport += config.RTCP_INTERVAL
+            if self.state != self.PLAYING:
+                continue
+            
+            report = self.receptionStats.report(self.ssrc)
+            if report is None:
+                continue
+            try:
+                self.rtcpSocket.sendto(packReceiverReport(report), self.rtcpAddr)
+            except OSError as e:
+                print(f"Error sending receiver report: {e}")
+                break
+    
+    def submitFrame(self, imageData):
+        """Hand a frame to the decoder pool, dropping it if the decoders are behind"""
+        with self.decodeLock:
+            if self.decodePending >= config.DECODE_WORKERS * 2:
+                self.framesStale += 1
+                return
+            self.decodePending += 1
+            self.decodeSeq += 1
+            seq = self.decodeSeq
+        self.decoder.submit(self.decodeFrame, seq, imageData)
+    
+    def decodeFrame(self, seq, imageData):
+        """Decode and resize one frame on a decoder thread, queueing it for display"""
         try:
             image = Image.open(io.BytesIO(imageData))
             
+            # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding
+            if config.JPEG_DRAFT:
+                image.draft('RGB', self.displaySize)
+            
             # Resize to fit display
-            display_width = 640
-            display_height = 480
-            image = image.resize((display_width, display_height), Image.Resampling.LANCZOS)
+            image = image.resize(self.displaySize, self.resample)
+        except Exception as e:
+            print(f"Error decoding frame: {e}")
+            return
+        finally:
+            with self.decodeLock:
+                self.decodePending -= 1
+        
+        # Bounded queue: make room by discarding the oldest decoded frame
+        while True:
+            try:
+                self.displayQueue.put_nowait((seq, image))
+                return
+            except queue.Full:
+                try:
+                    self.displayQueue.get_nowait()
+                    self.framesStale += 1
+                except queue.Empty:
+                    pass
+    
+    def drainFrames(self):
+        """Show the newest decoded frame (Tk mainloop, rescheduled with after())"""
+        newest = None
+        while True:
+            try:
+                seq, image = self.displayQueue.get_nowait()
+            except queue.Empty:
+                break
             
+            # Decoders finish out of order; anything older than what is shown is stale
+            if seq <= self.shownSeq or (newest is not None and seq < newest[0]):
+                self.framesStale += 1
+                continue
+            if newest is not None:
+                self.framesStale += 1
+            newest = (seq, image)
+        
+        if newest is not None:
+            self.shownSeq = newest[0]
+            self.frameNbr += 1
+            self.updateMovie(newest[1])
+            self.updateStatistics()
+        
+        try:
+            self.master.after(config.DISPLAY_POLL_MS, self.drainFrames)
+        except TclError:
+            pass  # Window closed
+    
+    def updateMovie(self, image):
+        """Update the video display with a decoded frame (Tk mainloop only)"""
+        try:
             photo = ImageTk.PhotoImage(image)
             self.label.configure(image=photo)
             self.label.image = photo
@@ -268,9 +430,8 @@ class Client:
         except Exception as e:
             print(f"Error updating frame: {e}")
     
-    def updateStatistics(self, packetSize):
-        """Update streaming statistics"""
-        self.totalBytes += packetSize
+    def updateStatistics(self):
+        """Update streaming statistics after a complete frame"""
         self.totalFrames += 1
         
         currentTime = time.time()
@@ -285,6 +446,15 @@ class Client:
             fps = self.totalFrames / elapsedTime
             self.fpsLabel.config(text=f"FPS: {fps:.1f}")
         
+        # Reception quality, as reported to the server
+        stats = self.receptionStats
+        lossPercent = 100 * max(0, stats.lost()) / stats.expected() if stats.expected() else 0
+        self.qosLabel.config(text=f"Loss: {lossPercent:.1f}% | Jitter: {stats.jitterSeconds() * 1000:.1f} ms")
+        
+        buffer = self.jitterBuffer
+        self.bufferLabel.config(text=f"Buffer: {len(buffer)} | Underruns: {buffer.underruns} | "
+                                     f"Late: {buffer.latePackets} | Stale: {self.framesStale}")
+        
         self.lastFrameTime = currentTime
     
     def updateStatus(self, message):
@@ -313,11 +483,17 @@ class Client:
         request = f"{requestCode} {self.fileName} {config.RTSP_VER}\n"
         request += f"CSeq: {self.rtspSeq}\n"
         
-        if requestCode == self.SETUP:
+        if requestCode == self.SETUP and self.multicast:
+            # The server picks the group; the socket is opened from its reply
+            request += "Transport: RTP/UDP;multicast\n"
+        elif requestCode == self.SETUP:
             # Create RTP socket for receiving
             self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.rtpSocket.settimeout(0.5)
             
+            # Large receive buffer so bursts of fragments from one HD frame fit
+            self.rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, config.RTP_RECV_BUFFER)
+            
             # Bind to RTP port
             try:
                 self.rtpSocket.bind(('', self.rtpPort))
@@ -326,7 +502,15 @@ class Client:
                                    f"Unable to bind to port {self.rtpPort}")
                 return
             
-            request += f"Transport: RTP/UDP; client_port= {self.rtpPort}\n"
+            # Receiver reports go out from the next port up
+            self.rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                self.rtcpSocket.bind(('', self.rtpPort + 1))
+            except OSError:
+                self.rtcpSocket.close()
+                self.rtcpSocket = None
+            
+            request += f"Transport: RTP/UDP; client_port= {self.rtpPort}-{self.rtpPort + 1}\n"
         else:
             request += f"Session: {self.sessionId}\n"
         
@@ -369,6 +553,21 @@ class Client:
                             self.sessionId = int(lines[2].split(' ')[1])
                             self.state = self.READY
                             
+                            # Join the multicast group from the Transport header
+                            if self.multicast:
+                                for line in lines:
+                                    if line.startswith('Transport:'):
+                                        fields = dict(part.split('=', 1) for part in line.split(';') if '=' in part)
+                                        self.openMulticastSocket(fields['destination'],
+                                                                 int(fields['port'].split('-')[0]))
+                            
+                            # Start receiver reports if the server takes them
+                            for line in lines:
+                                if line.startswith('Transport:') and 'rtcp_port=' in line and self.rtcpSocket:
+                                    rtcpPort = int(line.split('rtcp_port=')[1].split(';')[0])
+                                    self.rtcpAddr = (self.serverAddr, rtcpPort)
+                                    threading.Thread(target=self.runRtcp, daemon=True).start()
+                            
                             # Enable buttons
                             self.start.config(state=NORMAL)
                             self.teardown.config(state=NORMAL)
@@ -395,15 +594,43 @@ class Client:
         except Exception as e:
             print(f"Error receiving reply: {e}")
     
+    def openMulticastSocket(self, group, port):
+        """Open the RTP socket and join the multicast group announced by the server"""
+        self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rtpSocket.settimeout(0.5)
+        self.rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, config.RTP_RECV_BUFFER)
+        
+        # Several viewers on one host share the group's port
+        self.rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        
+        try:
+            # Binding the group address keeps other groups out (Linux)
+            self.rtpSocket.bind((group, port))
+        except OSError:
+            # Windows cannot bind a multicast address
+            self.rtpSocket.bind(('', port))
+        
+        # Join on the interface that reaches the server, so loopback works too
+        interface = self.rtspSocket.getsockname()[0]
+        try:
+            self.rtpSocket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                                      socket.inet_aton(group) + socket.inet_aton(interface))
+            print(f"Joined multicast group {group}:{port}")
+        except OSError as e:
+            messagebox.showerror("Socket Error", f"Unable to join multicast group {group}:\n{e}")
+    
     def handler(self):
         """Handle window close event"""
         if self.state != self.INIT:
             self.sendRtspRequest(self.TEARDOWN)
             if self.rtpSocket:
                 self.rtpSocket.close()
+            if self.rtcpSocket:
+                self.rtcpSocket.close()
             if self.rtspSocket:
                 self.rtspSocket.close()
         
+        self.decoder.shutdown(wait=False)
         self.master.destroy()
 
 
@@ -416,19 +643,21 @@ def main():
         rtpPort = config.RTP_PORT
         fileName = config.VIDEO_FILE
         
-        # Allow command line arguments
-        if len(sys.argv) > 1:
-            serverAddr = sys.argv[1]
-        if len(sys.argv) > 2:
-            serverPort = sys.argv[2]
-        if len(sys.argv) > 3:
-            rtpPort = sys.argv[3]
-        if len(sys.argv) > 4:
-            fileName = sys.argv[4]
+        # Allow command line arguments (--multicast joins the shared stream)
+        multicast = '--multicast' in sys.argv
+        args = [arg for arg in sys.argv if arg != '--multicast']
+        if len(args) > 1:
+            serverAddr = args[1]
+        if len(args) > 2:
+            serverPort = args[2]
+        if len(args) > 3:
+            rtpPort = args[3]
+        if len(args) > 4:
+            fileName = args[4]
         
         # Create GUI
         root = Tk()
-        app = Client(root, serverAddr, serverPort, rtpPort, fileName)
+        app = Client(root, serverAddr, serverPort, rtpPort, fileName, multicast)
         root.mainloop()
         
     except Exception as e:
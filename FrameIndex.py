@@ -0,0 +1,166 @@
+"""
+Frame Index
+Records the byte offset and length of every frame in an MJPEG file so that
+any frame can be reached without scanning the file from the start. Legacy
+files get a sidecar index; containers carry their own.
+"""
+
+import os
+import sys
+import struct
+from array import array
+
+import MjpegContainer
+import config
+
+LENGTH_PREFIX_SIZE = 5  # ASCII frame length written before each frame (legacy format)
+
+INDEX_MAGIC = b'MJIX'
+INDEX_VERSION = 1
+
+# Sidecar header: magic, version, source size, source mtime (ns), frame count
+INDEX_HEADER = struct.Struct('<4sHQqI')
+
+
+def indexPath(filename):
+    """Return the sidecar index path for a video file"""
+    return filename + config.INDEX_SUFFIX
+
+
+class FrameIndex:
+    """Compact table of frame offsets and lengths for one video file"""
+    
+    def __init__(self, offsets=None, lengths=None, crcs=None, info=None):
+        """Initialize index from offset and length arrays (plus CRCs and metadata for containers)"""
+        self.offsets = offsets if offsets is not None else array('Q')
+        self.lengths = lengths if lengths is not None else array('I')
+        self.crcs = crcs if crcs is not None else array('I')
+        self.info = info  # MjpegContainer.ContainerInfo, None for legacy files
+    
+    def __len__(self):
+        """Return number of frames in the index"""
+        return len(self.offsets)
+    
+    def frame(self, frameNumber):
+        """Return (offset, length) of a zero-based frame number"""
+        return self.offsets[frameNumber], self.lengths[frameNumber]
+    
+    @classmethod
+    def build(cls, filename):
+        """
+        Scan a video file once and record where every frame starts
+        
+        Args:
+            filename: Path to the MJPEG file
+        """
+        index = cls()
+        fileSize = os.path.getsize(filename)
+        
+        with open(filename, 'rb') as f:
+            position = 0
+            while position + LENGTH_PREFIX_SIZE <= fileSize:
+                data = f.read(LENGTH_PREFIX_SIZE)
+                try:
+                    framelength = int(data)
+                except ValueError:
+                    break
+                
+                position += LENGTH_PREFIX_SIZE
+                if position + framelength > fileSize:
+                    break  # Truncated last frame
+                
+                index.offsets.append(position)
+                index.lengths.append(framelength)
+                
+                # Skip over the frame data without reading it
+                position += framelength
+                f.seek(position)
+        
+        return index
+    
+    @classmethod
+    def load(cls, filename):
+        """
+        Load the sidecar index of a video file
+        
+        Returns None if the sidecar is missing, unreadable or older than the
+        video file it describes.
+        """
+        path = indexPath(filename)
+        try:
+            stat = os.stat(filename)
+            with open(path, 'rb') as f:
+                header = f.read(INDEX_HEADER.size)
+                magic, version, size, mtime, count = INDEX_HEADER.unpack(header)
+                if (magic != INDEX_MAGIC or version != INDEX_VERSION or
+                        size != stat.st_size or mtime != stat.st_mtime_ns):
+                    return None
+                
+                index = cls()
+                index.offsets.fromfile(f, count)
+                index.lengths.fromfile(f, count)
+        except (OSError, EOFError, struct.error):
+            return None
+        
+        if sys.byteorder != 'little':
+            index.offsets.byteswap()
+            index.lengths.byteswap()
+        return index
+    
+    def save(self, filename):
+        """Write the index as a sidecar file next to the video file"""
+        stat = os.stat(filename)
+        offsets, lengths = self.offsets, self.lengths
+        if sys.byteorder != 'little':
+            offsets, lengths = array('Q', offsets), array('I', lengths)
+            offsets.byteswap()
+            lengths.byteswap()
+        
+        # Write to a temporary file first so readers never see a partial index
+        path = indexPath(filename)
+        tmpPath = f'{path}.{os.getpid()}.tmp'
+        with open(tmpPath, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, stat.st_size,
+                                      stat.st_mtime_ns, len(self)))
+            offsets.tofile(f)
+            lengths.tofile(f)
+        os.replace(tmpPath, path)
+    
+    @classmethod
+    def forFile(cls, filename):
+        """Load the container's own index, or the sidecar index, building and saving it if needed"""
+        if MjpegContainer.isContainer(filename):
+            try:
+                info, offsets, lengths, crcs = MjpegContainer.readIndex(filename)
+            except ValueError as e:
+                raise IOError(f"Could not read video file {filename}: {e}")
+            return cls(offsets, lengths, crcs, info)
+        
+        index = cls.load(filename)
+        if index is None:
+            index = cls.build(filename)
+            try:
+                index.save(filename)
+            except OSError as e:
+                # Read-only media directories still work, just without the cache
+                print(f'[INDEX] Could not save index for {filename}: {e}')
+        return index
+
+
+def main():
+    """Build sidecar indexes for the given video files"""
+    if len(sys.argv) < 2:
+        print("Usage: python FrameIndex.py <video.Mjpeg> [...]")
+        return
+    
+    for filename in sys.argv[1:]:
+        if MjpegContainer.isContainer(filename):
+            print(f"{filename} is a container and carries its own index")
+            continue
+        index = FrameIndex.build(filename)
+        index.save(filename)
+        print(f"Indexed {filename}: {len(index)} frames -> {indexPath(filename)}")
+
+
+if __name__ == '__main__':
+    main()
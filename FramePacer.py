@@ -0,0 +1,152 @@
+"""
+Frame Pacer
+Absolute-deadline frame clock for RTP sessions. Frame n is due at
+start + n / FRAME_RATE, so time spent reading, encoding and sending a frame
+never accumulates into drift.
+"""
+
+import time
+
+import config
+
+SKIP = 'skip'        # Jump ahead in the video to the frame that is due now
+CATCHUP = 'catchup'  # Send late frames back-to-back until back on schedule
+
+
+class FramePacer:
+    """Schedules frames on absolute deadlines and records lateness"""
+    
+    def __init__(self, frameRate=None, policy=None, maxCatchup=None, clock=time.monotonic):
+        """
+        Initialize pacer
+        
+        Args:
+            frameRate: Frames per second (defaults to config.FRAME_RATE)
+            policy: SKIP or CATCHUP (defaults to config.PACING_POLICY)
+            maxCatchup: Most frames CATCHUP sends in a burst before it gives up
+                        on the missed time (defaults to config.MAX_CATCHUP_FRAMES)
+            clock: Monotonic time source in seconds
+        """
+        self.interval = 1.0 / (frameRate or config.FRAME_RATE)
+        self.policy = policy or config.PACING_POLICY
+        self.maxCatchup = config.MAX_CATCHUP_FRAMES if maxCatchup is None else maxCatchup
+        self.clock = clock
+        
+        self.start = None
+        self.playStart = None
+        self.frameIndex = 0
+        
+        # Lateness statistics (kept across PAUSE/PLAY)
+        self.framesSent = 0
+        self.framesLate = 0
+        self.framesSkipped = 0
+        self.framesSlipped = 0
+        self.totalLateness = 0.0
+        self.maxLateness = 0.0
+        self.playTime = 0.0
+    
+    def restart(self, start=None):
+        """
+        Start a new schedule
+        
+        Args:
+            start: Clock time the first frame is due (defaults to now); a
+                   caller that fires on a tick grid passes its next tick
+        """
+        self.playStart = self.clock()
+        self.start = self.playStart if start is None else start
+        self.frameIndex = 0
+    
+    def pause(self):
+        """Stop the schedule, keeping statistics"""
+        if self.playStart is not None:
+            self.playTime += self.clock() - self.playStart
+            self.start = self.playStart = None
+    
+    def deadline(self):
+        """Return the absolute time the next frame is due"""
+        return self.start + self.frameIndex * self.interval
+    
+    def frameDue(self):
+        """
+        Account for sending the next frame now
+        
+        Returns:
+            Number of video frames to skip before sending (SKIP policy only)
+        """
+        lateness = self.clock() - self.deadline()
+        skip = 0
+        
+        if lateness > 0:
+            self.totalLateness += lateness
+            self.maxLateness = max(self.maxLateness, lateness)
+            if lateness > self.interval / 2:
+                self.framesLate += 1
+        
+        behind = int(lateness // self.interval) if lateness > 0 else 0
+        if behind > 0:
+            if self.policy == SKIP:
+                skip = behind
+                self.framesSkipped += behind
+                self.frameIndex += behind
+            elif behind > self.maxCatchup:
+                # Too far behind to catch up; move the schedule forward
+                slip = behind - self.maxCatchup
+                self.start += slip * self.interval
+                self.framesSlipped += slip
+        
+        self.frameIndex += 1
+        self.framesSent += 1
+        return skip
+    
+    def overdue(self):
+        """
+        Return True if CATCHUP has another frame due already
+        
+        For callers that are fired once per tick rather than waiting on
+        each deadline: they keep queueing frames while this holds.
+        """
+        return self.policy == CATCHUP and self.start is not None and self.clock() >= self.deadline()
+    
+    def wait(self, event):
+        """
+        Block until the next frame is due
+        
+        Args:
+            event: threading.Event that interrupts the wait when set
+        
+        Returns:
+            Frames to skip (see frameDue), or None if the event was set
+        """
+        delay = self.deadline() - self.clock()
+        if delay > 0:
+            if event.wait(delay):
+                return None
+        elif event.is_set():
+            return None
+        return self.frameDue()
+    
+    def stats(self):
+        """Return lateness statistics as a dictionary"""
+        elapsed = self.playTime
+        if self.playStart is not None:
+            elapsed += self.clock() - self.playStart
+        
+        return {
+            'policy': self.policy,
+            'framesSent': self.framesSent,
+            'framesLate': self.framesLate,
+            'framesSkipped': self.framesSkipped,
+            'framesSlipped': self.framesSlipped,
+            'meanLatenessMs': 1000 * self.totalLateness / self.framesSent if self.framesSent else 0.0,
+            'maxLatenessMs': 1000 * self.maxLateness,
+            'actualFps': self.framesSent / elapsed if elapsed > 0 else 0.0
+        }
+    
+    def summary(self):
+        """Return a one-line description of the statistics"""
+        s = self.stats()
+        return (f"sent {s['framesSent']} frames at {s['actualFps']:.2f} fps, "
+                f"late {s['framesLate']} (mean {s['meanLatenessMs']:.1f} ms, "
+                f"max {s['maxLatenessMs']:.1f} ms), skipped {s['framesSkipped']}, "
+                f"slipped {s['framesSlipped']} [{s['policy']}]")
@@ -0,0 +1,154 @@
+"""
+Shared Frame Store
+Memory-maps each MJPEG file once per process and hands out zero-copy frame
+slices to every streaming session that uses it
+"""
+
+import mmap
+import threading
+
+from FrameIndex import FrameIndex
+from PacketCache import PacketCache
+import config
+
+
+class MappedVideo:
+    """One memory-mapped video file shared by all sessions"""
+    
+    def __init__(self, filename):
+        """Map the file read-only and load its frame index"""
+        self.filename = filename
+        self.index = FrameIndex.forFile(filename)
+        self.refCount = 0
+        
+        try:
+            with open(filename, 'rb') as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # ValueError: empty files cannot be mapped
+            raise IOError(f"Could not map video file: {filename}")
+        
+        self.view = memoryview(self.map)
+        
+        # Pre-built RTP payloads, when enabled (None falls back to packetizing per send)
+        self.packets = PacketCache.forFile(filename) if config.PACKET_CACHE else None
+    
+    def frameCount(self):
+        """Return total number of frames"""
+        return len(self.index)
+    
+    def info(self):
+        """Return container metadata, or None for legacy files"""
+        return self.index.info
+    
+    def frame(self, frameNumber):
+        """Return a zero-based frame as a memoryview into the mapping"""
+        offset, length = self.index.frame(frameNumber)
+        return self.view[offset:offset + length]
+    
+    def fragments(self, frameNumber):
+        """Return the cached RTP payloads of a zero-based frame, or None without a packet cache"""
+        if self.packets is None:
+            return None
+        return self.packets.fragments(frameNumber)
+    
+    def close(self):
+        """Unmap the file"""
+        if self.packets is not None:
+            self.packets.close()
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # A session still holds a frame slice; the map is freed with it
+            pass
+
+
+class FrameStore:
+    """Process-wide registry of mapped videos, reference counted by session"""
+    
+    _videos = {}
+    _lock = threading.Lock()
+    
+    @classmethod
+    def acquire(cls, filename):
+        """Return the shared mapping for a file, mapping it on first use"""
+        with cls._lock:
+            video = cls._videos.get(filename)
+            if video is None:
+                video = MappedVideo(filename)
+                cls._videos[filename] = video
+            video.refCount += 1
+            return video
+    
+    @classmethod
+    def release(cls, video):
+        """Drop one reference; the file is unmapped when nobody uses it"""
+        with cls._lock:
+            video.refCount -= 1
+            if video.refCount > 0:
+                return
+            if cls._videos.get(video.filename) is video:
+                del cls._videos[video.filename]
+        video.close()
+    
+    @classmethod
+    def open(cls, filename):
+        """Open a per-session stream cursor over the shared mapping"""
+        return SharedVideoStream(cls.acquire(filename))
+
+
+class SharedVideoStream:
+    """Per-session read position over a shared mapped video
+    
+    Provides the same interface as VideoStream, but nextFrame returns a
+    memoryview slice of the shared mapping instead of a new bytes object.
+    """
+    
+    def __init__(self, video):
+        """Initialize cursor at the first frame"""
+        self.video = video
+        self.filename = video.filename
+        self.frameNum = 0
+        self.closed = False
+    
+    def nextFrame(self):
+        """Get the next frame as a zero-copy memoryview"""
+        if self.frameNum >= self.video.frameCount():
+            return None
+        
+        frame_data = self.video.frame(self.frameNum)
+        self.frameNum += 1
+        return frame_data
+    
+    def frameNbr(self):
+        """Return current frame number"""
+        return self.frameNum
+    
+    def frameCount(self):
+        """Return total number of frames in the video"""
+        return self.video.frameCount()
+    
+    def info(self):
+        """Return container metadata (fps, width, height, frame count), or None for legacy files"""
+        return self.video.info()
+    
+    def fragments(self, frameNumber):
+        """Return the cached RTP payloads of a zero-based frame, or None without a packet cache"""
+        return self.video.fragments(frameNumber)
+    
+    def seekFrame(self, frameNumber):
+        """Position the stream so nextFrame returns the given zero-based frame"""
+        if not 0 <= frameNumber <= self.video.frameCount():
+            raise ValueError(f"Frame {frameNumber} out of range (0-{self.video.frameCount()})")
+        self.frameNum = frameNumber
+    
+    def reset(self):
+        """Reset to beginning of file"""
+        self.seekFrame(0)
+    
+    def close(self):
+        """Release this session's reference to the shared mapping"""
+        if not self.closed:
+            self.closed = True
+            FrameStore.release(self.video)
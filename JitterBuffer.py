@@ -0,0 +1,214 @@
+"""
+Jitter Buffer
+Client-side playout buffer for RTP/JPEG. Packets are held by sequence
+number, so reordered fragments still make up their frame, and complete
+frames are released on the media clock a fixed delay after the stream's
+first frame arrived, which smooths out bursty arrival.
+"""
+
+import time
+import threading
+
+import config
+
+
+def seqDelta(a, b):
+    """Return the signed distance from 16-bit sequence number b to a"""
+    delta = (a - b) & 0xFFFF
+    return delta - 0x10000 if delta >= 0x8000 else delta
+
+
+def timestampDelta(a, b):
+    """Return the signed distance from 32-bit RTP timestamp b to a"""
+    delta = (a - b) & 0xFFFFFFFF
+    return delta - 0x100000000 if delta >= 0x80000000 else delta
+
+
+class JitterBuffer:
+    """Reorders RTP/JPEG packets and releases whole frames on the media clock
+    
+    Each frame's playout time is anchor + targetDelay + (timestamp - anchor
+    timestamp) / clock rate, where the anchor is the arrival of the first
+    frame after a (re)start. If a frame's playout time passes before all of
+    its fragments arrive, the frame is dropped. If the buffer runs dry
+    (underrun), it re-anchors so the next frame is buffered again.
+    """
+    
+    def __init__(self, targetDelay=None, clockRate=None, maxFrames=None, clock=time.monotonic):
+        """
+        Initialize buffer
+        
+        Args:
+            targetDelay: Seconds frames are held before playout
+                         (defaults to config.JITTER_BUFFER_DELAY)
+            clockRate: RTP timestamp units per second (defaults to config.RTP_CLOCK_RATE)
+            maxFrames: Most frames held; the oldest is dropped beyond it
+                       (defaults to config.JITTER_BUFFER_MAX_FRAMES)
+            clock: Monotonic time source in seconds
+        """
+        self.targetDelay = config.JITTER_BUFFER_DELAY if targetDelay is None else targetDelay
+        self.clockRate = clockRate or config.RTP_CLOCK_RATE
+        self.maxFrames = maxFrames or config.JITTER_BUFFER_MAX_FRAMES
+        self.clock = clock
+        self.lock = threading.Lock()  # Packets are pushed and frames popped from different threads
+        
+        self.frames = {}  # Extended timestamp -> {extended seq: packet}
+        self.highestSeq = None  # Extended sequence numbers (16-bit wraps unrolled)
+        self.highestTimestamp = None
+        self.lastReleased = None  # Extended timestamp of the last frame played (or dropped)
+        self.frameInterval = None  # Timestamp step between consecutive frames
+        self.anchorTime = None
+        self.anchorTimestamp = None
+        self.underrunPending = False
+        
+        # Counters
+        self.framesReleased = 0
+        self.framesDropped = 0  # Incomplete when their playout time came
+        self.latePackets = 0  # Arrived after their frame was played or dropped
+        self.duplicates = 0
+        self.malformed = 0  # Too short to be RTP/JPEG
+        self.underruns = 0
+    
+    def reset(self):
+        """Drop buffered frames and restart buffering (after PAUSE); counters are kept"""
+        with self.lock:
+            self.frames.clear()
+            self.anchorTime = None
+            self.underrunPending = False
+    
+    def __len__(self):
+        """Return number of frames (complete or not) being held"""
+        return len(self.frames)
+    
+    def extend(self, value, highest, delta, wrap):
+        """Unroll a wrapping counter relative to the highest value seen so far"""
+        if highest is None:
+            return value
+        return highest + delta(value, highest & (wrap - 1))
+    
+    def push(self, packet, arrival=None):
+        """
+        Add a decoded RTP packet
+        
+        Args:
+            packet: RtpPacket with an RFC 2435 payload
+            arrival: Arrival time on the buffer's clock (defaults to now)
+        """
+        with self.lock:
+            if not packet.isJpegFragment():
+                # Held, it would make assemble() fail on the playout thread
+                self.malformed += 1
+                return
+            
+            seq = self.extend(packet.seqNum(), self.highestSeq, seqDelta, 0x10000)
+            timestamp = self.extend(packet.timestamp(), self.highestTimestamp, timestampDelta, 0x100000000)
+            
+            if self.lastReleased is not None and timestamp <= self.lastReleased:
+                self.latePackets += 1
+                return
+            
+            if self.highestSeq is None or seq > self.highestSeq:
+                self.highestSeq = seq
+            if self.highestTimestamp is None or timestamp > self.highestTimestamp:
+                if self.highestTimestamp is not None:
+                    self.frameInterval = timestamp - self.highestTimestamp
+                self.highestTimestamp = timestamp
+            
+            # The first frame after a (re)start sets the media clock
+            if self.anchorTime is None:
+                self.anchorTime = self.clock() if arrival is None else arrival
+                self.anchorTimestamp = timestamp
+                self.underrunPending = False
+            
+            frame = self.frames.setdefault(timestamp, {})
+            if seq in frame:
+                self.duplicates += 1
+                return
+            frame[seq] = packet
+            
+            # Bound memory if playout stalls
+            while len(self.frames) > self.maxFrames:
+                self.dropFrame(min(self.frames))
+    
+    def playoutTime(self, timestamp):
+        """Return the clock time an (extended) timestamp is due for playout"""
+        return self.anchorTime + self.targetDelay + (timestamp - self.anchorTimestamp) / self.clockRate
+    
+    def nextPlayoutTime(self):
+        """Return when the oldest held frame is due, or None if the buffer is empty"""
+        with self.lock:
+            if not self.frames or self.anchorTime is None:
+                return None
+            return self.playoutTime(min(self.frames))
+    
+    def assemble(self, packets):
+        """Return the JPEG of a frame's packets, or None if fragments are missing"""
+        seqs = sorted(packets)
+        first = packets[seqs[0]]
+        last = packets[seqs[-1]]
+        if first.fragmentOffset() != 0 or not last.marker() or seqs[-1] - seqs[0] != len(seqs) - 1:
+            return None
+        
+        data = bytearray()
+        for seq in seqs:
+            packet = packets[seq]
+            if packet.fragmentOffset() != len(data):
+                return None
+            data += packet.jpegPayload()
+        return bytes(data)
+    
+    def dropFrame(self, timestamp):
+        """Discard a held frame, counting it as dropped"""
+        del self.frames[timestamp]
+        self.framesDropped += 1
+        self.lastReleased = max(timestamp, self.lastReleased or timestamp)
+    
+    def pop(self, now=None):
+        """
+        Release the frames that are due
+        
+        Args:
+            now: Current time on the buffer's clock (defaults to now)
+        
+        Returns:
+            List of complete JPEG frames in playout order (usually zero or one)
+        """
+        with self.lock:
+            if now is None:
+                now = self.clock()
+            if self.anchorTime is None:
+                return []
+            
+            released = []
+            for timestamp in sorted(self.frames):
+                if self.playoutTime(timestamp) > now:
+                    break
+                data = self.assemble(self.frames[timestamp])
+                if data is None:
+                    self.dropFrame(timestamp)
+                    continue
+                del self.frames[timestamp]
+                self.lastReleased = timestamp
+                self.framesReleased += 1
+                released.append(data)
+            
+            # Underrun: the next frame is due but nothing has arrived for it
+            if not released and not self.frames and self.lastReleased is not None and self.frameInterval:
+                if now > self.playoutTime(self.lastReleased + self.frameInterval) and not self.underrunPending:
+                    self.underruns += 1
+                    self.underrunPending = True
+                    self.anchorTime = None  # Buffer up again before resuming playout
+            
+            return released
+    
+    def stats(self):
+        """Return buffer counters as a dictionary"""
+        return {
+            'framesHeld': len(self.frames),
+            'framesReleased': self.framesReleased,
+            'framesDropped': self.framesDropped,
+            'latePackets': self.latePackets,
+            'duplicates': self.duplicates,
+            'malformed': self.malformed,
+            'underruns': self.underruns
+        }
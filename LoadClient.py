@@ -0,0 +1,297 @@
+"""
+Headless Load Client
+Opens many concurrent RTSP sessions against a server from one asyncio
+event loop, receives their RTP streams and reports per-session frame rate,
+packet loss, jitter and RTSP request latency
+
+Usage:
+    python LoadClient.py [--sessions N] [--duration S] [--ramp S] [--host H]
+                         [--port P] [--file F] [--rtp-port BASE] [--report FILE]
+"""
+
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+from random import getrandbits
+
+from RtpPacket import RtpPacket, FrameAssembler
+from Rtcp import ReceptionStats, SenderReport, packReceiverReport, parseRtcp
+import config
+
+
+class RtpProtocol(asyncio.DatagramProtocol):
+    """Feeds datagrams arriving on a session's UDP port to the session"""
+    
+    def __init__(self, handler):
+        """Initialize with the callback that takes each datagram"""
+        self.handler = handler
+    
+    def datagram_received(self, data, addr):
+        """Pass one datagram on"""
+        self.handler(data)
+
+
+class LoadSession:
+    """One headless RTSP session: SETUP, PLAY, receive for a while, TEARDOWN"""
+    
+    def __init__(self, index, host, port, filename, rtpPort):
+        """
+        Initialize session
+        
+        Args:
+            index: Session number, for the report
+            host: Server address
+            port: Server RTSP port
+            filename: Video to request
+            rtpPort: Local RTP port (RTCP uses the next one)
+        """
+        self.index = index
+        self.host = host
+        self.port = port
+        self.filename = filename
+        self.rtpPort = rtpPort
+        self.rtspSeq = 0
+        self.sessionId = None
+        self.reader = None
+        self.writer = None
+        self.rtpTransport = None
+        self.rtcpTransport = None
+        self.rtcpAddr = None
+        
+        self.ssrc = getrandbits(32)
+        self.stats = ReceptionStats()
+        self.assembler = FrameAssembler()
+        self.latencies = {}  # RTSP method -> seconds from request to reply
+        self.bytesReceived = 0
+        self.firstFrameTime = None
+        self.lastFrameTime = None
+        self.error = None
+    
+    def onRtp(self, data):
+        """Record one RTP packet"""
+        packet = RtpPacket()
+        packet.decode(data)
+        self.bytesReceived += len(data)
+        if not packet.isJpegFragment():
+            self.assembler.packetsDropped += 1
+            return
+        self.stats.update(packet.seqNum(), packet.timestamp(), packet.ssrc(), len(data) - len(packet.header))
+        if self.assembler.push(packet) is not None:
+            now = time.monotonic()
+            if self.firstFrameTime is None:
+                self.firstFrameTime = now
+            self.lastFrameTime = now
+    
+    def onRtcp(self, data):
+        """Record the server's sender reports (echoed in our receiver reports)"""
+        for report in parseRtcp(data):
+            if isinstance(report, SenderReport):
+                self.stats.senderReport(report)
+    
+    async def request(self, method, transport=None):
+        """
+        Send one RTSP request and wait for its reply
+        
+        Returns:
+            The reply lines
+        
+        Raises:
+            RuntimeError: If the server does not answer 200 OK
+        """
+        self.rtspSeq += 1
+        request = f'{method} {self.filename} {config.RTSP_VER}\nCSeq: {self.rtspSeq}\n'
+        if transport:
+            request += f'Transport: {transport}\n'
+        elif self.sessionId is not None:
+            request += f'Session: {self.sessionId}\n'
+        
+        start = time.perf_counter()
+        self.writer.write(request.encode())
+        await self.writer.drain()
+        data = await asyncio.wait_for(self.reader.read(1024), timeout=10)
+        self.latencies[method] = time.perf_counter() - start
+        
+        lines = data.decode('utf-8').split('\n')
+        status = lines[0].split(' ')
+        if len(status) < 2 or status[1] != '200':
+            raise RuntimeError(f'{method} failed: {lines[0] or "connection closed"}')
+        return lines
+    
+    async def run(self, duration):
+        """Play the video for duration seconds, sending receiver reports as a client would"""
+        loop = asyncio.get_running_loop()
+        try:
+            self.rtpTransport, _ = await loop.create_datagram_endpoint(
+                lambda: RtpProtocol(self.onRtp), local_addr=('0.0.0.0', self.rtpPort))
+            sock = self.rtpTransport.get_extra_info('socket')
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, config.RTP_RECV_BUFFER)
+            self.rtcpTransport, _ = await loop.create_datagram_endpoint(
+                lambda: RtpProtocol(self.onRtcp), local_addr=('0.0.0.0', self.rtpPort + 1))
+            
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            lines = await self.request(config.SETUP, f'RTP/UDP; client_port= {self.rtpPort}-{self.rtpPort + 1}')
+            for line in lines:
+                if line.startswith('Session:'):
+                    self.sessionId = int(line.split(' ')[1])
+                elif line.startswith('Transport:') and 'rtcp_port=' in line:
+                    self.rtcpAddr = (self.host, int(line.split('rtcp_port=')[1].split(';')[0]))
+            
+            await self.request(config.PLAY)
+            end = loop.time() + duration
+            while loop.time() < end:
+                await asyncio.sleep(min(config.RTCP_INTERVAL, max(0.0, end - loop.time())))
+                report = self.stats.report(self.ssrc)
+                if report is not None and self.rtcpAddr:
+                    self.rtcpTransport.sendto(packReceiverReport(report), self.rtcpAddr)
+            await self.request(config.TEARDOWN)
+        except Exception as e:
+            self.error = f'{type(e).__name__}: {e}'
+        finally:
+            if self.writer:
+                self.writer.close()
+            if self.rtpTransport:
+                self.rtpTransport.close()
+            if self.rtcpTransport:
+                self.rtcpTransport.close()
+    
+    def result(self):
+        """Return the session's measurements as a dictionary"""
+        frames = self.assembler.framesCompleted
+        elapsed = (self.lastFrameTime - self.firstFrameTime) if frames > 1 else 0.0
+        expected = self.stats.expected()
+        return {
+            'session': self.index,
+            'ok': self.error is None,
+            'error': self.error,
+            'frames': frames,
+            'framesDropped': self.assembler.framesDropped,
+            'packetsDropped': self.assembler.packetsDropped,
+            'fps': (frames - 1) / elapsed if elapsed > 0 else 0.0,
+            'packets': self.stats.received,
+            'packetsLost': max(0, self.stats.lost()),
+            'lossPercent': 100 * max(0, self.stats.lost()) / expected if expected else 0.0,
+            'jitterMs': self.stats.jitterSeconds() * 1000,
+            'kbps': self.bytesReceived * 8 / elapsed / 1000 if elapsed > 0 else 0.0,
+            'rtspLatencyMs': {method: latency * 1000 for method, latency in self.latencies.items()}
+        }
+
+
+def percentile(values, fraction):
+    """Return the value at a fraction (0-1) of the sorted values"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def summarize(results):
+    """Aggregate per-session results"""
+    ok = [r for r in results if r['ok']]
+    latencies = [latency for r in results for latency in r['rtspLatencyMs'].values()]
+    summary = {
+        'sessions': len(results),
+        'sessionsOk': len(ok),
+        'sessionsFailed': len(results) - len(ok),
+        'latencyMs': {
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'max': max(latencies, default=0.0)
+        }
+    }
+    for key in ('fps', 'lossPercent', 'jitterMs', 'kbps'):
+        values = [r[key] for r in ok]
+        summary[key] = {
+            'mean': statistics.mean(values) if values else 0.0,
+            'min': min(values, default=0.0),
+            'max': max(values, default=0.0)
+        }
+    summary['totalKbps'] = sum(r['kbps'] for r in ok)
+    return summary
+
+
+async def runLoad(host, port, filename, count, duration, ramp=0.0, rtpPort=None):
+    """
+    Start sessions (spread over the ramp time) and wait for all of them
+    
+    Args:
+        host: Server address
+        port: Server RTSP port
+        filename: Video to request
+        count: Number of sessions
+        duration: Seconds each session plays
+        ramp: Seconds over which the sessions are started
+        rtpPort: First local RTP port (defaults to config.LOAD_RTP_PORT)
+    
+    Returns:
+        List of finished LoadSession objects
+    """
+    rtpPort = rtpPort or config.LOAD_RTP_PORT
+    sessions = [LoadSession(i, host, port, filename, rtpPort + 2 * i) for i in range(count)]
+    step = ramp / count if count else 0
+    
+    async def start(session):
+        await asyncio.sleep(session.index * step)
+        await session.run(duration)
+    
+    await asyncio.gather(*(start(session) for session in sessions))
+    return sessions
+
+
+def main():
+    """Run the load test and write the report"""
+    parser = argparse.ArgumentParser(description='Headless RTSP load client')
+    parser.add_argument('--sessions', type=int, default=10, help='concurrent sessions')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds each session plays')
+    parser.add_argument('--ramp', type=float, default=1.0, help='seconds over which sessions are started')
+    parser.add_argument('--host', default=config.SERVER_HOST, help='server address')
+    parser.add_argument('--port', type=int, default=config.RTSP_PORT, help='server RTSP port')
+    parser.add_argument('--file', default=config.VIDEO_FILE, help='video to request')
+    parser.add_argument('--rtp-port', type=int, default=config.LOAD_RTP_PORT,
+                        help='first local RTP port (each session uses two)')
+    parser.add_argument('--report', default='load_report.json', help='JSON report path')
+    options = parser.parse_args()
+    
+    print(f'[LOAD] {options.sessions} session(s) of {options.file} on {options.host}:{options.port} '
+          f'for {options.duration:g} s')
+    cpuStart = time.process_time()
+    wallStart = time.perf_counter()
+    sessions = asyncio.run(runLoad(options.host, options.port, options.file, options.sessions,
+                                   options.duration, options.ramp, options.rtp_port))
+    wall = time.perf_counter() - wallStart
+    
+    results = [session.result() for session in sessions]
+    summary = summarize(results)
+    # A busy load client measures itself, not the server
+    summary['clientCpuPercent'] = 100 * (time.process_time() - cpuStart) / wall if wall > 0 else 0.0
+    
+    report = {
+        'host': options.host,
+        'port': options.port,
+        'file': options.file,
+        'sessions': options.sessions,
+        'duration': options.duration,
+        'ramp': options.ramp,
+        'summary': summary,
+        'results': results
+    }
+    with open(options.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print(f"{'Session':>8} {'FPS':>7} {'Loss %':>7} {'Jitter ms':>10} {'kbps':>9} {'SETUP ms':>9}  Error")
+    for r in results:
+        print(f"{r['session']:>8} {r['fps']:>7.2f} {r['lossPercent']:>7.2f} {r['jitterMs']:>10.2f} "
+              f"{r['kbps']:>9.1f} {r['rtspLatencyMs'].get(config.SETUP, 0):>9.2f}  {r['error'] or ''}")
+    print(f"[LOAD] {summary['sessionsOk']}/{summary['sessions']} sessions ok, "
+          f"fps mean {summary['fps']['mean']:.2f} (min {summary['fps']['min']:.2f}), "
+          f"loss max {summary['lossPercent']['max']:.2f}%, jitter max {summary['jitterMs']['max']:.2f} ms, "
+          f"RTSP p95 {summary['latencyMs']['p95']:.2f} ms, client CPU {summary['clientCpuPercent']:.0f}%")
+    print(f'[LOAD] Report written to {options.report}')
+    
+    if summary['sessionsFailed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
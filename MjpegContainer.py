@@ -0,0 +1,210 @@
+"""
+MJPEG Container
+Versioned binary container for MJPEG video: a header with the video's
+metadata, frames stored with fixed-width little-endian lengths and CRC-32s,
+and a trailing frame index so a file opens without scanning it
+"""
+
+import os
+import sys
+import zlib
+import struct
+from array import array
+from collections import namedtuple
+
+CONTAINER_MAGIC = b'MJPC'
+CONTAINER_VERSION = 1
+
+# File header: magic, version, header size, fps numerator, fps denominator,
+# width, height, frame count, index offset (0 until the writer is closed)
+CONTAINER_HEADER = struct.Struct('<4sHHIIIIIQ')
+
+# Written before each frame: length, CRC-32 of the frame data
+FRAME_HEADER = struct.Struct('<II')
+
+FPS_DENOMINATOR = 1000  # fps is stored as a fraction to keep rates like 29.97 exact
+
+# Metadata from the file header
+ContainerInfo = namedtuple('ContainerInfo', 'version fps width height frameCount')
+
+
+def isContainer(filename):
+    """Return True if the file starts with the container magic"""
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(len(CONTAINER_MAGIC)) == CONTAINER_MAGIC
+    except OSError:
+        return False
+
+
+def readHeader(f):
+    """
+    Read and check the file header
+    
+    Args:
+        f: File opened in binary mode
+    
+    Returns:
+        (ContainerInfo, index offset)
+    
+    Raises:
+        ValueError: If the file is not a container of a supported version
+    """
+    f.seek(0)
+    data = f.read(CONTAINER_HEADER.size)
+    if len(data) < CONTAINER_HEADER.size:
+        raise ValueError('File too short for a container header')
+    magic, version, headerSize, fpsNum, fpsDen, width, height, frameCount, indexOffset = \
+        CONTAINER_HEADER.unpack(data)
+    if magic != CONTAINER_MAGIC:
+        raise ValueError('Not an MJPEG container')
+    if version > CONTAINER_VERSION:
+        raise ValueError(f'Unsupported container version {version}')
+    
+    fps = fpsNum / fpsDen if fpsDen else 0.0
+    return ContainerInfo(version, fps, width, height, frameCount), indexOffset
+
+
+def readIndex(filename):
+    """
+    Load a container's metadata and frame table
+    
+    Uses the trailing index; a file whose writer never finished (no index)
+    is recovered by walking the fixed-width frame headers instead.
+    
+    Returns:
+        (ContainerInfo, offsets, lengths, crcs) with the offsets pointing at
+        the frame data
+    """
+    fileSize = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        info, indexOffset = readHeader(f)
+        count = info.frameCount
+        
+        offsets, lengths, crcs = array('Q'), array('I'), array('I')
+        if indexOffset and indexOffset + count * 16 <= fileSize:
+            f.seek(indexOffset)
+            offsets.fromfile(f, count)
+            lengths.fromfile(f, count)
+            crcs.fromfile(f, count)
+            if sys.byteorder != 'little':
+                offsets.byteswap()
+                lengths.byteswap()
+                crcs.byteswap()
+            return info, offsets, lengths, crcs
+        
+        # No index: recover every complete frame
+        position = CONTAINER_HEADER.size
+        while position + FRAME_HEADER.size <= fileSize:
+            f.seek(position)
+            length, crc = FRAME_HEADER.unpack(f.read(FRAME_HEADER.size))
+            position += FRAME_HEADER.size
+            if position + length > fileSize:
+                break  # Truncated last frame
+            offsets.append(position)
+            lengths.append(length)
+            crcs.append(crc)
+            position += length
+    
+    return info._replace(frameCount=len(offsets)), offsets, lengths, crcs
+
+
+def verify(filename):
+    """Return the zero-based numbers of frames whose CRC-32 does not match"""
+    info, offsets, lengths, crcs = readIndex(filename)
+    bad = []
+    with open(filename, 'rb') as f:
+        for n in range(len(offsets)):
+            f.seek(offsets[n])
+            if zlib.crc32(f.read(lengths[n])) != crcs[n]:
+                bad.append(n)
+    return bad
+
+
+class MjpegWriter:
+    """Writes JPEG frames into a new container file"""
+    
+    def __init__(self, filename, fps, width=0, height=0):
+        """
+        Create the file and write a provisional header
+        
+        Args:
+            filename: Output path
+            fps: Frames per second
+            width: Frame width in pixels
+            height: Frame height in pixels
+        """
+        self.filename = filename
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.offsets = array('Q')
+        self.lengths = array('I')
+        self.crcs = array('I')
+        
+        self.file = open(filename, 'wb')
+        self.writeHeader(0)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def writeHeader(self, indexOffset):
+        """Write the file header at the start of the file"""
+        self.file.seek(0)
+        self.file.write(CONTAINER_HEADER.pack(
+            CONTAINER_MAGIC, CONTAINER_VERSION, CONTAINER_HEADER.size,
+            round(self.fps * FPS_DENOMINATOR), FPS_DENOMINATOR,
+            self.width, self.height, len(self.offsets), indexOffset))
+    
+    def write(self, frame):
+        """Append one JPEG frame (bytes-like)"""
+        crc = zlib.crc32(frame)
+        self.file.write(FRAME_HEADER.pack(len(frame), crc))
+        self.offsets.append(self.file.tell())
+        self.lengths.append(len(frame))
+        self.crcs.append(crc)
+        self.file.write(frame)
+    
+    def close(self):
+        """Write the trailing index and the final header"""
+        if self.file.closed:
+            return
+        
+        indexOffset = self.file.tell()
+        tables = (self.offsets, self.lengths, self.crcs)
+        if sys.byteorder != 'little':
+            tables = [array(t.typecode, t) for t in tables]
+            for table in tables:
+                table.byteswap()
+        for table in tables:
+            table.tofile(self.file)
+        
+        self.writeHeader(indexOffset)
+        self.file.close()
+
+
+def main():
+    """Print the metadata of container files, checking frame CRCs with --verify"""
+    args = [arg for arg in sys.argv[1:] if arg != '--verify']
+    if not args:
+        print("Usage: python MjpegContainer.py [--verify] <video.Mjpeg> [...]")
+        return
+    
+    for filename in args:
+        if not isContainer(filename):
+            print(f"{filename}: legacy MJPEG (rewrite with: python VideoConverter.py --rewrite {filename})")
+            continue
+        
+        info, offsets, lengths, crcs = readIndex(filename)
+        print(f"{filename}: v{info.version}, {info.width}x{info.height}, "
+              f"{info.fps:g} fps, {info.frameCount} frames, largest {max(lengths, default=0)} bytes")
+        if '--verify' in sys.argv:
+            bad = verify(filename)
+            print(f"  CRC check: {'OK' if not bad else f'{len(bad)} corrupt frame(s): {bad[:10]}'}")
+
+
+if __name__ == '__main__':
+    main()
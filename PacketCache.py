@@ -0,0 +1,189 @@
+"""
+Packet Cache
+Stores every frame of an MJPEG file as ready-to-send RTP payloads (RFC 2435
+JPEG header followed by the fragment) so that sessions only write the 12-byte
+RTP header of each packet
+"""
+
+import os
+import sys
+import mmap
+import struct
+from array import array
+
+from FrameIndex import FrameIndex
+from RtpPacket import JPEG_HEADER, JPEG_HEADER_SIZE, JPEG_TYPE, JPEG_Q, maxFragmentSize, jpegBlockSize
+import config
+
+CACHE_MAGIC = b'MJRP'
+CACHE_VERSION = 1
+
+# Cache header: magic, version, MTU, source size, source mtime (ns), frame count, fragment count
+CACHE_HEADER = struct.Struct('<4sHHQqII')
+
+
+def cachePath(filename):
+    """Return the packet cache path for a video file"""
+    return filename + config.PACKET_CACHE_SUFFIX
+
+
+class PacketCache:
+    """Memory-mapped, pre-fragmented RTP payloads of one video file
+    
+    The file holds the header, a table of each frame's first fragment, a
+    table of fragment offsets, and then the fragments back to back.
+    """
+    
+    def __init__(self, map, firstFragments, fragmentOffsets):
+        """
+        Initialize cache over a mapped cache file
+        
+        Args:
+            map: mmap of the cache file
+            firstFragments: Index of each frame's first fragment (frame count + 1 entries)
+            fragmentOffsets: File offset of each fragment (fragment count + 1 entries)
+        """
+        self.map = map
+        self.view = memoryview(map)
+        self.firstFragments = firstFragments
+        self.fragmentOffsets = fragmentOffsets
+    
+    def __len__(self):
+        """Return number of frames in the cache"""
+        return len(self.firstFragments) - 1
+    
+    def fragments(self, frameNumber):
+        """Return the RTP payloads of a zero-based frame as memoryviews into the mapping"""
+        view = self.view
+        offsets = self.fragmentOffsets
+        first = self.firstFragments[frameNumber]
+        end = self.firstFragments[frameNumber + 1]
+        return [view[offsets[i]:offsets[i + 1]] for i in range(first, end)]
+    
+    @classmethod
+    def build(cls, filename, mtu=None):
+        """
+        Fragment every frame of a video file once and write the packet cache
+        
+        Args:
+            filename: Path to the MJPEG file
+            mtu: Path MTU the fragments are sized for (defaults to config.MTU)
+        """
+        mtu = mtu or config.MTU
+        size = maxFragmentSize(mtu)
+        index = FrameIndex.forFile(filename)
+        stat = os.stat(filename)
+        
+        # Lay out the tables first; fragment data starts right after them
+        firstFragments = array('I', [0])
+        for length in index.lengths:
+            firstFragments.append(firstFragments[-1] + max(1, -(-length // size)))
+        fragmentCount = firstFragments[-1]
+        
+        position = CACHE_HEADER.size + firstFragments.itemsize * len(firstFragments) + 8 * (fragmentCount + 1)
+        fragmentOffsets = array('Q')
+        for length in index.lengths:
+            for offset in range(0, max(1, length), size):
+                fragmentOffsets.append(position)
+                position += JPEG_HEADER_SIZE + min(size, length - offset)
+        fragmentOffsets.append(position)
+        
+        firstTable, offsetTable = firstFragments, fragmentOffsets
+        if sys.byteorder != 'little':
+            firstTable, offsetTable = array('I', firstFragments), array('Q', fragmentOffsets)
+            firstTable.byteswap()
+            offsetTable.byteswap()
+        
+        # Write to a temporary file first so readers never see a partial cache
+        path = cachePath(filename)
+        tmpPath = f'{path}.{os.getpid()}.tmp'
+        with open(filename, 'rb') as source, open(tmpPath, 'wb') as f:
+            f.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, mtu, stat.st_size,
+                                      stat.st_mtime_ns, len(index), fragmentCount))
+            firstTable.tofile(f)
+            offsetTable.tofile(f)
+            
+            for n in range(len(index)):
+                offset, length = index.frame(n)
+                source.seek(offset)
+                frame = source.read(length)
+                w, h = jpegBlockSize(frame)
+                for fragmentOffset in range(0, max(1, length), size):
+                    f.write(JPEG_HEADER.pack(fragmentOffset, JPEG_TYPE, JPEG_Q, w, h))
+                    f.write(frame[fragmentOffset:fragmentOffset + size])
+        os.replace(tmpPath, path)
+        
+        return cls.load(filename, mtu)
+    
+    @classmethod
+    def load(cls, filename, mtu=None):
+        """
+        Map the packet cache of a video file
+        
+        Returns None if the cache is missing, unreadable, built for another
+        MTU or older than the video file it describes.
+        """
+        mtu = mtu or config.MTU
+        path = cachePath(filename)
+        try:
+            stat = os.stat(filename)
+            with open(path, 'rb') as f:
+                header = f.read(CACHE_HEADER.size)
+                magic, version, cacheMtu, size, mtime, frameCount, fragmentCount = CACHE_HEADER.unpack(header)
+                if (magic != CACHE_MAGIC or version != CACHE_VERSION or cacheMtu != mtu or
+                        size != stat.st_size or mtime != stat.st_mtime_ns):
+                    return None
+                
+                firstFragments = array('I')
+                fragmentOffsets = array('Q')
+                firstFragments.fromfile(f, frameCount + 1)
+                fragmentOffsets.fromfile(f, fragmentCount + 1)
+                map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, EOFError, ValueError, struct.error):
+            return None
+        
+        if sys.byteorder != 'little':
+            firstFragments.byteswap()
+            fragmentOffsets.byteswap()
+        if fragmentOffsets[-1] != len(map):
+            map.close()
+            return None  # Truncated cache file
+        return cls(map, firstFragments, fragmentOffsets)
+    
+    @classmethod
+    def forFile(cls, filename):
+        """Map the packet cache, building it if needed; None if it cannot be written"""
+        cache = cls.load(filename)
+        if cache is None:
+            try:
+                cache = cls.build(filename)
+            except OSError as e:
+                # Sessions fall back to packetizing each frame as it is sent
+                print(f'[CACHE] Could not build packet cache for {filename}: {e}')
+        return cache
+    
+    def close(self):
+        """Unmap the cache file"""
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # A packet still references the mapping; it is freed with it
+            pass
+
+
+def main():
+    """Build packet caches for the given video files"""
+    if len(sys.argv) < 2:
+        print("Usage: python PacketCache.py <video.Mjpeg> [...]")
+        return
+    
+    for filename in sys.argv[1:]:
+        cache = PacketCache.build(filename)
+        print(f"Cached {filename}: {len(cache)} frames, "
+              f"{len(cache.fragmentOffsets) - 1} packets -> {cachePath(filename)}")
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Rendition Ladder
+Manifest describing the renditions (resolution x JPEG quality) generated
+for one source video. All renditions share frame numbering, so frame n of
+any rendition shows the same moment of the source.
+"""
+
+import os
+import json
+
+import config
+
+
+def manifestPath(filename):
+    """Return the ladder manifest path for a video (any rendition or the base name)"""
+    return os.path.splitext(filename)[0] + config.LADDER_SUFFIX
+
+
+def renditionPath(base, name):
+    """Return the file name of one rendition of a base path"""
+    return f'{base}_{name}.Mjpeg'
+
+
+def writeManifest(path, manifest):
+    """Write a manifest atomically"""
+    tmpPath = f'{path}.{os.getpid()}.tmp'
+    with open(tmpPath, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmpPath, path)
+
+
+def loadManifest(filename):
+    """
+    Load the ladder manifest of a video
+    
+    Returns:
+        Manifest dictionary with rendition file names made relative to the
+        current directory, or None if the video has no ladder
+    """
+    path = manifestPath(filename)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    folder = os.path.dirname(path)
+    for rendition in manifest.get('renditions', []):
+        rendition['file'] = os.path.join(folder, rendition['file'])
+    return manifest
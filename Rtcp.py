@@ -0,0 +1,396 @@
+"""
+RTCP Feedback
+RTCP sender and receiver reports (RFC 3550) exchanged between server and
+clients over a UDP return channel: reception statistics on the client,
+report packing and parsing, and the server socket that routes reports to
+sessions, sends their sender reports and keeps the per-session QoS table
+"""
+
+import time
+import struct
+import socket
+import threading
+from collections import namedtuple
+
+import config
+
+RTCP_SR = 200  # Sender report
+RTCP_RR = 201  # Receiver report
+
+NTP_EPOCH_OFFSET = 2208988800  # Seconds from 1900 (NTP epoch) to 1970 (Unix epoch)
+
+# V/P/RC, packet type, length in 32-bit words minus one
+RTCP_HEADER = struct.Struct('!BBH')
+# Sender SSRC of a receiver report
+RTCP_SSRC = struct.Struct('!I')
+# Sender info of a sender report: SSRC, NTP timestamp (64 bits), RTP timestamp,
+# packet count, octet count
+SENDER_INFO = struct.Struct('!IQIII')
+# Source SSRC, fraction lost + cumulative lost, extended highest sequence number,
+# interarrival jitter, last SR timestamp, delay since last SR
+REPORT_BLOCK = struct.Struct('!IIIIII')
+
+# Sender info; ntpTime is the 64-bit NTP timestamp
+SenderReport = namedtuple('SenderReport', 'ssrc ntpTime rtpTimestamp packetCount octetCount')
+
+# One report block; fractionLost is 0.0-1.0, jitter is in RTP timestamp units,
+# lsr and dlsr are in 1/65536 seconds
+ReceiverReport = namedtuple('ReceiverReport',
+                            'ssrc sourceSsrc fractionLost cumulativeLost highestSeq jitter lsr dlsr')
+
+
+def ntpTime(t=None):
+    """Return a Unix time (now by default) as a 64-bit NTP timestamp"""
+    if t is None:
+        t = time.time()
+    return int((t + NTP_EPOCH_OFFSET) * (1 << 32)) & 0xFFFFFFFFFFFFFFFF
+
+
+def ntpToUnix(ntp):
+    """Return the Unix time of a 64-bit NTP timestamp"""
+    return ntp / (1 << 32) - NTP_EPOCH_OFFSET
+
+
+def ntpMiddle(ntp):
+    """Return the middle 32 bits of an NTP timestamp (the LSR/DLSR time base)"""
+    return (ntp >> 16) & 0xFFFFFFFF
+
+
+def packSenderReport(report):
+    """Return an RTCP SR packet with no report blocks"""
+    length = (RTCP_HEADER.size + SENDER_INFO.size) // 4 - 1
+    return (RTCP_HEADER.pack(0x80, RTCP_SR, length) +
+            SENDER_INFO.pack(report.ssrc, report.ntpTime, report.rtpTimestamp & 0xFFFFFFFF,
+                             report.packetCount & 0xFFFFFFFF, report.octetCount & 0xFFFFFFFF))
+
+
+def packReceiverReport(report):
+    """Return an RTCP RR packet carrying one report block"""
+    fraction = min(255, int(report.fractionLost * 256))
+    lost = max(-0x800000, min(0x7FFFFF, report.cumulativeLost)) & 0xFFFFFF
+    length = (RTCP_HEADER.size + RTCP_SSRC.size + REPORT_BLOCK.size) // 4 - 1
+    return (RTCP_HEADER.pack(0x81, RTCP_RR, length) +
+            RTCP_SSRC.pack(report.ssrc) +
+            REPORT_BLOCK.pack(report.sourceSsrc, fraction << 24 | lost,
+                              report.highestSeq & 0xFFFFFFFF, int(report.jitter) & 0xFFFFFFFF,
+                              report.lsr, report.dlsr))
+
+
+def parseReportBlocks(data, position, count, end, ssrc):
+    """Return the ReceiverReports of count report blocks starting at position"""
+    reports = []
+    for _ in range(count):
+        if position + REPORT_BLOCK.size > end:
+            break
+        source, lost, highestSeq, jitter, lsr, dlsr = REPORT_BLOCK.unpack_from(data, position)
+        cumulativeLost = lost & 0xFFFFFF
+        if cumulativeLost & 0x800000:
+            cumulativeLost -= 0x1000000
+        reports.append(ReceiverReport(ssrc, source, (lost >> 24) / 256, cumulativeLost,
+                                      highestSeq, jitter, lsr, dlsr))
+        position += REPORT_BLOCK.size
+    return reports
+
+
+def parseRtcp(data):
+    """
+    Return the sender and receiver reports in an RTCP (compound) packet
+    
+    Report blocks carried by a sender report are returned as receiver
+    reports after it. Packets of other types are skipped; a malformed packet
+    ends parsing.
+    """
+    reports = []
+    position = 0
+    while position + RTCP_HEADER.size <= len(data):
+        first, packetType, length = RTCP_HEADER.unpack_from(data, position)
+        end = position + (length + 1) * 4
+        if first >> 6 != 2 or end > len(data):
+            break
+        
+        body = position + RTCP_HEADER.size
+        if packetType == RTCP_SR and body + SENDER_INFO.size <= end:
+            sender = SenderReport(*SENDER_INFO.unpack_from(data, body))
+            reports.append(sender)
+            reports += parseReportBlocks(data, body + SENDER_INFO.size, first & 0x1F, end, sender.ssrc)
+        elif packetType == RTCP_RR and body + RTCP_SSRC.size <= end:
+            ssrc, = RTCP_SSRC.unpack_from(data, body)
+            reports += parseReportBlocks(data, body + RTCP_SSRC.size, first & 0x1F, end, ssrc)
+        position = end
+    return reports
+
+
+class ReceptionStats:
+    """Reception statistics of one RTP source (RFC 3550 appendix A.1, A.3, A.8)"""
+    
+    def __init__(self, clockRate=None):
+        """
+        Initialize empty statistics
+        
+        Args:
+            clockRate: RTP timestamp units per second (defaults to config.RTP_CLOCK_RATE)
+        """
+        self.clockRate = clockRate or config.RTP_CLOCK_RATE
+        self.sourceSsrc = None
+        self.baseSeq = None
+        self.maxSeq = 0
+        self.cycles = 0
+        self.received = 0
+        self.octets = 0
+        self.expectedPrior = 0
+        self.receivedPrior = 0
+        self.transit = None
+        self.jitter = 0.0
+        self.lastFractionLost = 0.0
+        
+        # From the source's last sender report
+        self.lastSender = None
+        self.lastSenderArrival = None
+    
+    def update(self, seq, timestamp, ssrc, size=0, arrival=None):
+        """
+        Record one received RTP packet
+        
+        Args:
+            seq: Sequence number (16 bits)
+            timestamp: RTP timestamp
+            ssrc: Source SSRC; a new source restarts the statistics
+            size: Payload octets
+            arrival: Arrival time in seconds (defaults to now)
+        """
+        if ssrc != self.sourceSsrc:
+            # A sender report may arrive before the source's first packet
+            sender = self.lastSender, self.lastSenderArrival
+            self.__init__(self.clockRate)
+            self.sourceSsrc = ssrc
+            if sender[0] is not None and sender[0].ssrc == ssrc:
+                self.lastSender, self.lastSenderArrival = sender
+        
+        if self.baseSeq is None:
+            self.baseSeq = self.maxSeq = seq
+        elif (seq - self.maxSeq) & 0xFFFF < 0x8000:
+            # In order, possibly after a gap; count a wrap of the 16-bit number
+            if seq < self.maxSeq:
+                self.cycles += 0x10000
+            self.maxSeq = seq
+        self.received += 1
+        self.octets += size
+        
+        # Interarrival jitter, in timestamp units
+        if arrival is None:
+            arrival = time.time()
+        transit = arrival * self.clockRate - timestamp
+        if self.transit is not None:
+            self.jitter += (abs(transit - self.transit) - self.jitter) / 16
+        self.transit = transit
+    
+    def senderReport(self, report, arrival=None):
+        """Record a sender report from the source (for LSR/DLSR and the clock mapping)"""
+        if self.sourceSsrc is not None and report.ssrc != self.sourceSsrc:
+            return
+        self.lastSender = report
+        self.lastSenderArrival = time.time() if arrival is None else arrival
+    
+    def wallclock(self, timestamp):
+        """
+        Return the sender's wall-clock time (Unix seconds) of an RTP timestamp
+        
+        Uses the NTP/RTP timestamp pair of the last sender report; None
+        before one has arrived.
+        """
+        if self.lastSender is None:
+            return None
+        delta = (timestamp - self.lastSender.rtpTimestamp) & 0xFFFFFFFF
+        if delta >= 0x80000000:
+            delta -= 0x100000000
+        return ntpToUnix(self.lastSender.ntpTime) + delta / self.clockRate
+    
+    def extendedHighestSeq(self):
+        """Return the highest sequence number received, extended with wrap cycles"""
+        return self.cycles + self.maxSeq
+    
+    def expected(self):
+        """Return the number of packets expected since the first one"""
+        if self.baseSeq is None:
+            return 0
+        return self.extendedHighestSeq() - self.baseSeq + 1
+    
+    def lost(self):
+        """Return the cumulative number of packets lost (negative with duplicates)"""
+        return self.expected() - self.received
+    
+    def jitterSeconds(self):
+        """Return the interarrival jitter in seconds"""
+        return self.jitter / self.clockRate
+    
+    def report(self, ssrc, now=None):
+        """
+        Build a receiver report and start a new reporting interval
+        
+        Args:
+            ssrc: SSRC of the reporting receiver
+            now: Current time in seconds (defaults to now)
+        
+        Returns:
+            ReceiverReport, or None before the first packet
+        """
+        if self.baseSeq is None:
+            return None
+        
+        expected = self.expected()
+        expectedInterval = expected - self.expectedPrior
+        receivedInterval = self.received - self.receivedPrior
+        self.expectedPrior = expected
+        self.receivedPrior = self.received
+        
+        lostInterval = expectedInterval - receivedInterval
+        fraction = lostInterval / expectedInterval if expectedInterval > 0 and lostInterval > 0 else 0.0
+        self.lastFractionLost = fraction
+        
+        # Echo the last sender report so the sender can measure the round trip
+        lsr = dlsr = 0
+        if self.lastSender is not None:
+            lsr = ntpMiddle(self.lastSender.ntpTime)
+            delay = (time.time() if now is None else now) - self.lastSenderArrival
+            dlsr = int(delay * 65536) & 0xFFFFFFFF
+        
+        return ReceiverReport(ssrc, self.sourceSsrc, fraction, self.lost(),
+                              self.extendedHighestSeq(), int(self.jitter), lsr, dlsr)
+
+
+class RtcpEndpoint:
+    """Server end of the RTCP return channel
+    
+    One UDP socket on RTCP_PORT serves every session. Sessions register the
+    address their client sends reports from; each report received is passed
+    to that session's receiveRtcp method, and every RTCP_INTERVAL the
+    session's senderReport is sent back. The QoS statistics of all
+    registered sessions are printed as a table every STATS_INTERVAL.
+    """
+    
+    _sessions = {}  # (client IP, client RTCP port) -> session
+    _lock = threading.Lock()
+    socket = None
+    lastTable = 0.0
+    
+    @classmethod
+    def register(cls, addr, session):
+        """Route reports from a client address to a session"""
+        with cls._lock:
+            cls._sessions[addr] = session
+    
+    @classmethod
+    def unregister(cls, addr, session):
+        """Stop routing reports from a client address to a session"""
+        with cls._lock:
+            if cls._sessions.get(addr) is session:
+                del cls._sessions[addr]
+    
+    @classmethod
+    def sessions(cls):
+        """Return the registered (address, session) pairs"""
+        with cls._lock:
+            return list(cls._sessions.items())
+    
+    @classmethod
+    def dispatch(cls, data, addr):
+        """Pass the reports in one datagram to the session they belong to"""
+        with cls._lock:
+            session = cls._sessions.get(addr)
+        if session is None:
+            return
+        
+        reports = parseRtcp(data)
+        if reports:
+            session.receiveRtcp(reports)
+    
+    @classmethod
+    def sendReports(cls):
+        """Send every session's sender report, and print the stats table when due"""
+        for addr, session in cls.sessions():
+            packet = session.senderReport()
+            if packet is None:
+                continue
+            try:
+                cls.socket.sendto(packet, addr)
+            except OSError as e:
+                print(f'[RTCP] Error sending report to {addr}: {e}')
+        
+        now = time.monotonic()
+        if config.STATS_INTERVAL and now - cls.lastTable >= config.STATS_INTERVAL:
+            cls.lastTable = now
+            rows = cls.statsTable()
+            if rows:
+                print(cls.formatTable(rows))
+    
+    @classmethod
+    def statsTable(cls):
+        """Return the QoS statistics of every registered session, one dict each"""
+        return [session.qosStats() for addr, session in cls.sessions()]
+    
+    @staticmethod
+    def formatTable(rows):
+        """Format QoS statistics as a table with an aggregate row"""
+        columns = ('Session', 'Client', 'Rendition', 'Packets', 'KB sent', 'Loss %', 'Lost', 'Jitter ms', 'RTT ms')
+        lines = [f'[RTCP] Session statistics ({len(rows)} session(s))',
+                 '  {:>8} {:<21} {:<9} {:>9} {:>10} {:>7} {:>7} {:>9} {:>7}'.format(*columns)]
+        fmt = '  {:>8} {:<21} {:<9} {:>9} {:>10.1f} {:>7.1f} {:>7} {:>9.1f} {:>7}'
+        for row in rows:
+            rtt = f"{row['rttMs']:.1f}" if row['rttMs'] is not None else '-'
+            lines.append(fmt.format(row['session'], row['client'], row['rendition'], row['packetsSent'],
+                                    row['octetsSent'] / 1024, row['fractionLost'] * 100, row['cumulativeLost'],
+                                    row['jitterMs'], rtt))
+        
+        # Totals, with the worst loss, jitter and round trip of any session
+        rtts = [row['rttMs'] for row in rows if row['rttMs'] is not None]
+        lines.append(fmt.format('All', '', '', sum(row['packetsSent'] for row in rows),
+                                sum(row['octetsSent'] for row in rows) / 1024,
+                                max(row['fractionLost'] for row in rows) * 100,
+                                sum(row['cumulativeLost'] for row in rows),
+                                max(row['jitterMs'] for row in rows),
+                                f'{max(rtts):.1f}' if rtts else '-'))
+        return '\n'.join(lines)
+    
+    @classmethod
+    def openSocket(cls):
+        """Create the UDP socket reports arrive on and are sent from"""
+        rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rtcpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        rtcpSocket.bind((config.SERVER_HOST, config.RTCP_PORT))
+        cls.socket = rtcpSocket
+        return rtcpSocket
+    
+    @classmethod
+    def start(cls):
+        """Serve RTCP on a background thread (threaded server)"""
+        try:
+            rtcpSocket = cls.openSocket()
+        except OSError as e:
+            print(f'[RTCP] Could not open port {config.RTCP_PORT}, RTCP disabled: {e}')
+            return
+        
+        threading.Thread(target=cls.serve, args=(rtcpSocket,), name='RTCP', daemon=True).start()
+        print(f'[RTCP] Listening on {config.SERVER_HOST}:{config.RTCP_PORT}')
+    
+    @classmethod
+    def serve(cls, rtcpSocket):
+        """Receive and dispatch reports, sending sender reports on schedule, until the socket is closed"""
+        rtcpSocket.settimeout(config.RTCP_INTERVAL)
+        nextReport = time.monotonic() + config.RTCP_INTERVAL
+        while True:
+            try:
+                data, addr = rtcpSocket.recvfrom(config.MAX_PACKET_SIZE)
+                cls.dispatch(data, addr)
+            except socket.timeout:
+                pass
+            except OSError:
+                break
+            except Exception as e:
+                print(f'[RTCP] Error handling report from {addr}: {e}')
+            
+            if time.monotonic() >= nextReport:
+                nextReport += config.RTCP_INTERVAL
+                try:
+                    cls.sendReports()
+                except Exception as e:
+                    print(f'[RTCP] Error sending reports: {e}')
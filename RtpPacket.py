@@ -4,20 +4,73 @@ Handles the creation and parsing of RTP packets for video streaming
 """
 
 import sys
+import struct
 from time import time
+from random import getrandbits
+
+import config
 
 HEADER_SIZE = 12
+JPEG_HEADER_SIZE = 8  # RFC 2435 main JPEG header
+IP_UDP_OVERHEAD = 28  # IPv4 (20) + UDP (8) headers
+
+JPEG_TYPE = 1    # RFC 2435 type 1: 4:2:0 baseline JPEG
+JPEG_Q = 255     # Q >= 128: tables travel in-band (we send the full JFIF image)
+
+# V/P/X/CC, M/PT, sequence number, timestamp, SSRC
+RTP_HEADER = struct.Struct('!BBHII')
+# RTP header followed by the JPEG header (type-specific + 24-bit offset, type, Q, width, height)
+RTP_JPEG_HEADER = struct.Struct('!BBHIIIBBBB')
+# JPEG header on its own, as stored in a packet cache
+JPEG_HEADER = struct.Struct('!IBBBB')
+
+
+def maxFragmentSize(mtu):
+    """Return how many JPEG bytes fit in one RTP packet for a given MTU"""
+    return mtu - IP_UDP_OVERHEAD - HEADER_SIZE - JPEG_HEADER_SIZE
+
+
+def jpegDimensions(data):
+    """
+    Return (width, height) from a JPEG image's SOF marker, or (0, 0)
+    
+    Args:
+        data: JPEG image (bytes or memoryview)
+    """
+    i = 2  # Skip SOI
+    end = len(data) - 9
+    while i < end:
+        if data[i] != 0xFF:
+            break
+        marker = data[i + 1]
+        segmentLength = data[i + 2] << 8 | data[i + 3]
+        # SOF0-SOF15, excluding DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = data[i + 5] << 8 | data[i + 6]
+            width = data[i + 7] << 8 | data[i + 8]
+            return width, height
+        i += 2 + segmentLength
+    return 0, 0
+
+
+def jpegBlockSize(data):
+    """Return the RFC 2435 width and height fields (8-pixel blocks, 0 if over 2040 pixels)"""
+    width, height = jpegDimensions(data)
+    return (width // 8 if width <= 2040 else 0,
+            height // 8 if height <= 2040 else 0)
 
 
 class RtpPacket:
     """Class to handle RTP packet creation and parsing"""
     
-    header = bytearray(HEADER_SIZE)
+    __slots__ = ('header', 'payload')
     
     def __init__(self):
-        pass
+        """Initialize an empty packet with its own header buffer"""
+        self.header = bytearray(HEADER_SIZE)
+        self.payload = b''
     
-    def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload):
+    def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload, timestamp=None):
         """
         Encode the RTP packet with header + payload
         
@@ -31,31 +84,18 @@ class RtpPacket:
             pt: Payload type (7 bits) - 26 for JPEG
             ssrc: Synchronization source identifier (32 bits)
             payload: The actual payload data
+            timestamp: RTP timestamp (defaults to the current time on the
+                       RTP_CLOCK_RATE clock); all fragments of one frame must share it
         """
-        timestamp = int(time())
-        
-        # Fill the header bytearray with RTP header fields
-        # Byte 0: V(2), P(1), X(1), CC(4)
-        self.header[0] = (version << 6) | (padding << 5) | (extension << 4) | cc
-        
-        # Byte 1: M(1), PT(7)
-        self.header[1] = (marker << 7) | pt
-        
-        # Bytes 2-3: Sequence number
-        self.header[2] = (seqnum >> 8) & 0xFF
-        self.header[3] = seqnum & 0xFF
-        
-        # Bytes 4-7: Timestamp
-        self.header[4] = (timestamp >> 24) & 0xFF
-        self.header[5] = (timestamp >> 16) & 0xFF
-        self.header[6] = (timestamp >> 8) & 0xFF
-        self.header[7] = timestamp & 0xFF
+        if timestamp is None:
+            timestamp = int(time() * config.RTP_CLOCK_RATE)
         
-        # Bytes 8-11: SSRC
-        self.header[8] = (ssrc >> 24) & 0xFF
-        self.header[9] = (ssrc >> 16) & 0xFF
-        self.header[10] = (ssrc >> 8) & 0xFF
-        self.header[11] = ssrc & 0xFF
+        # Byte 0: V(2), P(1), X(1), CC(4); Byte 1: M(1), PT(7);
+        # Bytes 2-3: Sequence number; Bytes 4-7: Timestamp; Bytes 8-11: SSRC
+        RTP_HEADER.pack_into(self.header, 0,
+                             (version << 6) | (padding << 5) | (extension << 4) | cc,
+                             (marker << 7) | pt,
+                             seqnum & 0xFFFF, timestamp & 0xFFFFFFFF, ssrc & 0xFFFFFFFF)
         
         # Get the payload from the argument
         self.payload = payload
@@ -85,6 +125,28 @@ class RtpPacket:
                     self.header[6] << 8 | self.header[7])
         return int(timestamp)
     
+    def marker(self):
+        """Return marker bit (set on the last fragment of a frame)"""
+        return int(self.header[1] >> 7)
+    
+    def ssrc(self):
+        """Return synchronization source identifier"""
+        ssrc = (self.header[8] << 24 | self.header[9] << 16 |
+                self.header[10] << 8 | self.header[11])
+        return int(ssrc)
+    
+    def isJpegFragment(self):
+        """Return True if the packet holds a whole RTP header and RFC 2435 JPEG header"""
+        return len(self.header) == HEADER_SIZE and len(self.payload) >= JPEG_HEADER_SIZE
+    
+    def fragmentOffset(self):
+        """Return RFC 2435 fragment offset of the JPEG payload"""
+        return self.payload[1] << 16 | self.payload[2] << 8 | self.payload[3]
+    
+    def jpegPayload(self):
+        """Return JPEG data after the RFC 2435 header"""
+        return self.payload[JPEG_HEADER_SIZE:]
+    
     def payloadType(self):
         """Return payload type"""
         pt = self.header[1] & 0x7F
@@ -97,3 +159,204 @@ class RtpPacket:
     def getPacket(self):
         """Return RTP packet (header + payload)"""
         return self.header + self.payload
+
+
+class RtpEncoder:
+    """Per-session RTP/JPEG packetizer
+    
+    Headers are written with struct.pack_into into a buffer owned by the
+    session and reused for every frame, and the payload of each packet is a
+    memoryview slice of the frame. A packet is a (header, payload) pair for
+    scatter/gather sending, so the frame itself is never copied.
+    """
+    
+    __slots__ = ('ssrc', 'payloadType', 'seqnum', 'fragmentSize', 'headers', 'headerViews', 'rtpViews',
+                 'packetCount', 'octetCount', 'lastTimestamp', 'lastTime', 'timestampOffset')
+    
+    def __init__(self, ssrc=None, payloadType=26, mtu=None, seqnum=None, timestampOffset=None):
+        """
+        Initialize encoder
+        
+        Args:
+            ssrc: Synchronization source identifier of the session (random by default)
+            payloadType: RTP payload type (26 for JPEG)
+            mtu: Path MTU used to size fragments (defaults to config.MTU)
+            seqnum: Sequence number of the packet before the first one sent (random by default)
+            timestampOffset: RTP timestamp of the first frame (random by default)
+        """
+        # Random starting points, as RFC 3550 asks, so streams cannot be confused or predicted
+        self.ssrc = getrandbits(32) if ssrc is None else ssrc
+        self.payloadType = payloadType
+        self.seqnum = getrandbits(16) if seqnum is None else seqnum
+        self.timestampOffset = getrandbits(32) if timestampOffset is None else timestampOffset
+        self.fragmentSize = maxFragmentSize(mtu or config.MTU)
+        self.headers = bytearray()
+        self.headerViews = []
+        self.rtpViews = []  # RTP-only (12-byte) prefixes of headerViews
+        
+        # Sender statistics for RTCP sender reports
+        self.packetCount = 0
+        self.octetCount = 0      # Payload octets, RTP headers excluded
+        self.lastTimestamp = None
+        self.lastTime = None     # Wall-clock time the last frame was packetized
+    
+    def frameTimestamp(self, frameIndex, frameRate=None):
+        """
+        Return the RTP timestamp of a frame on the RTP_CLOCK_RATE (90 kHz) media clock
+        
+        Args:
+            frameIndex: Position of the frame in the session's timeline
+                        (frames sent or skipped since the stream started)
+            frameRate: Frames per second (defaults to config.FRAME_RATE)
+        """
+        ticks = round(frameIndex * config.RTP_CLOCK_RATE / (frameRate or config.FRAME_RATE))
+        return (self.timestampOffset + ticks) & 0xFFFFFFFF
+    
+    def count(self, packets, octets, timestamp):
+        """Add one packetized frame to the sender statistics"""
+        self.packetCount += packets
+        self.octetCount += octets
+        self.lastTimestamp = timestamp & 0xFFFFFFFF
+        self.lastTime = time()
+    
+    def reserve(self, count):
+        """Make sure header space exists for a frame of count fragments"""
+        if count > len(self.headerViews):
+            # A new buffer, so views handed out earlier stay valid
+            size = HEADER_SIZE + JPEG_HEADER_SIZE
+            self.headers = bytearray(size * count)
+            view = memoryview(self.headers)
+            self.headerViews = [view[i * size:(i + 1) * size] for i in range(count)]
+            self.rtpViews = [view[i * size:i * size + HEADER_SIZE] for i in range(count)]
+    
+    def encodeFrame(self, frame, timestamp):
+        """
+        Packetize one JPEG frame
+        
+        Args:
+            frame: JPEG image (bytes or memoryview)
+            timestamp: RTP timestamp shared by all fragments
+        
+        Returns:
+            List of (header, payload) memoryview pairs, valid until the next
+            call to encodeFrame
+        """
+        w, h = jpegBlockSize(frame)
+        
+        view = memoryview(frame)
+        total = len(view)
+        size = self.fragmentSize
+        count = max(1, -(-total // size))
+        self.reserve(count)
+        
+        pack = RTP_JPEG_HEADER.pack_into
+        headers = self.headers
+        step = HEADER_SIZE + JPEG_HEADER_SIZE
+        seqnum = self.seqnum
+        pt = self.payloadType
+        
+        packets = []
+        for i in range(count):
+            offset = i * size
+            seqnum = (seqnum + 1) & 0xFFFF
+            marker = 0x80 if i == count - 1 else 0
+            pack(headers, i * step, 0x80, marker | pt, seqnum, timestamp & 0xFFFFFFFF,
+                 self.ssrc, offset, JPEG_TYPE, JPEG_Q, w, h)
+            packets.append((self.headerViews[i], view[offset:offset + size]))
+        
+        self.seqnum = seqnum
+        self.count(count, total + count * JPEG_HEADER_SIZE, timestamp)
+        return packets
+    
+    def encodeFragments(self, fragments, timestamp):
+        """
+        Packetize one frame from pre-built RFC 2435 payloads (see PacketCache)
+        
+        Each fragment already starts with its JPEG header, so only the
+        12-byte RTP headers are written.
+        
+        Args:
+            fragments: Payloads of the frame's packets, in order
+            timestamp: RTP timestamp shared by all fragments
+        
+        Returns:
+            List of (header, payload) memoryview pairs, valid until the next
+            call to encodeFrame or encodeFragments
+        """
+        count = len(fragments)
+        self.reserve(count)
+        
+        pack = RTP_HEADER.pack_into
+        headers = self.headers
+        step = HEADER_SIZE + JPEG_HEADER_SIZE
+        seqnum = self.seqnum
+        pt = self.payloadType
+        ssrc = self.ssrc
+        timestamp &= 0xFFFFFFFF
+        last = count - 1
+        
+        for i in range(count):
+            seqnum = (seqnum + 1) & 0xFFFF
+            pack(headers, i * step, 0x80, 0x80 | pt if i == last else pt, seqnum, timestamp, ssrc)
+        
+        self.seqnum = seqnum
+        self.count(count, sum(map(len, fragments)), timestamp)
+        return list(zip(self.rtpViews, fragments))
+
+
+class FrameAssembler:
+    """Reassembles fragmented JPEG frames from consecutive RTP packets"""
+    
+    def __init__(self):
+        """Initialize an empty reassembly buffer"""
+        self.buffer = bytearray()
+        self.timestamp = None
+        self.nextSeq = None
+        self.framesCompleted = 0
+        self.framesDropped = 0
+        self.packetsDropped = 0  # Too short to be RTP/JPEG
+    
+    def reset(self):
+        """Discard the frame being assembled, counting it as dropped"""
+        if self.nextSeq is not None:
+            self.framesDropped += 1
+        self.buffer = bytearray()
+        self.timestamp = None
+        self.nextSeq = None
+    
+    def push(self, packet):
+        """
+        Add a decoded RTP packet
+        
+        Returns:
+            The complete JPEG frame when the packet finishes one, else None
+        """
+        if not packet.isJpegFragment():
+            # Its frame is dropped by the sequence gap the next packet sees
+            self.packetsDropped += 1
+            return None
+        
+        offset = packet.fragmentOffset()
+        seq = packet.seqNum()
+        
+        if offset == 0:
+            # First fragment; any unfinished frame is lost
+            self.reset()
+            self.timestamp = packet.timestamp()
+        elif (seq != self.nextSeq or offset != len(self.buffer) or
+                packet.timestamp() != self.timestamp):
+            # Missing or reordered fragment: drop the whole frame
+            self.reset()
+            return None
+        
+        self.buffer += packet.jpegPayload()
+        self.nextSeq = (seq + 1) & 0xFFFF
+        
+        if packet.marker():
+            frame = bytes(self.buffer)
+            self.buffer = bytearray()
+            self.timestamp = None
+            self.nextSeq = None
+            self.framesCompleted += 1
+            return frame
+        return None
@@ -8,6 +8,7 @@ import socket
 import threading
 
 from ServerWorker import ServerWorker
+from Rtcp import RtcpEndpoint
 import config
 
 
@@ -34,6 +35,9 @@ class Server:
             self.socket.listen(5)
             print(f'[SERVER] RTSP server ready. Waiting for connections...')
             
+            # RTCP for all clients goes through one UDP port
+            RtcpEndpoint.start()
+            
             # Accept client connections
             while True:
                 clientSocket, addr = self.socket.accept()
@@ -64,7 +68,22 @@ class Server:
 
 def main():
     """Main entry point"""
-    server = Server()
+    # Server mode from config, overridable with --async / --threaded
+    mode = config.SERVER_MODE
+    if '--async' in sys.argv:
+        mode = 'async'
+    elif '--threaded' in sys.argv:
+        mode = 'threaded'
+    
+    # --live attaches every session of a file to one shared playhead
+    if '--live' in sys.argv:
+        config.LIVE_CHANNELS = True
+    
+    if mode == 'async':
+        from AsyncServer import AsyncServer
+        server = AsyncServer()
+    else:
+        server = Server()
     server.start()
 
 
@@ -4,14 +4,21 @@ Handles individual client connections and RTSP protocol
 """
 
 import sys
+import math
 import traceback
 import threading
 import socket
 from random import randint
-from time import sleep
+from time import time
 
-from RtpPacket import RtpPacket
-from VideoStream import VideoStream
+from RtpPacket import RtpEncoder
+from FrameStore import FrameStore
+from BroadcastChannel import BroadcastChannel
+from FramePacer import FramePacer
+from BatchSender import BatchSender
+from BitrateAdapter import BitrateAdapter
+from RenditionLadder import loadManifest
+from Rtcp import RtcpEndpoint, ReceiverReport, SenderReport, packSenderReport, ntpTime, ntpMiddle
 import config
 
 
@@ -32,6 +39,7 @@ class ServerWorker:
     OK_200 = 0
     FILE_NOT_FOUND_404 = 1
     CON_ERR_500 = 2
+    INVALID_RANGE_457 = 3
     
     clientInfo = {}
     
@@ -61,13 +69,17 @@ class ServerWorker:
                 print(f'[{threadName}] Error: {e}')
                 break
         
-        # Clean up
-        if self.clientInfo['session'] in self.clientInfo:
-            if 'videoStream' in self.clientInfo:
-                self.clientInfo['videoStream'].close()
-        
+        self.cleanup()
         print(f'[{threadName}] Connection closed')
     
+    def cleanup(self):
+        """Release session resources (also when the client disconnects without TEARDOWN)"""
+        if self.state == self.PLAYING:
+            self.stopPlayback()
+        if 'channel' in self.clientInfo:
+            BroadcastChannel.release(self.clientInfo.pop('channel'))
+        self.closeStreams()
+    
     def processRtspRequest(self, data):
         """Parse and handle RTSP request"""
         request = data.split('\n')
@@ -85,15 +97,8 @@ class ServerWorker:
                 try:
                     # Get filename from request
                     filename = line1[1]
-                    
-                    # Open video stream
-                    self.clientInfo['videoStream'] = VideoStream(filename)
-                    
-                    # Generate session ID
-                    self.clientInfo['session'] = randint(100000, 999999)
-                    
-                    # Send RTSP reply
-                    self.replyRtsp(self.OK_200, seqNum)
+                    multicast = False
+                    startFrame = 0
                     
                     # Get RTP port from request
                     for line in request:
@@ -102,15 +107,48 @@ class ServerWorker:
                             parts = line.split(';')
                             for part in parts:
                                 if 'client_port' in part:
-                                    self.clientInfo['rtpPort'] = int(part.split('=')[1].split('-')[0])
+                                    ports = part.split('=')[1].split('-')
+                                    self.clientInfo['rtpPort'] = int(ports[0])
+                                    self.clientInfo['rtcpPort'] = int(ports[1]) if len(ports) > 1 else int(ports[0]) + 1
+                                elif part.strip() == 'multicast':
+                                    multicast = True
+                        elif line.startswith('Range:') and 'npt=' in line:
+                            # Start position of a multicast channel
+                            try:
+                                startFrame = self.parseRangeStart(line)
+                            except ValueError:
+                                print(f'[RTSP] Error: Invalid range: {line.strip()}')
+                                self.replyRtsp(self.INVALID_RANGE_457, seqNum)
+                                return
+                    
+                    if multicast or config.LIVE_CHANNELS:
+                        # Attach to the shared playhead; live channels have one per file
+                        if not multicast:
+                            startFrame = 0
+                        self.clientInfo['channel'] = self.openChannel(filename, startFrame, multicast)
+                        transport = self.clientInfo['channel'].transport()
+                    else:
+                        # Open video stream on the process-wide shared mapping,
+                        # or every rendition if the file has a ladder
+                        self.openStreams(filename)
+                        transport = self.unicastTransport()
                     
-                    # Update state
+                    # Generate session ID
+                    self.clientInfo['session'] = randint(100000, 999999)
+                    
+                    # Update state before replying so the reply carries the Session header
                     self.state = self.READY
+                    
+                    # Send RTSP reply
+                    self.replyRtsp(self.OK_200, seqNum, transport)
                     print(f'[RTSP] State changed to READY. Session: {self.clientInfo["session"]}')
                     
                 except IOError:
                     print('[RTSP] Error: Video file not found')
                     self.replyRtsp(self.FILE_NOT_FOUND_404, seqNum)
+                except RuntimeError as e:
+                    print(f'[RTSP] Error: {e}')
+                    self.replyRtsp(self.CON_ERR_500, seqNum)
         
         elif requestType == self.PLAY:
             if self.state == self.READY:
@@ -118,16 +156,16 @@ class ServerWorker:
                 
                 self.state = self.PLAYING
                 
-                # Create RTP socket
-                self.clientInfo['rtpSocket'] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                # Create RTP socket (channel sessions use the channel's)
+                if 'rtpSocket' not in self.clientInfo and 'channel' not in self.clientInfo:
+                    self.clientInfo['rtpSocket'] = self.openRtpSocket()
+                    self.clientInfo['rtpSender'] = self.openRtpSender(self.clientInfo['rtpSocket'])
                 
                 # Send RTSP reply
                 self.replyRtsp(self.OK_200, seqNum)
                 
                 # Start sending video frames
-                self.clientInfo['event'] = threading.Event()
-                self.clientInfo['worker'] = threading.Thread(target=self.sendRtp)
-                self.clientInfo['worker'].start()
+                self.startPlayback()
                 print(f'[RTSP] State changed to PLAYING')
         
         elif requestType == self.PAUSE:
@@ -136,8 +174,8 @@ class ServerWorker:
                 
                 self.state = self.READY
                 
-                # Stop the RTP streaming thread
-                self.clientInfo['event'].set()
+                # Stop the RTP stream
+                self.stopPlayback()
                 
                 # Send RTSP reply
                 self.replyRtsp(self.OK_200, seqNum)
@@ -148,72 +186,315 @@ class ServerWorker:
             
             # Stop streaming if playing
             if self.state == self.PLAYING:
-                self.clientInfo['event'].set()
+                self.stopPlayback()
+            self.state = self.INIT
             
             # Send RTSP reply
             self.replyRtsp(self.OK_200, seqNum)
             
             # Close sockets
             if 'rtpSocket' in self.clientInfo:
-                self.clientInfo['rtpSocket'].close()
+                self.clientInfo.pop('rtpSender')
+                self.closeRtpSocket(self.clientInfo.pop('rtpSocket'))
+            
+            # Leave the shared channel
+            if 'channel' in self.clientInfo:
+                BroadcastChannel.release(self.clientInfo.pop('channel'))
             
-            # Close video stream
-            if 'videoStream' in self.clientInfo:
-                self.clientInfo['videoStream'].close()
+            # Close video streams
+            self.closeStreams()
+    
+    def parseRangeStart(self, line):
+        """
+        Return the start frame of a 'Range: npt=start-[end]' header
+        
+        The start is seconds or hh:mm:ss[.frac]; 'now' and an empty start
+        mean the beginning. Frames past the end are clamped by the channel.
+        
+        Raises:
+            ValueError: If the start is not a valid time
+        """
+        start = line.split('npt=', 1)[1].split('-', 1)[0].strip()
+        if start in ('', 'now'):
+            return 0
+        
+        seconds = 0.0
+        for part in start.split(':'):
+            seconds = seconds * 60 + float(part)
+        if not math.isfinite(seconds) or start.count(':') > 2:
+            raise ValueError(f'invalid npt time {start!r}')
+        return max(0, int(seconds * config.FRAME_RATE))
+    
+    def openStreams(self, filename):
+        """
+        Open the session's video stream, or every rendition of its ladder
+        
+        Raises:
+            IOError: If a video file cannot be opened
+        """
+        manifest = loadManifest(filename)
+        if manifest is None or not manifest['renditions']:
+            self.clientInfo['videoStream'] = FrameStore.open(filename)
+            return
+        
+        streams = []
+        try:
+            for rendition in manifest['renditions']:
+                streams.append(FrameStore.open(rendition['file']))
+        except IOError:
+            for stream in streams:
+                stream.close()
+            raise
+        
+        adapter = BitrateAdapter(manifest['renditions'])
+        self.clientInfo['renditions'] = streams
+        self.clientInfo['bitrate'] = adapter
+        self.clientInfo['videoStream'] = streams[adapter.current]
+        print(f'[ABR] {filename}: {len(streams)} renditions, starting at {adapter.name()}')
+    
+    def closeStreams(self):
+        """Close the session's video stream (and the other renditions of its ladder)"""
+        if 'rtcpAddr' in self.clientInfo:
+            RtcpEndpoint.unregister(self.clientInfo.pop('rtcpAddr'), self)
+        for stream in self.clientInfo.pop('renditions', []):
+            stream.close()
+        self.clientInfo.pop('bitrate', None)
+        if 'videoStream' in self.clientInfo:
+            self.clientInfo['videoStream'].close()
+    
+    def unicastTransport(self):
+        """Register for the client's receiver reports and return the SETUP reply's Transport"""
+        rtcpAddr = (self.clientInfo['addr'][0], self.clientInfo.get('rtcpPort', self.clientInfo['rtpPort'] + 1))
+        self.clientInfo['rtcpAddr'] = rtcpAddr
+        RtcpEndpoint.register(rtcpAddr, self)
+        return (f'RTP/UDP;unicast;client_port={self.clientInfo["rtpPort"]}-{rtcpAddr[1]};'
+                f'rtcp_port={config.RTCP_PORT}')
+    
+    def receiveRtcp(self, reports):
+        """Handle RTCP reports from the client (called from the RTCP endpoint)"""
+        for report in reports:
+            if not isinstance(report, ReceiverReport):
+                continue
+            
+            # Round trip from the echoed sender report: arrival - LSR - DLSR
+            rtt = None
+            if report.lsr:
+                rtt = ((ntpMiddle(ntpTime()) - report.lsr - report.dlsr) & 0xFFFFFFFF) / 65536
+            self.clientInfo['receiverReport'] = report
+            self.clientInfo['rtt'] = rtt
+            print(f'[RTCP] Session {self.clientInfo["session"]}: lost {report.fractionLost:.1%} '
+                  f'(total {report.cumulativeLost}), jitter {report.jitter}, highest seq {report.highestSeq}'
+                  + (f', RTT {rtt * 1000:.1f} ms' if rtt is not None else ''))
+            
+            adapter = self.clientInfo.get('bitrate')
+            if adapter is not None and self.state == self.PLAYING and adapter.update(report):
+                # Switched by the sender at the next frame boundary
+                print(f'[ABR] Session {self.clientInfo["session"]}: switching to {adapter.name(adapter.target)}')
+    
+    def senderReport(self):
+        """Return an RTCP sender report for the session's stream, or None before the first frame"""
+        encoder = self.clientInfo.get('rtpEncoder')
+        if encoder is None or encoder.lastTime is None:
+            return None
+        
+        # RTP timestamp of the current instant, extrapolated from the last frame
+        now = time()
+        timestamp = encoder.lastTimestamp + int((now - encoder.lastTime) * config.RTP_CLOCK_RATE)
+        return packSenderReport(SenderReport(encoder.ssrc, ntpTime(now), timestamp,
+                                             encoder.packetCount, encoder.octetCount))
+    
+    def qosStats(self):
+        """Return the session's QoS statistics for the server's stats table"""
+        encoder = self.clientInfo.get('rtpEncoder')
+        report = self.clientInfo.get('receiverReport')
+        adapter = self.clientInfo.get('bitrate')
+        rtt = self.clientInfo.get('rtt')
+        return {
+            'session': self.clientInfo['session'],
+            'client': f'{self.clientInfo["addr"][0]}:{self.clientInfo["rtpPort"]}',
+            'rendition': adapter.name() if adapter is not None else '-',
+            'packetsSent': encoder.packetCount if encoder else 0,
+            'octetsSent': encoder.octetCount if encoder else 0,
+            'fractionLost': report.fractionLost if report else 0.0,
+            'cumulativeLost': report.cumulativeLost if report else 0,
+            'jitterMs': report.jitter * 1000 / config.RTP_CLOCK_RATE if report else 0.0,
+            'rttMs': rtt * 1000 if rtt is not None else None
+        }
+    
+    def switchRendition(self, index):
+        """Continue the stream from another rendition at the same frame"""
+        adapter = self.clientInfo['bitrate']
+        current = self.clientInfo['videoStream']
+        stream = self.clientInfo['renditions'][index]
+        stream.seekFrame(min(current.frameNbr(), stream.frameCount()))
+        self.clientInfo['videoStream'] = stream
+        adapter.current = index
+        adapter.switches += 1
+        print(f'[ABR] Session {self.clientInfo["session"]}: now sending {adapter.name()} '
+              f'from frame {stream.frameNbr()}')
+    
+    def openChannel(self, filename, startFrame, multicast):
+        """Attach to the shared live or multicast channel for a file and start frame"""
+        return BroadcastChannel.acquire(filename, startFrame, multicast)
+    
+    def openRtpSocket(self):
+        """Create the UDP socket used to send RTP packets"""
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    
+    def openRtpSender(self, rtpSocket):
+        """Create the batch sender that sends each frame's packets together"""
+        return BatchSender(rtpSocket)
+    
+    def closeRtpSocket(self, rtpSocket):
+        """Close the session's RTP socket"""
+        rtpSocket.close()
+    
+    def startPlayback(self):
+        """Start the session's own stream, or join its shared channel"""
+        if 'channel' in self.clientInfo:
+            self.clientInfo['channel'].join(self)
+        else:
+            if 'bitrate' in self.clientInfo:
+                self.clientInfo['bitrate'].resume()
+            self.startStreaming()
+    
+    def stopPlayback(self):
+        """Stop the session's own stream, or leave its shared channel"""
+        if 'channel' in self.clientInfo:
+            self.clientInfo['channel'].leave(self)
+        else:
+            self.stopStreaming()
+    
+    def startStreaming(self):
+        """Start a thread that sends video frames"""
+        self.startPacer()
+        self.clientInfo['event'] = threading.Event()
+        self.clientInfo['worker'] = threading.Thread(target=self.sendRtp)
+        self.clientInfo['worker'].start()
+    
+    def stopStreaming(self):
+        """Stop the sending thread and wait for it to finish"""
+        self.clientInfo['event'].set()
+        # The thread may be mid-frame; closing the streams under it would
+        # release the frame store's view while nextFrame() still reads it
+        worker = self.clientInfo.pop('worker', None)
+        if worker is not None and worker is not threading.current_thread():
+            worker.join()
     
     def sendRtp(self):
         """Send video frames via RTP"""
         print('[RTP] Starting video stream')
         
+        pacer = self.clientInfo['pacer']
         while True:
-            # Check if stopped
-            if self.clientInfo['event'].is_set():
+            # Wait for the frame's deadline; None means stopped
+            skip = pacer.wait(self.clientInfo['event'])
+            if skip is None:
                 break
             
-            # Get next frame
-            data = self.clientInfo['videoStream'].nextFrame()
+            if skip:
+                self.skipFrames(skip)
+            self.sendFrame()
+        
+        self.stopPacer()
+        print('[RTP] Stopped video stream')
+    
+    def startPacer(self, start=None):
+        """Start (or resume) the session's absolute-deadline frame clock, first frame due at start"""
+        if 'pacer' not in self.clientInfo:
+            self.clientInfo['pacer'] = FramePacer()
+        self.clientInfo['pacer'].restart(start)
+    
+    def stopPacer(self):
+        """Pause the frame clock and report the session's lateness statistics"""
+        self.clientInfo['pacer'].pause()
+        print(f'[RTP] Pacing: {self.clientInfo["pacer"].summary()}')
+    
+    def skipFrames(self, count):
+        """Advance the video past frames that are already overdue"""
+        # Skipped frames still take up media time
+        self.clientInfo['mediaFrame'] = self.clientInfo.get('mediaFrame', 0) + count
+        stream = self.clientInfo['videoStream']
+        stream.seekFrame((stream.frameNbr() + count) % max(1, stream.frameCount()))
+    
+    def sendFrame(self):
+        """Send the next frame to the client, looping at the end of the video"""
+        self.queueFrame()
+        try:
+            self.clientInfo['rtpSender'].flush()
+        except Exception as e:
+            print(f'[RTP] Error sending frame: {e}')
+    
+    def queueFrame(self):
+        """Packetize the next frame onto the session's RTP sender"""
+        # Change rendition between frames, so the client never gets a mixed frame
+        adapter = self.clientInfo.get('bitrate')
+        if adapter is not None and adapter.target != adapter.current:
+            self.switchRendition(adapter.target)
+        
+        # Get next frame
+        data = self.clientInfo['videoStream'].nextFrame()
+        
+        if data:
+            frameNumber = self.clientInfo['videoStream'].frameNbr()
             
-            if data:
-                frameNumber = self.clientInfo['videoStream'].frameNbr()
+            try:
+                # Create RTP packets, one per MTU-sized fragment
+                fragments = self.clientInfo['videoStream'].fragments(frameNumber - 1)
+                packets = self.packetizeFrame(data, fragments)
+                self.clientInfo['mediaFrame'] = self.clientInfo.get('mediaFrame', 0) + 1
                 
-                try:
-                    # Create RTP packet
-                    packet = RtpPacket()
-                    packet.encode(2, 0, 0, 0, frameNumber, 0, 26, 0, data)
-                    
-                    # Send packet
-                    self.clientInfo['rtpSocket'].sendto(
-                        packet.getPacket(),
-                        (self.clientInfo['addr'][0], self.clientInfo['rtpPort'])
-                    )
-                    
-                    print(f'[RTP] Sent frame #{frameNumber}')
-                    
-                except Exception as e:
-                    print(f'[RTP] Error sending frame: {e}')
-            else:
-                # End of video, reset for loop
-                self.clientInfo['videoStream'].reset()
-                print('[RTP] End of video, restarting...')
-            
-            # Frame rate control (24 fps = ~42ms per frame)
-            sleep(1.0 / config.FRAME_RATE)
+                # Queue packets; the sender batches them into one system call
+                destination = (self.clientInfo['addr'][0], self.clientInfo['rtpPort'])
+                self.clientInfo['rtpSender'].addMany(packets, destination)
+                
+                print(f'[RTP] Sent frame #{frameNumber} ({len(packets)} packets)')
+                
+            except Exception as e:
+                print(f'[RTP] Error sending frame: {e}')
+        else:
+            # End of video, reset for loop; the empty tick still passes media time
+            self.clientInfo['videoStream'].reset()
+            self.clientInfo['mediaFrame'] = self.clientInfo.get('mediaFrame', 0) + 1
+            print('[RTP] End of video, restarting...')
+    
+    def packetizeFrame(self, data, fragments=None):
+        """
+        Split a JPEG frame into (header, payload) RTP packets carrying RFC 2435 fragments
         
-        print('[RTP] Stopped video stream')
+        Args:
+            data: JPEG frame
+            fragments: The frame's cached RTP payloads, if the video has a
+                       packet cache; only the RTP headers are then written
+        """
+        if 'rtpEncoder' not in self.clientInfo:
+            self.clientInfo['rtpEncoder'] = RtpEncoder()
+        
+        # Media time of the frame on the 90 kHz clock, shared by all its fragments
+        encoder = self.clientInfo['rtpEncoder']
+        timestamp = encoder.frameTimestamp(self.clientInfo.get('mediaFrame', 0))
+        if fragments is not None:
+            return encoder.encodeFragments(fragments, timestamp)
+        return encoder.encodeFrame(data, timestamp)
     
-    def replyRtsp(self, code, seq):
-        """Send RTSP reply to client"""
+    def replyRtsp(self, code, seq, transport=None):
+        """Send RTSP reply to client (transport: Transport header value, if any)"""
         if code == self.OK_200:
             reply = f'{config.RTSP_VER} 200 OK\n'
             reply += f'CSeq: {seq}\n'
             if self.state == self.READY:
                 reply += f'Session: {self.clientInfo["session"]}\n'
+            if transport:
+                reply += f'Transport: {transport}\n'
         elif code == self.FILE_NOT_FOUND_404:
             reply = f'{config.RTSP_VER} 404 NOT FOUND\n'
             reply += f'CSeq: {seq}\n'
         elif code == self.CON_ERR_500:
             reply = f'{config.RTSP_VER} 500 CONNECTION ERROR\n'
             reply += f'CSeq: {seq}\n'
+        elif code == self.INVALID_RANGE_457:
+            reply = f'{config.RTSP_VER} 457 INVALID RANGE\n'
+            reply += f'CSeq: {seq}\n'
         
         try:
             self.clientInfo['socket'].send(reply.encode())
@@ -3,17 +3,109 @@ Video Converter Utility
 Converts standard video files to MJPEG format for streaming
 """
 
+import os
 import cv2
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
+from MjpegContainer import MjpegWriter, isContainer
+from FrameIndex import FrameIndex
+from RtpPacket import jpegDimensions
+from RenditionLadder import manifestPath, renditionPath, writeManifest
+import config
 
-def convert_video_to_mjpeg(input_file, output_file='movie.Mjpeg'):
+
+def read_chunks(cap, chunk_size):
+    """Decode frames from a capture and yield them in lists of up to chunk_size"""
+    while True:
+        chunk = []
+        while len(chunk) < chunk_size:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            chunk.append(frame)
+        
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+
+
+def _init_encoder():
+    """Keep each encoder process on one thread so the pool does not oversubscribe the CPUs"""
+    cv2.setNumThreads(1)
+
+
+def _encode_chunk(frames, targets):
+    """
+    JPEG-encode a chunk of frames at every target
+    
+    Args:
+        frames: Decoded frames
+        targets: List of (width, height, quality); a width of None keeps
+                 the source size
+    
+    Returns:
+        One list per frame with a JPEG per target (None where encoding fails)
+    """
+    encoded = []
+    for frame in frames:
+        jpegs = []
+        for width, height, quality in targets:
+            image = frame
+            if width is not None and (width, height) != (frame.shape[1], frame.shape[0]):
+                image = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            ret, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            jpegs.append(jpeg.tobytes() if ret else None)
+        encoded.append(jpegs)
+    return encoded
+
+
+def encode_frames(cap, targets, workers=1):
+    """
+    Decode a capture once and yield each frame JPEG-encoded at every target, in order
+    
+    With more than one worker, this process decodes and hands chunks of
+    config.CONVERT_CHUNK_FRAMES frames to a pool of encoder processes.
+    At most CONVERT_QUEUE_DEPTH chunks per worker are in flight, so memory
+    stays flat however long the video is. Results are collected in
+    submission order, so frames come out in their original order.
+    
+    Args:
+        cap: Opened cv2.VideoCapture
+        targets: List of (width, height, quality), see _encode_chunk
+        workers: Encoder processes; 1 encodes in this process
+    """
+    if workers <= 1:
+        for chunk in read_chunks(cap, 1):
+            yield from _encode_chunk(chunk, targets)
+        return
+    
+    max_pending = workers * config.CONVERT_QUEUE_DEPTH
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_encoder) as pool:
+        pending = deque()
+        for chunk in read_chunks(cap, config.CONVERT_CHUNK_FRAMES):
+            pending.append(pool.submit(_encode_chunk, chunk, targets))
+            
+            # Bounded queue: wait for the oldest chunk before decoding more
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        
+        while pending:
+            yield from pending.popleft().result()
+
+
+def convert_video_to_mjpeg(input_file, output_file='movie.Mjpeg', workers=None, quality=80):
     """
     Convert a video file to MJPEG format suitable for streaming
     
     Args:
         input_file: Path to input video file (mp4, avi, etc.)
         output_file: Path to output MJPEG file
+        workers: JPEG encoder processes (defaults to config.CONVERT_WORKERS;
+                 0 means one per CPU, 1 encodes in this process)
+        quality: JPEG quality (0-100)
     """
     print(f"Converting {input_file} to MJPEG format...")
     
@@ -25,32 +117,28 @@ def convert_video_to_mjpeg(input_file, output_file='movie.Mjpeg'):
         return False
     
     # Get video properties
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    fps = cap.get(cv2.CAP_PROP_FPS) or config.FRAME_RATE
     frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    
+    print(f"Video properties: {frame_count} frames at {fps:g} FPS, {width}x{height}")
     
-    print(f"Video properties: {frame_count} frames at {fps} FPS")
+    workers = config.CONVERT_WORKERS if workers is None else workers
+    workers = workers or os.cpu_count() or 1
+    if workers > 1:
+        print(f"Encoding with {workers} worker processes")
     
-    # Open output file
-    with open(output_file, 'wb') as f:
+    # Open output container
+    with MjpegWriter(output_file, fps, width, height) as f:
         frame_num = 0
         
-        while True:
-            ret, frame = cap.read()
-            
-            if not ret:
-                break
-            
-            # Encode frame as JPEG
-            ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-            
-            if ret:
-                # Get frame data
-                frame_data = jpeg.tobytes()
-                frame_length = len(frame_data)
-                
-                # Write frame length (5 bytes) followed by frame data
-                f.write(str(frame_length).zfill(5).encode())
-                f.write(frame_data)
+        # Frames arrive JPEG-encoded and in order, from this process or the pool
+        for jpegs in encode_frames(cap, [(None, None, quality)], workers):
+            jpeg = jpegs[0]
+            if jpeg is not None:
+                # Write frame data (length and CRC are recorded by the container)
+                f.write(jpeg)
                 
                 frame_num += 1
                 if frame_num % 10 == 0:
@@ -64,6 +152,127 @@ def convert_video_to_mjpeg(input_file, output_file='movie.Mjpeg'):
     return True
 
 
+def ladder_targets(width, height, ladder=None):
+    """
+    Pick the renditions to generate for a source size
+    
+    Renditions taller than the source are skipped (no upscaling); if that
+    leaves none, the top rendition is made at the source size.
+    
+    Args:
+        width: Source width in pixels
+        height: Source height in pixels
+        ladder: List of (name, height, quality) (defaults to config.RENDITION_LADDER)
+    
+    Returns:
+        List of (name, width, height, quality)
+    """
+    ladder = ladder or config.RENDITION_LADDER
+    targets = []
+    for name, target_height, quality in ladder:
+        if target_height > height:
+            continue
+        # Keep the aspect ratio; JPEG sizes are kept even for chroma subsampling
+        target_width = max(2, round(width * target_height / height / 2) * 2)
+        targets.append((name, target_width, target_height, quality))
+    
+    if not targets:
+        name, _, quality = ladder[0]
+        targets.append((name, width, height, quality))
+    return targets
+
+
+def convert_video_to_ladder(input_file, output_base=None, workers=None, ladder=None):
+    """
+    Convert a video to several MJPEG renditions in one decode pass
+    
+    Every rendition gets every frame, so frame numbers line up across the
+    ladder. A frame that fails to encode in any rendition is left out of
+    all of them. A JSON manifest describing the renditions is written next
+    to them.
+    
+    Args:
+        input_file: Path to input video file
+        output_base: Path prefix for the outputs (defaults to the input
+                     name); renditions are written to <base>_<name>.Mjpeg
+        workers: JPEG encoder processes (see convert_video_to_mjpeg)
+        ladder: List of (name, height, quality) (defaults to config.RENDITION_LADDER)
+    """
+    print(f"Converting {input_file} to an MJPEG rendition ladder...")
+    
+    cap = cv2.VideoCapture(input_file)
+    if not cap.isOpened():
+        print(f"Error: Could not open video file {input_file}")
+        return False
+    
+    fps = cap.get(cv2.CAP_PROP_FPS) or config.FRAME_RATE
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    
+    output_base = output_base or os.path.splitext(input_file)[0]
+    targets = ladder_targets(width, height, ladder)
+    workers = config.CONVERT_WORKERS if workers is None else workers
+    workers = workers or os.cpu_count() or 1
+    
+    print(f"Video properties: {frame_count} frames at {fps:g} FPS, {width}x{height}")
+    for name, target_width, target_height, quality in targets:
+        print(f"  {name}: {target_width}x{target_height} at quality {quality}")
+    
+    writers = [MjpegWriter(renditionPath(output_base, name), fps, target_width, target_height)
+               for name, target_width, target_height, quality in targets]
+    sizes = [[] for _ in targets]
+    
+    try:
+        frame_num = 0
+        skipped = 0
+        for jpegs in encode_frames(cap, [target[1:] for target in targets], workers):
+            if None in jpegs:
+                # Keep the ladder aligned: drop the frame everywhere
+                skipped += 1
+                print(f"\nWarning: Failed to encode frame {frame_num + skipped}")
+                continue
+            
+            for writer, rendition_sizes, jpeg in zip(writers, sizes, jpegs):
+                writer.write(jpeg)
+                rendition_sizes.append(len(jpeg))
+            
+            frame_num += 1
+            if frame_num % 10 == 0:
+                print(f"Processed {frame_num}/{frame_count} frames", end='\r')
+    finally:
+        for writer in writers:
+            writer.close()
+        cap.release()
+    
+    # Describe the ladder, highest rendition first
+    duration = frame_num / fps if fps else 0
+    manifest = {
+        'source': os.path.basename(input_file),
+        'fps': fps,
+        'frameCount': frame_num,
+        'renditions': [
+            {
+                'name': name,
+                'file': os.path.basename(renditionPath(output_base, name)),
+                'width': target_width,
+                'height': target_height,
+                'quality': quality,
+                'bitrateKbps': round(sum(rendition_sizes) * 8 / duration / 1000, 1) if duration else 0,
+                'maxFrameBytes': max(rendition_sizes, default=0)
+            }
+            for (name, target_width, target_height, quality), rendition_sizes in zip(targets, sizes)
+        ]
+    }
+    writeManifest(manifestPath(output_base), manifest)
+    
+    print(f"\nLadder complete! {frame_num} frames in {len(targets)} renditions, "
+          f"manifest {manifestPath(output_base)}")
+    for rendition in manifest['renditions']:
+        print(f"  {rendition['file']}: {rendition['bitrateKbps']} kbps")
+    return True
+
+
 def create_test_video(output_file='movie.Mjpeg', duration=10, fps=24):
     """
     Create a simple test video with animated content
@@ -80,7 +289,7 @@ def create_test_video(output_file='movie.Mjpeg', duration=10, fps=24):
     width, height = 640, 480
     total_frames = duration * fps
     
-    with open(output_file, 'wb') as f:
+    with MjpegWriter(output_file, fps, width, height) as f:
         for frame_num in range(total_frames):
             # Create frame with changing colors and text
             frame = np.zeros((height, width, 3), dtype=np.uint8)
@@ -105,12 +314,8 @@ def create_test_video(output_file='movie.Mjpeg', duration=10, fps=24):
             ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
             
             if ret:
-                frame_data = jpeg.tobytes()
-                frame_length = len(frame_data)
-                
                 # Write frame
-                f.write(str(frame_length).zfill(5).encode())
-                f.write(frame_data)
+                f.write(jpeg.tobytes())
                 
                 if (frame_num + 1) % 10 == 0:
                     print(f"Created {frame_num + 1}/{total_frames} frames", end='\r')
@@ -118,13 +323,56 @@ def create_test_video(output_file='movie.Mjpeg', duration=10, fps=24):
         print(f"\nTest video created: {output_file}")
 
 
+def rewrite_mjpeg(input_file, output_file=None, fps=None):
+    """
+    Rewrite a legacy MJPEG file (5-digit ASCII length prefixes) as a container
+    
+    Args:
+        input_file: Path to the legacy MJPEG file
+        output_file: Path to the new file (defaults to replacing input_file)
+        fps: Frame rate to record (defaults to config.FRAME_RATE, the rate
+             legacy files were always played at)
+    """
+    if isContainer(input_file):
+        print(f"{input_file} is already a container")
+        return False
+    
+    index = FrameIndex.build(input_file)
+    if len(index) == 0:
+        print(f"Error: No frames found in {input_file}")
+        return False
+    
+    target = output_file or input_file
+    tmp_file = f"{target}.{os.getpid()}.tmp"
+    
+    with open(input_file, 'rb') as src:
+        # Take the resolution from the first frame
+        offset, length = index.frame(0)
+        src.seek(offset)
+        width, height = jpegDimensions(src.read(length))
+        
+        with MjpegWriter(tmp_file, fps or config.FRAME_RATE, width, height) as f:
+            for frame_num in range(len(index)):
+                offset, length = index.frame(frame_num)
+                src.seek(offset)
+                f.write(src.read(length))
+    
+    os.replace(tmp_file, target)
+    print(f"Rewrote {input_file} -> {target}: {len(index)} frames, {width}x{height}")
+    return True
+
+
 def main():
     """Main entry point"""
     if len(sys.argv) < 2:
         print("Video Converter Utility")
         print("\nUsage:")
-        print("  python VideoConverter.py <input_video>           - Convert existing video")
+        print("  python VideoConverter.py <input_video> [output] [--workers N]")
+        print("                                                   - Convert existing video")
         print("  python VideoConverter.py --test                  - Create test video")
+        print("  python VideoConverter.py --rewrite <file.Mjpeg>  - Rewrite a legacy MJPEG file as a container")
+        print("  python VideoConverter.py --ladder <input_video> [output_base] [--workers N]")
+        print("                                                   - Convert to a rendition ladder")
         print("\nExamples:")
         print("  python VideoConverter.py myvideo.mp4")
         print("  python VideoConverter.py --test")
@@ -133,15 +381,30 @@ def main():
     if sys.argv[1] == '--test':
         # Create test video
         create_test_video('movie.Mjpeg', duration=10, fps=24)
+    elif sys.argv[1] == '--rewrite':
+        # Rewrite legacy files in place
+        for input_file in sys.argv[2:]:
+            rewrite_mjpeg(input_file)
     else:
-        # Convert existing video
-        input_file = sys.argv[1]
+        # Convert existing video (--workers N sets the encoder process count)
+        args = sys.argv[1:]
+        workers = None
+        if '--workers' in args:
+            i = args.index('--workers')
+            workers = int(args[i + 1])
+            del args[i:i + 2]
+        
+        if args[0] == '--ladder':
+            convert_video_to_ladder(args[1], args[2] if len(args) > 2 else None, workers)
+            return
+        
+        input_file = args[0]
         output_file = 'movie.Mjpeg'
         
-        if len(sys.argv) > 2:
-            output_file = sys.argv[2]
+        if len(args) > 1:
+            output_file = args[1]
         
-        convert_video_to_mjpeg(input_file, output_file)
+        convert_video_to_mjpeg(input_file, output_file, workers)
 
 
 if __name__ == '__main__':
@@ -5,6 +5,8 @@ Handles video file operations and frame extraction for streaming
 
 import sys
 
+from FrameIndex import FrameIndex
+
 
 class VideoStream:
     """Class to handle video file operations"""
@@ -17,21 +19,21 @@ class VideoStream:
         except:
             raise IOError(f"Could not open video file: {filename}")
         
+        # Offsets of every frame, loaded from the sidecar index when available
+        self.index = FrameIndex.forFile(filename)
         self.frameNum = 0
     
     def nextFrame(self):
         """Get the next frame from the video file"""
+        if self.frameNum >= len(self.index):
+            return None
+        
         try:
-            data = self.file.read(5)  # Get the frame length from the first 5 bytes
-            if data:
-                framelength = int(data)
-                
-                # Read the current frame
-                frame_data = self.file.read(framelength)
-                self.frameNum += 1
-                return frame_data
-            else:
-                return None
+            offset, framelength = self.index.frame(self.frameNum)
+            self.file.seek(offset)
+            frame_data = self.file.read(framelength)
+            self.frameNum += 1
+            return frame_data
         except:
             return None
     
@@ -39,10 +41,26 @@ class VideoStream:
         """Return current frame number"""
         return self.frameNum
     
+    def frameCount(self):
+        """Return total number of frames in the video"""
+        return len(self.index)
+    
+    def info(self):
+        """Return container metadata (fps, width, height, frame count), or None for legacy files"""
+        return self.index.info
+    
+    def seekFrame(self, frameNumber):
+        """
+        Position the stream so the next call to nextFrame returns the given
+        zero-based frame
+        """
+        if not 0 <= frameNumber <= len(self.index):
+            raise ValueError(f"Frame {frameNumber} out of range (0-{len(self.index)})")
+        self.frameNum = frameNumber
+    
     def reset(self):
         """Reset to beginning of file"""
-        self.file.seek(0)
-        self.frameNum = 0
+        self.seekFrame(0)
     
     def close(self):
         """Close the video file"""
@@ -0,0 +1,395 @@
+"""
+Benchmark Suite
+Measures the server hot paths and compares them with a stored baseline so
+performance regressions are caught before they ship:
+
+    stream    VideoStream / FrameStore nextFrame throughput
+    rtp       RtpPacket encode / getPacket / decode and RtpEncoder.encodeFrame cost
+    loopback  End-to-end frames per second, loss and jitter of sessions over loopback
+    capacity  Most concurrent sessions that still receive the target frame rate
+    web       web_server /api/videos listing rate and video serving throughput
+
+Every result has a name, value, unit and direction. Results are written as
+JSON; with a baseline present each one is compared with it, and the run
+exits with status 1 if any got worse by more than the threshold.
+
+Usage:
+    python benchmarks/bench_suite.py [--only stream,rtp,...] [--output FILE]
+                                     [--baseline FILE] [--save-baseline]
+                                     [--threshold 0.1] [--mode threaded|async]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import platform
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from VideoStream import VideoStream
+from FrameStore import FrameStore
+from RtpPacket import RtpPacket, RtpEncoder
+from LoadClient import runLoad, summarize
+from video_catalog import VideoCatalog
+import config
+
+BENCHMARKS = ('stream', 'rtp', 'loopback', 'capacity', 'web')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Runs a server with its ports overridden: argv is mode, RTSP port, RTCP port
+SERVER_BOOTSTRAP = '''
+import sys
+import config
+config.RTSP_PORT = int(sys.argv[2])
+config.RTCP_PORT = int(sys.argv[3])
+config.STATS_INTERVAL = 0
+sys.argv = [sys.argv[0], '--' + sys.argv[1]]
+import Server
+Server.main()
+'''
+
+
+def result(name, value, unit, higherIsBetter=True, **extra):
+    """
+    Build one benchmark result
+    
+    Extra keys are stored with it; 'tolerance' overrides the regression
+    threshold for noisy measurements.
+    """
+    entry = {'name': name, 'value': value, 'unit': unit, 'higherIsBetter': higherIsBetter}
+    entry.update(extra)
+    return entry
+
+
+def measure(fn, iterations, repeat=5):
+    """Return the best seconds per call of fn over repeat timed runs of iterations calls"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        best = min(best, (time.perf_counter() - start) / iterations)
+    return best
+
+
+def firstFrame(videoFile):
+    """Return the first JPEG frame of a video"""
+    stream = VideoStream(videoFile)
+    try:
+        return stream.nextFrame()
+    finally:
+        stream.close()
+
+
+def benchStream(options):
+    """nextFrame throughput of VideoStream (file reads) and FrameStore (shared memory map)"""
+    results = []
+    for name, opener, closer in (('VideoStream', VideoStream, lambda s: s.close()),
+                                 ('FrameStore', FrameStore.open, lambda s: s.close())):
+        stream = opener(options.video)
+        try:
+            frames = octets = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < options.seconds:
+                data = stream.nextFrame()
+                if data is None:
+                    stream.reset()
+                    continue
+                frames += 1
+                octets += len(data)
+            elapsed = time.perf_counter() - start
+        finally:
+            closer(stream)
+        results.append(result(f'stream.{name}.nextFrame', frames / elapsed, 'frames/s'))
+        results.append(result(f'stream.{name}.throughput', octets / elapsed / 1e6, 'MB/s'))
+    return results
+
+
+def benchRtp(options):
+    """Per-call cost of building and parsing RTP packets"""
+    frame = firstFrame(options.video)
+    payload = frame[:config.MTU - 28 - 12]
+    packet = RtpPacket()
+    packet.encode(2, 0, 0, 0, 1, 1, 26, 1234, payload, 0)
+    data = bytes(packet.getPacket())
+    encoder = RtpEncoder()
+    
+    calls = {
+        'rtp.RtpPacket.encode': lambda: packet.encode(2, 0, 0, 0, 1, 1, 26, 1234, payload, 0),
+        'rtp.RtpPacket.getPacket': packet.getPacket,
+        'rtp.RtpPacket.decode': lambda: RtpPacket().decode(data),
+        'rtp.RtpEncoder.encodeFrame': lambda: encoder.encodeFrame(frame, 0)
+    }
+    return [result(name, measure(fn, options.iterations) * 1e6, 'us/call', False)
+            for name, fn in calls.items()]
+
+
+def freePort(kind):
+    """Return a local port that is free right now"""
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind((config.SERVER_HOST, 0))
+        return sock.getsockname()[1]
+
+
+class ServerProcess:
+    """RTSP server run in a child process on free ports, so it does not share the benchmark's GIL"""
+    
+    def __init__(self, mode, video):
+        """Initialize with the server mode ('threaded' or 'async') and the video sessions request"""
+        self.mode = mode
+        self.video = video
+        self.port = freePort(socket.SOCK_STREAM)
+        self.rtcpPort = freePort(socket.SOCK_DGRAM)
+        self.process = None
+    
+    def __enter__(self):
+        """Start the server and wait until it accepts connections"""
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', SERVER_BOOTSTRAP, self.mode, str(self.port), str(self.rtcpPort)],
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection((config.SERVER_HOST, self.port), timeout=0.2).close()
+                return self
+            except OSError:
+                time.sleep(0.05)
+        self.__exit__(None, None, None)
+        raise RuntimeError(f'{self.mode} server did not start')
+    
+    def __exit__(self, *exc):
+        """Stop the server"""
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+    
+    def load(self, count, duration, ramp=0.0):
+        """Run count load client sessions against the server and return their summary"""
+        cpuStart = time.process_time()
+        wallStart = time.perf_counter()
+        sessions = asyncio.run(runLoad(config.SERVER_HOST, self.port, self.video,
+                                       count, duration, ramp))
+        summary = summarize([session.result() for session in sessions])
+        summary['clientCpuPercent'] = 100 * (time.process_time() - cpuStart) / (time.perf_counter() - wallStart)
+        return summary
+
+
+def benchLoopback(options):
+    """Frame rate, loss and jitter a session receives from a local server"""
+    results = []
+    with ServerProcess(options.mode, options.video) as server:
+        for count in (1, 4):
+            summary = server.load(count, options.duration)
+            prefix = f'loopback.{options.mode}.{count}'
+            results.append(result(f'{prefix}.fps', summary['fps']['min'], 'frames/s',
+                                  sessionsOk=summary['sessionsOk']))
+            results.append(result(f'{prefix}.lossPercent', summary['lossPercent']['max'], '%', False))
+            # Sub-millisecond loopback timings swing widely between runs
+            results.append(result(f'{prefix}.jitterMs', summary['jitterMs']['max'], 'ms', False, tolerance=1.0))
+            results.append(result(f'{prefix}.rtspLatencyMs', summary['latencyMs']['p95'], 'ms', False,
+                                  tolerance=1.0))
+    return results
+
+
+def benchCapacity(options):
+    """
+    Most concurrent sessions at which every session still gets the target
+    frame rate without loss: sessions double until a step fails, then the
+    gap between the last passing and first failing count is bisected
+    """
+    target = options.target_fps or config.FRAME_RATE
+    
+    with ServerProcess(options.mode, options.video) as server:
+    
+        def passes(count):
+            summary = server.load(count, options.duration, ramp=min(2.0, count * 0.01))
+            ok = (summary['sessionsFailed'] == 0 and summary['fps']['min'] >= 0.95 * target
+                  and summary['lossPercent']['max'] <= 1.0)
+            print(f"[BENCH] capacity {count:>4} sessions: fps min {summary['fps']['min']:.2f}, "
+                  f"loss max {summary['lossPercent']['max']:.2f}%, client CPU "
+                  f"{summary['clientCpuPercent']:.0f}% -> {'pass' if ok else 'fail'}", file=sys.stderr)
+            return ok, summary
+        
+        passed, failed, lastSummary = 0, None, None
+        count = 1
+        while count <= options.max_sessions:
+            ok, summary = passes(count)
+            if not ok:
+                failed = count
+                break
+            passed, lastSummary = count, summary
+            count *= 2
+        if failed is None and passed < options.max_sessions:
+            ok, summary = passes(options.max_sessions)
+            if ok:
+                passed, lastSummary = options.max_sessions, summary
+            else:
+                failed = options.max_sessions
+        
+        while failed is not None and failed - passed > max(1, passed // 8):
+            count = (passed + failed) // 2
+            ok, summary = passes(count)
+            if ok:
+                passed, lastSummary = count, summary
+            else:
+                failed = count
+    
+    # A saturated load client limits the result, not the server
+    clientCpu = lastSummary['clientCpuPercent'] if lastSummary else 0.0
+    return [result(f'capacity.{options.mode}.maxSessions', passed, 'sessions', targetFps=target,
+                   limitReached=failed is not None, clientCpuPercent=clientCpu)]
+
+
+def benchWeb(options):
+    """Throughput of web_server's /api/video route for 1 MiB ranges and whole-file requests"""
+    import web_server
+    
+    size = options.web_size * 1024 * 1024
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, 'bench.mp4'), 'wb') as f:
+            f.write(os.urandom(size))
+        web_server.catalog = VideoCatalog(folder, web_server.VIDEO_EXTENSIONS)
+        client = web_server.app.test_client()
+        
+        listings = 1000
+        start = time.perf_counter()
+        for _ in range(listings):
+            client.get('/api/videos')
+        listElapsed = time.perf_counter() - start
+        
+        ranges = [(start, start + 1024 * 1024 - 1) for start in range(0, size, 1024 * 1024)]
+        octets = 0
+        start = time.perf_counter()
+        for first, last in ranges:
+            response = client.get('/api/video/bench.mp4', headers={'Range': f'bytes={first}-{last}'})
+            octets += len(response.get_data())
+        rangeElapsed = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        response = client.get('/api/video/bench.mp4')
+        fullOctets = len(response.get_data())
+        fullElapsed = time.perf_counter() - start
+    
+    return [result('web.list.requests', listings / listElapsed, 'requests/s'),
+            result('web.range.throughput', octets / rangeElapsed / 1e6, 'MB/s'),
+            result('web.range.requests', len(ranges) / rangeElapsed, 'requests/s'),
+            result('web.full.throughput', fullOctets / fullElapsed / 1e6, 'MB/s')]
+
+
+RUNNERS = {
+    'stream': benchStream,
+    'rtp': benchRtp,
+    'loopback': benchLoopback,
+    'capacity': benchCapacity,
+    'web': benchWeb
+}
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline run
+    
+    Returns:
+        List of (result, baseline value, relative change, regressed) for the
+        results the baseline also has
+    """
+    previous = {entry['name']: entry['value'] for entry in baseline.get('results', [])}
+    rows = []
+    for entry in results:
+        base = previous.get(entry['name'])
+        if base is None:
+            continue
+        if base:
+            change = (entry['value'] - base) / abs(base)
+        else:
+            # Any move away from zero (e.g. loss appearing) counts in full
+            change = (entry['value'] > 0) - (entry['value'] < 0)
+        worse = -change if entry['higherIsBetter'] else change
+        rows.append((entry, base, change, worse > entry.get('tolerance', threshold)))
+    return rows
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='Server hot path benchmark suite')
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help=f'comma-separated benchmarks to run ({",".join(BENCHMARKS)})')
+    parser.add_argument('--video', default=os.path.join(ROOT, config.VIDEO_FILE), help='MJPEG file to use')
+    parser.add_argument('--mode', choices=('threaded', 'async'), default=config.SERVER_MODE,
+                        help='server mode for loopback and capacity')
+    parser.add_argument('--seconds', type=float, default=1.0, help='time per stream benchmark')
+    parser.add_argument('--iterations', type=int, default=20000, help='calls per timed RTP run')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per loopback or capacity step')
+    parser.add_argument('--target-fps', type=float, default=None,
+                        help='frame rate every session must get in the capacity test (defaults to config.FRAME_RATE)')
+    parser.add_argument('--max-sessions', type=int, default=256, help='largest capacity step')
+    parser.add_argument('--web-size', type=int, default=64, help='size of the web test file (MiB)')
+    parser.add_argument('--output', default=None, help='write results as JSON to this file')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline results to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative change counted as a regression (0.10 = 10%%)')
+    args = parser.parse_args()
+    
+    selected = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = [name for name in selected if name not in RUNNERS]
+    if unknown:
+        parser.error(f'unknown benchmark(s): {", ".join(unknown)}')
+    
+    results = []
+    for name in selected:
+        print(f'[BENCH] Running {name}...', file=sys.stderr)
+        results.extend(RUNNERS[name](args))
+    
+    run = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'video': os.path.basename(args.video),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f'[BENCH] Baseline saved to {args.baseline}', file=sys.stderr)
+    
+    rows = []
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            rows = compare(results, json.load(f), args.threshold)
+    
+    if args.json:
+        print(json.dumps(run, indent=2))
+    else:
+        baselineValues = {entry['name']: (base, change, regressed) for entry, base, change, regressed in rows}
+        print(f"{'benchmark':<36} {'value':>12} {'unit':<11} {'baseline':>12} {'change':>8}")
+        for entry in results:
+            line = f"{entry['name']:<36} {entry['value']:>12.2f} {entry['unit']:<11}"
+            if entry['name'] in baselineValues:
+                base, change, regressed = baselineValues[entry['name']]
+                line += f" {base:>12.2f} {change:>+7.1%}{'  REGRESSION' if regressed else ''}"
+            print(line)
+    
+    regressions = [entry['name'] for entry, _, _, regressed in rows if regressed]
+    if regressions:
+        print(f'[BENCH] {len(regressions)} regression(s) beyond {args.threshold:.0%}: {", ".join(regressions)}',
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
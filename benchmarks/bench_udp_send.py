@@ -0,0 +1,146 @@
+"""
+UDP Send Benchmark
+Compares the per-packet sendto() loop with BatchSender (sendmmsg) for RTP
+fan-out, reporting system calls per frame and packets per second of the send
+phase (packetization is done outside the timed section)
+
+Usage:
+    python benchmarks/bench_udp_send.py [--sessions N] [--frames N] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from BatchSender import BatchSender, sendmmsgAvailable
+from FrameStore import FrameStore
+from ServerWorker import ServerWorker
+import config
+
+
+def openReceivers(count):
+    """Bind one loopback UDP socket per session (never read; the kernel drops overflow)"""
+    receivers = []
+    for _ in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        receivers.append(sock)
+    return receivers
+
+
+def makeSessions(receivers):
+    """Create one ServerWorker per receiver, used only for packetization"""
+    sessions = []
+    for sock in receivers:
+        worker = ServerWorker({'addr': sock.getsockname(), 'rtpPort': sock.getsockname()[1]})
+        sessions.append(worker)
+    return sessions
+
+
+def packetizeTick(sessions, stream):
+    """Packetize the next frame for every session: [(destination, packets)]"""
+    data = stream.nextFrame()
+    if data is None:
+        stream.reset()
+        data = stream.nextFrame()
+    
+    tick = []
+    for worker in sessions:
+        destination = (worker.clientInfo['addr'][0], worker.clientInfo['rtpPort'])
+        tick.append((destination, worker.packetizeFrame(data)))
+    return tick
+
+
+def runLoop(sessions, stream, frames, sock):
+    """Baseline: join header and payload, then one sendto() per packet, as the original sendRtp loop did"""
+    packets = syscalls = 0
+    elapsed = 0.0
+    for _ in range(frames):
+        tick = packetizeTick(sessions, stream)
+        start = time.perf_counter()
+        for destination, framePackets in tick:
+            for packet in framePackets:
+                sock.sendto(b''.join(packet), destination)
+                packets += 1
+                syscalls += 1
+        elapsed += time.perf_counter() - start
+    return packets, syscalls, elapsed
+
+
+def runBatched(sessions, stream, frames, sock, useSendmmsg):
+    """Batched: queue one tick's packets for every session, then flush once"""
+    sender = BatchSender(sock, useSendmmsg=useSendmmsg)
+    elapsed = 0.0
+    for _ in range(frames):
+        tick = packetizeTick(sessions, stream)
+        start = time.perf_counter()
+        for destination, framePackets in tick:
+            sender.addMany(framePackets, destination)
+        sender.flush()
+        elapsed += time.perf_counter() - start
+    return sender.packetsSent + sender.packetsDropped, sender.syscalls, elapsed
+
+
+def benchmark(sessionCount, frames, videoFile):
+    """Run every send path and return a list of result dictionaries"""
+    receivers = openReceivers(sessionCount)
+    sessions = makeSessions(receivers)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    stream = FrameStore.open(videoFile)
+    
+    modes = [('sendto-loop', lambda: runLoop(sessions, stream, frames, sock)),
+             ('batched-fallback', lambda: runBatched(sessions, stream, frames, sock, False))]
+    if sendmmsgAvailable():
+        modes.append(('batched-sendmmsg', lambda: runBatched(sessions, stream, frames, sock, True)))
+    
+    results = []
+    try:
+        for name, run in modes:
+            stream.reset()
+            packets, syscalls, elapsed = run()
+            results.append({
+                'mode': name,
+                'sessions': sessionCount,
+                'frames': frames,
+                'packets': packets,
+                'syscalls': syscalls,
+                'syscallsPerFrame': syscalls / frames,
+                'packetsPerSecond': packets / elapsed if elapsed > 0 else 0.0,
+                'seconds': elapsed
+            })
+    finally:
+        stream.close()
+        sock.close()
+        for r in receivers:
+            r.close()
+    return results
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description='RTP UDP send path benchmark')
+    parser.add_argument('--sessions', type=int, default=50, help='concurrent sessions')
+    parser.add_argument('--frames', type=int, default=48, help='frames (ticks) to send')
+    parser.add_argument('--video', default=config.VIDEO_FILE, help='MJPEG file to send')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+    
+    results = benchmark(args.sessions, args.frames, args.video)
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    print(f"{'mode':<18} {'packets':>9} {'syscalls':>9} {'syscalls/frame':>15} {'packets/s':>11}")
+    for r in results:
+        print(f"{r['mode']:<18} {r['packets']:>9} {r['syscalls']:>9} "
+              f"{r['syscallsPerFrame']:>15.1f} {r['packetsPerSecond']:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,11 +6,56 @@ Configuration file for Video Streaming System
 SERVER_HOST = '127.0.0.1'
 RTSP_PORT = 8554
 RTP_PORT = 25000
+SERVER_MODE = 'threaded'  # 'threaded' (thread per client) or 'async' (single event loop)
+TIMER_WHEEL_SLOTS = 64  # Slots in the async server's pacing timer wheel
+LIVE_CHANNELS = False  # Unicast sessions of a file share one live playhead instead of each starting at frame 0
+MULTICAST_GROUP = '239.255.42.1'  # First multicast group handed out to channels
+MULTICAST_GROUPS = 16  # Consecutive groups available (one channel per file and start position)
+MULTICAST_PORT = 26000  # RTP port of the first group; each group gets the next even port
+MULTICAST_TTL = 1  # Hops multicast packets may travel (1 = local network)
+MULTICAST_INTERFACE = SERVER_HOST  # Interface multicast is sent from
+RTCP_PORT = 8555  # Server UDP port clients send RTCP receiver reports to
+RTCP_INTERVAL = 1.0  # Seconds between RTCP reports (client receiver reports, server sender reports)
+STATS_INTERVAL = 10.0  # Seconds between server session statistics tables (0 = never)
+LOAD_RTP_PORT = 30000  # First local RTP port of the load client; each session takes the next even port
 
 # Video Configuration
 VIDEO_FILE = 'movie.Mjpeg'
 FRAME_RATE = 24  # frames per second
 MAX_PACKET_SIZE = 20480  # Maximum RTP packet size
+MTU = 1500  # Path MTU; frames are fragmented so no RTP packet exceeds it
+RTP_RECV_BUFFER = 4 * 1024 * 1024  # Client UDP receive buffer (bytes)
+JITTER_BUFFER_DELAY = 0.2  # Seconds the client holds frames before playout (absorbs jitter and reordering)
+JITTER_BUFFER_MAX_FRAMES = 64  # Most frames the client's jitter buffer holds
+PLAYOUT_POLL_INTERVAL = 0.01  # Longest the client's playout loop sleeps between checks (seconds)
+DECODE_WORKERS = 2  # Client threads decoding and resizing JPEG frames
+DISPLAY_QUEUE_SIZE = 2  # Decoded frames waiting for the GUI; older ones are dropped
+DISPLAY_POLL_MS = 10  # How often the GUI checks for decoded frames (milliseconds)
+DISPLAY_RESAMPLE = 'bilinear'  # Display resize filter: 'lanczos', 'bicubic', 'bilinear' or 'nearest'
+JPEG_DRAFT = True  # Decode JPEGs at a reduced scale (PIL draft mode) when they are larger than the display
+SENDMMSG_BATCH = 64  # Most RTP packets per sendmmsg() call
+INDEX_SUFFIX = '.idx'  # Sidecar frame index written next to each video file
+PACKET_CACHE = False  # Send pre-built RTP payloads from a packet cache (built on first use)
+PACKET_CACHE_SUFFIX = '.rtp'  # Packet cache written next to each video file
+PACING_POLICY = 'skip'  # Late frames: 'skip' ahead or 'catchup' with a short burst
+MAX_CATCHUP_FRAMES = 3  # Largest burst the 'catchup' policy sends
+RTP_CLOCK_RATE = 90000  # RTP timestamp units per second (RFC 2435)
+ABR_START_RENDITION = 0  # Ladder rendition a session starts with (0 = highest)
+ABR_LOSS_DOWN = 0.05  # Fraction lost in a report interval that steps down one rendition
+ABR_LOSS_UP = 0.01  # Fraction lost at or below which a report counts as clean
+ABR_UP_REPORTS = 3  # Consecutive clean reports before stepping back up
+
+# Conversion Configuration
+CONVERT_WORKERS = 0  # JPEG encoder processes in VideoConverter (0 = one per CPU, 1 = no pool)
+CONVERT_CHUNK_FRAMES = 8  # Decoded frames handed to an encoder process at a time
+CONVERT_QUEUE_DEPTH = 2  # Chunks in flight per encoder process (bounds memory use)
+RENDITION_LADDER = [  # (name, height, JPEG quality) for --ladder, highest first
+    ('720p', 720, 80),
+    ('480p', 480, 75),
+    ('360p', 360, 70),
+    ('240p', 240, 60),
+]
+LADDER_SUFFIX = '.ladder.json'  # Ladder manifest written next to the renditions
 
 # RTSP Methods
 RTSP_VER = 'RTSP/1.0'
@@ -63,6 +63,7 @@ function createVideoCard(video, index) {
     
     card.innerHTML = `
         <div class="video-thumbnail" style="background: ${gradient};">
+            <img class="thumbnail-image" alt="" loading="lazy">
             <i class="fas fa-play-circle"></i>
         </div>
         <div class="video-details">
@@ -80,6 +81,9 @@ function createVideoCard(video, index) {
         </div>
     `;
     
+    // Poster frame over the gradient, once the server has extracted it
+    loadThumbnail(card.querySelector('.thumbnail-image'), video.thumbnail);
+    
     // Add click event to play video
     card.addEventListener('click', () => {
         window.location.href = `/watch/${encodeURIComponent(video.filename)}`;
@@ -88,6 +92,24 @@ function createVideoCard(video, index) {
     return card;
 }
 
+// Load a poster, retrying while the server is still extracting it (202 responses
+// are not images, so they fail to load); the gradient stays if it never arrives
+function loadThumbnail(img, url, attempt = 0) {
+    if (!url) {
+        img.remove();
+        return;
+    }
+    img.onload = () => img.classList.add('loaded');
+    img.onerror = () => {
+        if (attempt < 10) {
+            setTimeout(() => loadThumbnail(img, url, attempt + 1), 2000);
+        } else {
+            img.remove();
+        }
+    };
+    img.src = attempt ? `${url}&retry=${attempt}` : url;
+}
+
 // Search functionality (future enhancement)
 function searchVideos(query) {
     const cards = document.querySelectorAll('.video-card');
@@ -99,6 +99,56 @@ document.addEventListener('DOMContentLoaded', function() {
         video.currentTime = pos * video.duration;
     });
     
+    // Seek preview: the sprite tile for the hovered time
+    const seekPreview = document.getElementById('seek-preview');
+    let spriteLoaded = false;
+    if (seekPreview && seekPreview.dataset.sprite) {
+        loadSprite(seekPreview.dataset.sprite, 0);
+    }
+    
+    // The sprite may still be extracting (202), so retry a few times
+    function loadSprite(url, attempt) {
+        const sprite = new Image();
+        sprite.onload = function() {
+            seekPreview.style.backgroundImage = `url("${sprite.src}")`;
+            spriteLoaded = true;
+        };
+        sprite.onerror = function() {
+            if (attempt < 10) {
+                setTimeout(() => loadSprite(url, attempt + 1), 2000);
+            }
+        };
+        sprite.src = attempt ? `${url}&retry=${attempt}` : url;
+    }
+    
+    progressBar.addEventListener('mousemove', function(e) {
+        if (!spriteLoaded || !video.duration) {
+            return;
+        }
+        const data = seekPreview.dataset;
+        const columns = Number(data.columns);
+        const rows = Number(data.rows);
+        const width = Number(data.tileWidth);
+        const height = Number(data.tileHeight);
+        
+        const rect = progressBar.getBoundingClientRect();
+        const pos = Math.min(Math.max((e.clientX - rect.left) / rect.width, 0), 1);
+        // Tiles are evenly spaced over the video, row by row
+        const tile = Math.min(Math.floor(pos * columns * rows), columns * rows - 1);
+        
+        seekPreview.style.width = width + 'px';
+        seekPreview.style.height = height + 'px';
+        seekPreview.style.backgroundPosition = `-${(tile % columns) * width}px -${Math.floor(tile / columns) * height}px`;
+        seekPreview.style.left = (pos * rect.width) + 'px';
+        seekPreview.style.display = 'block';
+    });
+    
+    progressBar.addEventListener('mouseleave', function() {
+        if (seekPreview) {
+            seekPreview.style.display = 'none';
+        }
+    });
+    
     // Update progress bar
     video.addEventListener('timeupdate', function() {
         const percent = (video.currentTime / video.duration) * 100;
@@ -0,0 +1,10 @@
+"""
+Test configuration
+Puts the project root on the import path, as the benchmarks do, so tests
+import the top-level modules directly
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,107 @@
+"""
+Tests for BatchSender: sendmmsg datagrams match the portable path, read
+straight from read-only mappings
+"""
+
+import mmap
+import socket
+
+import pytest
+
+from BatchSender import BatchSender, sendmmsgAvailable
+
+PAYLOAD = bytes(range(256)) * 16
+
+needs_sendmmsg = pytest.mark.skipif(not sendmmsgAvailable(), reason='sendmmsg is Linux-only')
+
+
+@pytest.fixture
+def receiver():
+    """Loopback UDP socket the datagrams are sent to"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(0.2)
+    yield sock
+    sock.close()
+
+
+@pytest.fixture
+def mapped(tmp_path):
+    """PAYLOAD in a file mapped read-only, as FrameStore and PacketCache map media"""
+    path = tmp_path / 'frames.bin'
+    path.write_bytes(PAYLOAD)
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    yield data
+    data.close()
+
+
+def receive(sock):
+    """Return every datagram waiting on a socket"""
+    datagrams = []
+    while True:
+        try:
+            datagrams.append(sock.recv(65536))
+        except socket.timeout:
+            return datagrams
+
+
+def packets(mapped):
+    """Datagrams built from every kind of buffer the servers queue"""
+    view = memoryview(mapped)
+    header = bytearray(b'HEADER--')
+    return [
+        (memoryview(header), view[0:1000]),  # Encoder header + frame slice
+        (memoryview(header)[:4], view[1000:1400], b'tail'),
+        view[2000:3000],
+        b'plain bytes',
+        bytearray(b'a bytearray'),
+        memoryview(PAYLOAD)[10:20],
+        (b'', view[3000:3100]),
+    ]
+
+
+def expected(packet):
+    """Return the bytes one queued packet should arrive as"""
+    if type(packet) is tuple:
+        return b''.join(bytes(part) for part in packet)
+    return bytes(packet)
+
+
+@pytest.mark.parametrize('useSendmmsg', [pytest.param(True, marks=needs_sendmmsg), False])
+def test_datagrams_match_their_parts(receiver, mapped, useSendmmsg):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = BatchSender(sock, maxBatch=3, useSendmmsg=useSendmmsg)
+    queued = packets(mapped)
+    for packet in queued:
+        sender.add(packet, receiver.getsockname())
+    assert sender.flush() == len(queued)
+    sock.close()
+    
+    assert receive(receiver) == [expected(packet) for packet in queued]
+    assert sender.packetsSent == len(queued)
+    if useSendmmsg:
+        assert sender.syscalls == 3  # Batches of 3, 3 and 1
+
+
+@needs_sendmmsg
+def test_read_only_map_is_released_after_send(receiver, tmp_path):
+    path = tmp_path / 'frames.bin'
+    path.write_bytes(PAYLOAD)
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(data)
+    
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = BatchSender(sock)
+    sender.addMany([view[0:100], view[100:200]], receiver.getsockname())
+    sender.flush()
+    sock.close()
+    assert receive(receiver) == [PAYLOAD[0:100], PAYLOAD[100:200]]
+    
+    # The send holds no buffer once it returns, and the mapping stays read-only
+    with pytest.raises(TypeError):
+        view[0] = 0
+    view.release()
+    data.close()
+    assert data.closed
@@ -0,0 +1,139 @@
+"""
+Tests for the shared live and multicast channels (BroadcastChannel)
+"""
+
+import os
+
+import pytest
+
+from BroadcastChannel import BroadcastChannel
+
+VIDEO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'movie.Mjpeg')
+
+
+class StubSender:
+    """Records the packets queued for each destination instead of sending them"""
+    
+    def __init__(self, sock):
+        self.queued = []
+    
+    def addMany(self, packets, destination):
+        self.queued.append(([bytes(header) + bytes(payload) for header, payload in packets], destination))
+    
+    def flush(self):
+        pass
+
+
+class StubSession:
+    """A playing session as the channel sees it"""
+    
+    def __init__(self, ip, rtpPort):
+        self.clientInfo = {'addr': (ip, 50000), 'rtpPort': rtpPort}
+
+
+@pytest.fixture
+def channels(monkeypatch):
+    """Channels with a stub sender; every channel acquired is released afterwards"""
+    monkeypatch.setattr(BroadcastChannel, 'openRtpSender', lambda self, sock: StubSender(sock))
+    acquired = []
+    
+    def acquire(*args, **kwargs):
+        channel = BroadcastChannel.acquire(*args, **kwargs)
+        acquired.append(channel)
+        return channel
+    
+    yield acquire
+    for channel in acquired:
+        if channel.refCount > 0:
+            BroadcastChannel.release(channel)
+    assert not BroadcastChannel._channels
+    assert not BroadcastChannel._slots
+
+
+def test_acquire_shares_one_channel_per_key(channels):
+    live = channels(VIDEO)
+    assert channels(VIDEO) is live
+    assert channels(VIDEO, -3) is live  # Clamped to frame 0
+    assert live.refCount == 3
+    assert not live.multicast and live.destinations == []
+    
+    later = channels(VIDEO, 5)
+    last = channels(VIDEO, 10 ** 6)
+    assert later is not live and later.startFrame == 5
+    assert last.startFrame == last.stream.frameCount() - 1
+    
+    multicast = channels(VIDEO, multicast=True)
+    assert multicast is not live
+    assert multicast.slot == 0 and multicast.destinations == [(multicast.group, multicast.port)]
+    assert channels(VIDEO, 5, multicast=True).slot == 1
+    
+    assert set(BroadcastChannel._channels) == {(VIDEO, 0, False), (VIDEO, 5, False), (VIDEO, last.startFrame, False),
+                                                (VIDEO, 0, True), (VIDEO, 5, True)}
+
+
+def test_release_closes_on_last_reference(channels):
+    live = channels(VIDEO)
+    channels(VIDEO)
+    multicast = channels(VIDEO, multicast=True)
+    
+    BroadcastChannel.release(live)
+    assert live.refCount == 1
+    assert BroadcastChannel._channels[(VIDEO, 0, False)] is live
+    
+    BroadcastChannel.release(live)
+    assert (VIDEO, 0, False) not in BroadcastChannel._channels
+    assert live.rtpSocket.fileno() == -1
+    
+    BroadcastChannel.release(multicast)
+    assert BroadcastChannel._slots == set()
+    assert channels(VIDEO) is not live  # A new channel once the old one closed
+
+
+def test_join_and_leave_start_and_stop_the_stream(channels):
+    channel = channels(VIDEO)
+    first, second = StubSession('10.0.0.1', 25000), StubSession('10.0.0.2', 25002)
+    
+    channel.join(first)
+    worker = channel.worker
+    assert worker.is_alive()
+    assert channel.destinations == [('10.0.0.1', 25000)]
+    
+    channel.join(second)
+    channel.join(first)
+    assert channel.worker is worker
+    assert sorted(channel.destinations) == [('10.0.0.1', 25000), ('10.0.0.2', 25002)]
+    
+    channel.leave(first)
+    assert worker.is_alive()
+    assert channel.destinations == [('10.0.0.2', 25002)]
+    
+    channel.leave(second)
+    assert not worker.is_alive()
+    assert channel.destinations == []
+    channel.leave(second)
+    
+    channel.join(first)
+    assert channel.worker is not worker and channel.worker.is_alive()
+
+
+def test_frames_are_queued_once_for_every_player(channels):
+    channel = channels(VIDEO)
+    channel.destinations = [('10.0.0.1', 25000), ('10.0.0.2', 25002)]
+    
+    channel.queueFrame()
+    channel.queueFrame()
+    queued = channel.sender.queued
+    assert [destination for packets, destination in queued] == channel.destinations * 2
+    assert queued[0][0] == queued[1][0]  # Same packets for every player
+    assert queued[2][0] != queued[0][0]
+    assert channel.mediaFrame == 2
+
+
+def test_multicast_destinations_ignore_players(channels):
+    channel = channels(VIDEO, multicast=True)
+    session = StubSession('10.0.0.1', 25000)
+    channel.join(session)
+    assert channel.destinations == [(channel.group, channel.port)]
+    channel.leave(session)
+    assert channel.destinations == [(channel.group, channel.port)]
+    assert channel.transport().startswith(f'RTP/UDP;multicast;destination={channel.group};')
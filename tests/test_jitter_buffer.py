@@ -0,0 +1,119 @@
+"""
+Tests for the client jitter buffer: reordering, playout timing and 16/32-bit wraparound
+"""
+
+import pytest
+
+from JitterBuffer import JitterBuffer, seqDelta, timestampDelta
+from RtpPacket import RtpPacket, RtpEncoder, IP_UDP_OVERHEAD, HEADER_SIZE, JPEG_HEADER_SIZE
+
+# Minimal baseline JPEG header (SOI + SOF0 for 64x48) followed by filler
+JPEG = b'\xff\xd8\xff\xc0\x00\x11\x08\x00\x30\x00\x40\x03\x01\x22\x00\x02\x11\x01\x03\x11\x01' + bytes(range(256))
+FRAGMENT = 100
+STEP = 3750  # 90 kHz ticks per frame at 24 fps
+DELAY = 0.2
+
+
+def packetize(encoder, index, jpeg=JPEG):
+    """Return the RTP packets of one frame, decoded as the client sees them"""
+    packets = []
+    for header, payload in encoder.encodeFrame(jpeg, encoder.timestampOffset + index * STEP):
+        packet = RtpPacket()
+        packet.decode(bytes(header) + bytes(payload))
+        packets.append(packet)
+    return packets
+
+
+def make_encoder(seqnum, timestampOffset):
+    """Encoder cutting JPEG into FRAGMENT-byte payloads"""
+    return RtpEncoder(ssrc=1, mtu=FRAGMENT + IP_UDP_OVERHEAD + HEADER_SIZE + JPEG_HEADER_SIZE,
+                      seqnum=seqnum, timestampOffset=timestampOffset)
+
+
+def test_deltas_wrap():
+    assert seqDelta(2, 0xFFFE) == 4
+    assert seqDelta(0xFFFE, 2) == -4
+    assert timestampDelta(100, 0xFFFFFF00) == 356
+    assert timestampDelta(0xFFFFFF00, 100) == -356
+
+
+def test_release_on_media_clock():
+    buffer = JitterBuffer(targetDelay=DELAY, clockRate=90000)
+    encoder = make_encoder(0, 0)
+    for index in range(3):
+        for packet in packetize(encoder, index):
+            buffer.push(packet, arrival=0.0)
+    
+    assert buffer.pop(now=DELAY - 0.001) == []
+    assert buffer.pop(now=DELAY) == [JPEG]
+    assert buffer.nextPlayoutTime() == pytest.approx(DELAY + STEP / 90000)
+    assert buffer.pop(now=DELAY + 2 * STEP / 90000) == [JPEG, JPEG]
+    assert buffer.stats()['framesReleased'] == 3
+
+
+@pytest.mark.parametrize('seqnum, timestampOffset', [
+    (0xFFFF - 5, 0),  # Sequence numbers wrap inside a frame
+    (100, 0xFFFFFFFF - STEP),  # Timestamps wrap between frames
+    (0xFFFF - 3, 0xFFFFFFFF - 2 * STEP),  # Both
+])
+def test_wraparound(seqnum, timestampOffset):
+    buffer = JitterBuffer(targetDelay=DELAY, clockRate=90000)
+    encoder = make_encoder(seqnum, timestampOffset)
+    frames = [packetize(encoder, index, JPEG + bytes([index])) for index in range(4)]
+    for packets in frames:
+        for packet in packets:
+            buffer.push(packet, arrival=0.0)
+    
+    assert buffer.pop(now=DELAY + 4 * STEP / 90000) == [JPEG + bytes([index]) for index in range(4)]
+    assert buffer.stats()['framesDropped'] == 0
+    assert buffer.stats()['latePackets'] == 0
+
+
+def test_reordered_and_duplicate_packets():
+    buffer = JitterBuffer(targetDelay=DELAY, clockRate=90000)
+    encoder = make_encoder(0xFFFE, 0xFFFFFFFF)
+    first, second = packetize(encoder, 0), packetize(encoder, 1)
+    for packet in second[::-1] + first[::-1] + first[:1]:
+        buffer.push(packet, arrival=0.0)
+    
+    assert buffer.pop(now=1.0) == [JPEG, JPEG]
+    assert buffer.stats()['duplicates'] == 1
+
+
+def test_incomplete_frame_is_dropped_and_late_packet_counted():
+    buffer = JitterBuffer(targetDelay=DELAY, clockRate=90000)
+    encoder = make_encoder(0xFFFF, 0)
+    first, second = packetize(encoder, 0), packetize(encoder, 1)
+    for packet in first[:1] + first[2:] + second:
+        buffer.push(packet, arrival=0.0)
+    
+    assert buffer.pop(now=1.0) == [JPEG]
+    buffer.push(first[1], arrival=1.0)
+    stats = buffer.stats()
+    assert stats['framesDropped'] == 1
+    assert stats['latePackets'] == 1
+
+
+def test_malformed_packet_is_not_held():
+    buffer = JitterBuffer(targetDelay=DELAY, clockRate=90000)
+    packet = RtpPacket()
+    packet.decode(bytes(HEADER_SIZE + 3))
+    buffer.push(packet, arrival=0.0)
+    assert len(buffer) == 0
+    assert buffer.stats()['malformed'] == 1
+
+
+def test_underrun_rebuffers():
+    buffer = JitterBuffer(targetDelay=DELAY, clockRate=90000)
+    encoder = make_encoder(0, 0)
+    for packet in packetize(encoder, 0) + packetize(encoder, 1):
+        buffer.push(packet, arrival=0.0)
+    assert buffer.pop(now=DELAY + STEP / 90000) == [JPEG, JPEG]
+    assert buffer.pop(now=DELAY + 3 * STEP / 90000) == []
+    assert buffer.stats()['underruns'] == 1
+    
+    # The next frame is held for the full delay again from its arrival
+    for packet in packetize(encoder, 5):
+        buffer.push(packet, arrival=1.0)
+    assert buffer.pop(now=1.0 + DELAY - 0.001) == []
+    assert buffer.pop(now=1.0 + DELAY) == [JPEG]
@@ -0,0 +1,104 @@
+"""
+Tests for the MJPC container: header, frame table, index recovery and CRC checks
+"""
+
+import pytest
+
+import MjpegContainer
+from MjpegContainer import (MjpegWriter, CONTAINER_HEADER, FRAME_HEADER, isContainer, readHeader,
+                            readIndex, verify)
+
+FRAMES = [b'\xff\xd8first\xff\xd9', b'\xff\xd8' + bytes(range(256)) * 4 + b'\xff\xd9', b'\xff\xd8\xff\xd9']
+
+
+def write_container(path, frames=FRAMES, close=True):
+    """Write frames to a container, optionally leaving it unfinished (no index)"""
+    writer = MjpegWriter(str(path), 29.97, 640, 480)
+    for frame in frames:
+        writer.write(frame)
+    if close:
+        writer.close()
+    else:
+        writer.file.close()
+    return path
+
+
+def read_frames(path):
+    """Return the frames of a container through its frame table"""
+    info, offsets, lengths, crcs = readIndex(str(path))
+    data = path.read_bytes()
+    return [data[offset:offset + length] for offset, length in zip(offsets, lengths)]
+
+
+def test_round_trip(tmp_path):
+    path = write_container(tmp_path / 'movie.Mjpeg')
+    info, offsets, lengths, crcs = readIndex(str(path))
+    assert info.version == MjpegContainer.CONTAINER_VERSION
+    assert (info.width, info.height, info.frameCount) == (640, 480, len(FRAMES))
+    assert info.fps == pytest.approx(29.97)
+    assert list(lengths) == [len(frame) for frame in FRAMES]
+    assert offsets[0] == CONTAINER_HEADER.size + FRAME_HEADER.size
+    assert read_frames(path) == FRAMES
+    assert verify(str(path)) == []
+
+
+def test_empty_container(tmp_path):
+    path = write_container(tmp_path / 'empty.Mjpeg', frames=[])
+    info, offsets, lengths, crcs = readIndex(str(path))
+    assert info.frameCount == 0
+    assert len(offsets) == 0
+
+
+def test_is_container(tmp_path):
+    legacy = tmp_path / 'legacy.Mjpeg'
+    legacy.write_bytes(b'00012' + FRAMES[0])
+    assert isContainer(str(write_container(tmp_path / 'movie.Mjpeg')))
+    assert not isContainer(str(legacy))
+    assert not isContainer(str(tmp_path / 'missing.Mjpeg'))
+
+
+def test_unsupported_headers(tmp_path):
+    path = write_container(tmp_path / 'movie.Mjpeg')
+    data = bytearray(path.read_bytes())
+    
+    with open(path, 'rb') as f:
+        assert readHeader(f)[1] > 0
+    
+    data[4] = MjpegContainer.CONTAINER_VERSION + 1
+    path.write_bytes(bytes(data))
+    with open(path, 'rb') as f, pytest.raises(ValueError, match='version'):
+        readHeader(f)
+    
+    path.write_bytes(b'RIFF' + bytes(data[4:]))
+    with open(path, 'rb') as f, pytest.raises(ValueError, match='Not an MJPEG container'):
+        readHeader(f)
+    
+    path.write_bytes(bytes(data[:CONTAINER_HEADER.size - 1]))
+    with open(path, 'rb') as f, pytest.raises(ValueError, match='too short'):
+        readHeader(f)
+
+
+def test_unfinished_file_is_recovered(tmp_path):
+    path = write_container(tmp_path / 'movie.Mjpeg', close=False)
+    info, offsets, lengths, crcs = readIndex(str(path))
+    assert info.frameCount == len(FRAMES)
+    assert read_frames(path) == FRAMES
+    
+    # A frame cut short by the crash is left out
+    path.write_bytes(path.read_bytes()[:-1])
+    assert read_frames(path) == FRAMES[:-1]
+
+
+def test_truncated_index_falls_back_to_scan(tmp_path):
+    path = write_container(tmp_path / 'movie.Mjpeg')
+    path.write_bytes(path.read_bytes()[:-8])
+    assert read_frames(path) == FRAMES
+
+
+def test_verify_reports_corrupt_frames(tmp_path):
+    path = write_container(tmp_path / 'movie.Mjpeg')
+    info, offsets, lengths, crcs = readIndex(str(path))
+    data = bytearray(path.read_bytes())
+    data[offsets[1] + 100] ^= 0xFF
+    path.write_bytes(bytes(data))
+    assert verify(str(path)) == [1]
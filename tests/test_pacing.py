@@ -0,0 +1,236 @@
+"""
+Tests for frame pacing: FramePacer deadlines and policies, the timer wheel,
+and CATCHUP bursts on the event-loop server's tick
+"""
+
+import os
+import socket
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from AsyncServer import AsyncSession, TimerWheel
+from BatchSender import BatchSender
+from BroadcastChannel import BroadcastChannel
+from FramePacer import FramePacer, SKIP, CATCHUP
+from FrameStore import FrameStore
+from RtpPacket import RtpPacket
+import config
+
+VIDEO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'movie.Mjpeg')
+FPS = 24
+
+
+class FakeClock:
+    """Monotonic clock the test moves by hand"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def receiver():
+    """Loopback UDP socket standing in for the client's RTP port"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(0.2)
+    yield sock
+    sock.close()
+
+
+@pytest.fixture
+def sender():
+    """Batch sender on its own UDP socket"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    yield BatchSender(sock)
+    sock.close()
+
+
+def catchup_pacer(late_frames):
+    """CATCHUP pacer whose clock is late_frames intervals past its first deadline"""
+    clock = FakeClock()
+    pacer = FramePacer(frameRate=FPS, policy=CATCHUP, maxCatchup=3, clock=clock)
+    pacer.restart(0.0)
+    clock.now = late_frames / FPS
+    return pacer
+
+
+def receive_frames(sock):
+    """Return the RTP packets that arrived, grouped by timestamp in arrival order"""
+    frames = {}
+    while True:
+        try:
+            data = sock.recv(65536)
+        except socket.timeout:
+            return frames
+        packet = RtpPacket()
+        packet.decode(data)
+        frames.setdefault(packet.timestamp(), []).append(packet)
+
+
+def check_burst(frames, count):
+    """Every frame of a burst arrives with its own timestamp and sequence numbers"""
+    assert len(frames) == count
+    timestamps = list(frames)
+    step = config.RTP_CLOCK_RATE // config.FRAME_RATE
+    assert [(b - a) & 0xFFFFFFFF for a, b in zip(timestamps, timestamps[1:])] == [step] * (count - 1)
+    
+    seqs = [packet.seqNum() for packets in frames.values() for packet in packets]
+    assert [(b - a) & 0xFFFF for a, b in zip(seqs, seqs[1:])] == [1] * (len(seqs) - 1)
+    for packets in frames.values():
+        assert [packet.marker() for packet in packets] == [0] * (len(packets) - 1) + [1]
+
+
+def test_session_catchup_burst_sends_distinct_frames(receiver, sender):
+    stream = FrameStore.open(VIDEO)
+    session = AsyncSession({'addr': receiver.getsockname(), 'rtpPort': receiver.getsockname()[1],
+                            'videoStream': stream, 'rtpSender': sender, 'pacer': catchup_pacer(3.5)},
+                           SimpleNamespace(sender=sender))
+    try:
+        session.queuePacedFrame()
+        sender.flush()  # The wheel sends the tick's last frames together
+    finally:
+        stream.close()
+    
+    check_burst(receive_frames(receiver), 4)
+
+
+def test_channel_catchup_burst_sends_distinct_frames(receiver):
+    channel = BroadcastChannel.acquire(VIDEO)
+    try:
+        channel.destinations = [receiver.getsockname()]
+        channel.pacer = catchup_pacer(3.5)
+        channel.queuePacedFrame()
+        channel.sender.flush()
+    finally:
+        BroadcastChannel.release(channel)
+    
+    check_burst(receive_frames(receiver), 4)
+
+
+def test_frames_on_time():
+    clock = FakeClock()
+    pacer = FramePacer(frameRate=FPS, policy=SKIP, clock=clock)
+    clock.now = 5.0
+    pacer.restart(5.25)
+    assert pacer.playStart == 5.0 and pacer.deadline() == 5.25
+    
+    for n in range(FPS):
+        clock.now = 5.25 + n / FPS
+        assert pacer.deadline() == pytest.approx(clock.now)
+        assert pacer.frameDue() == 0
+        assert not pacer.overdue()
+    stats = pacer.stats()
+    assert (stats['framesSent'], stats['framesLate'], stats['maxLatenessMs']) == (FPS, 0, 0.0)
+
+
+def test_skip_jumps_to_the_frame_due_now():
+    pacer = catchup_pacer(3.5)
+    pacer.policy = SKIP
+    assert pacer.frameDue() == 3
+    assert not pacer.overdue()
+    assert pacer.deadline() == pytest.approx(4 / FPS)
+    stats = pacer.stats()
+    assert (stats['framesSkipped'], stats['framesLate']) == (3, 1)
+    assert stats['maxLatenessMs'] == pytest.approx(3500 / FPS)
+
+
+def burst(pacer):
+    """Return how many frames a tick-driven caller sends before it is back on schedule"""
+    frames = 0
+    while True:
+        assert pacer.frameDue() == 0
+        frames += 1
+        if not pacer.overdue():
+            return frames
+
+
+def test_catchup_sends_late_frames_back_to_back():
+    pacer = catchup_pacer(3.5)
+    assert burst(pacer) == 4
+    assert pacer.deadline() == pytest.approx(4 / FPS)
+    assert pacer.stats()['framesSlipped'] == 0
+
+
+def test_catchup_slips_when_too_far_behind():
+    pacer = catchup_pacer(10.5)
+    assert burst(pacer) == 4  # maxCatchup late frames plus the one due now
+    assert pacer.stats()['framesSlipped'] == 7
+    assert pacer.start == pytest.approx(7 / FPS)
+
+
+def test_overdue_only_while_playing_under_catchup():
+    pacer = catchup_pacer(3.5)
+    pacer.policy = SKIP
+    assert not pacer.overdue()
+    pacer.policy = CATCHUP
+    assert pacer.overdue()
+    pacer.pause()
+    assert not pacer.overdue()
+
+
+def test_wait():
+    pacer = catchup_pacer(2.5)
+    event = threading.Event()
+    assert pacer.wait(event) == 0  # Already due: no sleep
+    event.set()
+    assert pacer.wait(event) is None
+    assert pacer.stats()['framesSent'] == 1
+
+
+def test_pause_keeps_statistics():
+    clock = FakeClock()
+    pacer = FramePacer(frameRate=FPS, policy=SKIP, clock=clock)
+    pacer.restart()
+    for n in range(FPS):
+        clock.now = n / FPS
+        pacer.frameDue()
+    clock.now = 1.0
+    pacer.pause()
+    clock.now = 100.0
+    assert pacer.stats()['actualFps'] == pytest.approx(FPS)
+    
+    pacer.restart()
+    assert pacer.deadline() == 100.0
+    assert pacer.stats()['framesSent'] == FPS
+
+
+def test_wheel_fires_after_the_given_ticks():
+    wheel = TimerWheel(slots=4)
+    wheel.schedule('a', 1)
+    wheel.schedule('b', 3)
+    wheel.schedule('c', 10)  # More than one turn of the wheel
+    wheel.schedule('d', 0)  # At least one tick
+    assert len(wheel) == 4
+    
+    fired = {}
+    for tick in range(1, 13):
+        for item in wheel.advance():
+            fired[item] = tick
+    assert fired == {'a': 1, 'b': 3, 'c': 10, 'd': 1}
+    assert len(wheel) == 0
+
+
+def test_wheel_cancel_and_reschedule():
+    wheel = TimerWheel(slots=8)
+    wheel.schedule('a', 2)
+    wheel.schedule('a', 5)  # Replaces the earlier entry
+    wheel.schedule('b', 2)
+    wheel.cancel('b')
+    wheel.cancel('missing')
+    assert len(wheel) == 1
+    
+    fired = [(tick, item) for tick in range(1, 9) for item in wheel.advance()]
+    assert fired == [(5, 'a')]
+
+
+def test_wheel_reschedules_every_tick():
+    wheel = TimerWheel(slots=3)
+    wheel.schedule('session', 1)
+    for tick in range(10):
+        assert wheel.advance() == ['session']
+        wheel.schedule('session', 1)
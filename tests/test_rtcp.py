@@ -0,0 +1,133 @@
+"""
+Tests for RTCP report packing and parsing and the reception statistics (RFC 3550)
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from Rtcp import (RtcpEndpoint, SenderReport, ReceiverReport, ReceptionStats, packSenderReport,
+                  packReceiverReport, parseRtcp, ntpTime, ntpToUnix, ntpMiddle)
+import config
+
+SENDER = SenderReport(0x11223344, ntpTime(1700000000.5), 0xFFFFFFF0, 1200, 1500000)
+RECEIVER = ReceiverReport(0x55667788, 0x11223344, 0.25, 17, 0x1FFFF, 450, 0xABCD1234, 0x8000)
+
+
+def test_ntp_time():
+    assert ntpToUnix(ntpTime(1700000000.5)) == pytest.approx(1700000000.5)
+    assert ntpMiddle(0x0123456789ABCDEF) == 0x456789AB
+
+
+def test_sender_report_round_trip():
+    packet = packSenderReport(SENDER)
+    assert len(packet) == 28
+    assert packet[:2] == b'\x80\xc8'
+    assert parseRtcp(packet) == [SENDER]
+
+
+def test_sender_report_counters_wrap():
+    packet = packSenderReport(SENDER._replace(rtpTimestamp=0x100000005, packetCount=1 << 32))
+    assert parseRtcp(packet) == [SENDER._replace(rtpTimestamp=5, packetCount=0)]
+
+
+def test_receiver_report_round_trip():
+    packet = packReceiverReport(RECEIVER)
+    assert len(packet) == 32
+    assert packet[:2] == b'\x81\xc9'
+    assert parseRtcp(packet) == [RECEIVER]
+
+
+@pytest.mark.parametrize('lost, parsed', [(-5, -5), (0x7FFFFF + 10, 0x7FFFFF), (-0x900000, -0x800000)])
+def test_cumulative_lost_is_signed_24_bit(lost, parsed):
+    report, = parseRtcp(packReceiverReport(RECEIVER._replace(cumulativeLost=lost)))
+    assert report.cumulativeLost == parsed
+
+
+def test_fraction_lost_saturates():
+    report, = parseRtcp(packReceiverReport(RECEIVER._replace(fractionLost=1.0)))
+    assert report.fractionLost == 255 / 256
+
+
+def test_compound_packet():
+    bye = b'\x81\xcb\x00\x01' + SENDER.ssrc.to_bytes(4, 'big')  # Skipped packet type
+    assert parseRtcp(packSenderReport(SENDER) + bye + packReceiverReport(RECEIVER)) == [SENDER, RECEIVER]
+
+
+def test_malformed_packet_ends_parsing():
+    receiver = packReceiverReport(RECEIVER)
+    assert parseRtcp(receiver[:-4]) == []  # Length runs past the datagram
+    assert parseRtcp(b'\x41' + receiver[1:]) == []  # RTP version 1
+    assert parseRtcp(receiver + b'\x81\xc9\x00') == [RECEIVER]  # Trailing partial header
+    assert parseRtcp(b'') == []
+
+
+def test_reception_stats_sequence_wrap():
+    stats = ReceptionStats(clockRate=90000)
+    for seq in (65533, 65534, 65535, 0, 2, 1, 3):
+        stats.update(seq, 0, 1, arrival=0.0)
+    assert stats.extendedHighestSeq() == 0x10000 + 3
+    assert stats.expected() == 7
+    assert stats.lost() == 0
+
+
+def test_reception_stats_report_loss_per_interval():
+    stats = ReceptionStats(clockRate=90000)
+    for seq in (65530, 65531, 65534, 65535):
+        stats.update(seq, 0, 1, arrival=0.0)
+    report = stats.report(2, now=0.0)
+    assert report.fractionLost == pytest.approx(2 / 6)
+    assert report.cumulativeLost == 2
+    
+    for seq in (0, 1, 2, 3):
+        stats.update(seq, 0, 1, arrival=0.0)
+    report = stats.report(2, now=0.0)
+    assert report.fractionLost == 0.0
+    assert report.cumulativeLost == 2
+    assert report.highestSeq == 0x10000 + 3
+
+
+def test_reception_stats_new_source_restarts():
+    stats = ReceptionStats(clockRate=90000)
+    stats.update(100, 0, 1, arrival=0.0)
+    stats.update(105, 0, 1, arrival=0.0)
+    stats.update(7, 0, 2, arrival=0.0)
+    assert stats.sourceSsrc == 2
+    assert stats.expected() == 1
+    assert stats.lost() == 0
+
+
+def test_reception_stats_lsr_dlsr_and_wallclock():
+    stats = ReceptionStats(clockRate=90000)
+    stats.update(1, 0, SENDER.ssrc, arrival=10.0)
+    stats.senderReport(SENDER, arrival=10.0)
+    report = stats.report(2, now=10.5)
+    assert report.lsr == ntpMiddle(SENDER.ntpTime)
+    assert report.dlsr == 0x8000
+    # RTP timestamps past the 32-bit wrap map forward in time
+    assert stats.wallclock(0x10) == pytest.approx(ntpToUnix(SENDER.ntpTime) + 0x20 / 90000)
+
+
+def test_serve_survives_a_failing_report(monkeypatch):
+    calls = []
+    
+    def sendReports():
+        calls.append(None)
+        raise ValueError('bad session')
+    
+    monkeypatch.setattr(config, 'RTCP_INTERVAL', 0.01)
+    monkeypatch.setattr(RtcpEndpoint, 'sendReports', sendReports)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    worker = threading.Thread(target=RtcpEndpoint.serve, args=(sock,), daemon=True)
+    worker.start()
+    deadline = time.monotonic() + 2
+    while len(calls) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sock.close()
+    worker.join(2)
+    
+    assert len(calls) >= 3  # Still sending on schedule after the first failure
+    assert not worker.is_alive()
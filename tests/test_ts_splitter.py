@@ -0,0 +1,108 @@
+"""
+Tests for cutting MPEG transport streams into HLS segments (web_video_converter)
+"""
+
+import pytest
+
+from web_video_converter import TS_PACKET_SIZE, split_transport_stream, write_hls_playlist
+
+PMT_PID = 0x1000
+VIDEO_PID = 0x100
+FPS = 25
+KEYFRAME_INTERVAL = 12  # Frames
+
+
+def ts_packet(pid, payload, start=False, random_access=False):
+    """Return one 188-byte TS packet, stuffed with 0xFF"""
+    header = bytes([0x47, (0x40 if start else 0) | pid >> 8, pid & 0xFF])
+    if random_access:
+        header += bytes([0x30, 1, 0x40])  # Adaptation field with the random access indicator
+    else:
+        header += bytes([0x10])
+    return (header + payload).ljust(TS_PACKET_SIZE, b'\xff')
+
+
+def psi(table_id, body):
+    """Return a PSI section after its pointer field (the CRC is not checked)"""
+    length = len(body) + 5 + 4
+    return bytes([0, table_id, 0xB0 | length >> 8, length & 0xFF, 0, 1, 0xC1, 0, 0]) + body + bytes(4)
+
+
+def pes(pts):
+    """Return a video PES header carrying a PTS"""
+    return b'\x00\x00\x01\xe0\x00\x00\x80\x80\x05' + bytes([
+        0x21 | (pts >> 29) & 0x0E, (pts >> 22) & 0xFF, (pts >> 14) & 0xFE | 1, (pts >> 7) & 0xFF, (pts << 1) & 0xFE | 1])
+
+
+PAT = ts_packet(0, psi(0, bytes([0, 1, 0xE0 | PMT_PID >> 8, PMT_PID & 0xFF])), start=True)
+PMT = ts_packet(PMT_PID, psi(2, bytes([0xE0 | VIDEO_PID >> 8, VIDEO_PID & 0xFF, 0xF0, 0,
+                                       0x1B, 0xE0 | VIDEO_PID >> 8, VIDEO_PID & 0xFF, 0xF0, 0])), start=True)
+
+
+def transport_stream(frames, first_pts=900000):
+    """Return a TS of PAT, PMT and frames of three packets each, with a keyframe every KEYFRAME_INTERVAL"""
+    packets = [PAT, PMT]
+    for n in range(frames):
+        packets.append(ts_packet(VIDEO_PID, pes(first_pts + n * 90000 // FPS), start=True,
+                                 random_access=n % KEYFRAME_INTERVAL == 0))
+        packets += [ts_packet(VIDEO_PID, bytes([n & 0xFF]) * 8)] * 2
+    return b''.join(packets)
+
+
+@pytest.fixture
+def stream(tmp_path):
+    """A 10-second transport stream on disk, and a folder for its segments"""
+    data = transport_stream(10 * FPS)
+    (tmp_path / 'video.ts').write_bytes(data)
+    (tmp_path / 'segments').mkdir()
+    return data, str(tmp_path / 'video.ts'), tmp_path / 'segments'
+
+
+@pytest.mark.parametrize('chunk_packets', [4096, 7, 1])
+def test_segments_cover_the_stream(stream, chunk_packets):
+    data, ts_file, segment_dir = stream
+    segments = split_transport_stream(ts_file, str(segment_dir), 2, FPS, chunk_packets)
+    
+    # Cuts fall on the first keyframe at least 2 seconds in: every 60 frames (2.4 s)
+    assert [name for name, duration in segments] == [f'segment_{n:05d}.ts' for n in range(5)]
+    assert [round(duration, 3) for name, duration in segments] == [2.4, 2.4, 2.4, 2.4, 0.4]
+    
+    contents = [(segment_dir / name).read_bytes() for name, duration in segments]
+    assert contents[0].startswith(PAT + PMT)
+    rejoined = contents[0]
+    for content in contents[1:]:
+        assert content[:2 * TS_PACKET_SIZE] == PAT + PMT
+        assert content[2 * TS_PACKET_SIZE + 5] & 0x40  # Starts on a keyframe
+        rejoined += content[2 * TS_PACKET_SIZE:]
+    assert rejoined == data
+
+
+def test_trailing_partial_packet_is_ignored(tmp_path):
+    data = transport_stream(FPS)
+    (tmp_path / 'video.ts').write_bytes(data + b'\x47\x01')
+    segments = split_transport_stream(str(tmp_path / 'video.ts'), str(tmp_path), 4, FPS, 5)
+    assert segments == [('segment_00000.ts', pytest.approx(1.0))]
+    assert (tmp_path / 'segment_00000.ts').read_bytes() == data
+
+
+def test_not_a_transport_stream(tmp_path):
+    data = bytearray(transport_stream(FPS))
+    data[TS_PACKET_SIZE * 10] = 0
+    (tmp_path / 'video.ts').write_bytes(bytes(data))
+    with pytest.raises(ValueError, match='not an MPEG transport stream'):
+        split_transport_stream(str(tmp_path / 'video.ts'), str(tmp_path), 4, FPS)
+
+
+def test_no_video_stream(tmp_path):
+    (tmp_path / 'video.ts').write_bytes(PAT + ts_packet(0x1FFF, b''))
+    with pytest.raises(ValueError, match='no video stream'):
+        split_transport_stream(str(tmp_path / 'video.ts'), str(tmp_path), 4, FPS)
+
+
+def test_playlist(tmp_path):
+    write_hls_playlist(str(tmp_path / 'index.m3u8'), [('segment_00000.ts', 4.2), ('segment_00001.ts', 1.0)], 'v1/')
+    lines = (tmp_path / 'index.m3u8').read_text().splitlines()
+    assert lines[0] == '#EXTM3U'
+    assert '#EXT-X-TARGETDURATION:5' in lines
+    assert lines[-1] == '#EXT-X-ENDLIST'
+    assert 'v1/segment_00000.ts' in lines and 'v1/segment_00001.ts' in lines
@@ -0,0 +1,199 @@
+"""
+Tests for the Range header handling of web_server (RFC 7233)
+"""
+
+import threading
+import urllib.request
+from wsgiref.util import FileWrapper
+
+import pytest
+from werkzeug.serving import make_server
+
+import web_server
+from web_server import parse_byte_ranges
+from video_catalog import VideoCatalog
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Test client serving one video from a temporary folder"""
+    (tmp_path / 'clip.mp4').write_bytes(CONTENT)
+    catalog = VideoCatalog(str(tmp_path), web_server.VIDEO_EXTENSIONS, use_inotify=False)
+    monkeypatch.setattr(web_server, 'catalog', catalog)
+    return web_server.app.test_client()
+
+
+def test_parse_byte_ranges():
+    assert parse_byte_ranges('bytes=0-99') == [(0, 99)]
+    assert parse_byte_ranges('bytes=500-, -200') == [(500, None), (None, 200)]
+    assert parse_byte_ranges('bytes=200-299,0-499') == [(200, 299), (0, 499)]
+
+
+@pytest.mark.parametrize('header', [None, '', 'bytes=', 'items=0-1', 'bytes=5-1', 'bytes=-',
+                                    'bytes=abc-', 'bytes=²-', 'bytes=0-²', 'bytes=-²', 'bytes=+1-2'])
+def test_parse_byte_ranges_invalid(header):
+    assert parse_byte_ranges(header) is None
+
+
+@pytest.mark.parametrize('header', ['bytes=²-', 'bytes=1-x', 'bytes=9-3', 'pages=1-2'])
+def test_invalid_range_gets_full_file(client, header):
+    response = client.get('/api/video/clip.mp4', headers={'Range': header})
+    assert response.status_code == 200
+    assert response.data == CONTENT
+
+
+def test_single_range(client):
+    response = client.get('/api/video/clip.mp4', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(CONTENT)}'
+    assert response.data == CONTENT[100:200]
+
+
+def test_suffix_and_open_ranges(client):
+    response = client.get('/api/video/clip.mp4', headers={'Range': 'bytes=-10'})
+    assert response.data == CONTENT[-10:]
+    response = client.get('/api/video/clip.mp4', headers={'Range': f'bytes={len(CONTENT) - 5}-'})
+    assert response.data == CONTENT[-5:]
+
+
+def test_unsatisfiable_range(client):
+    response = client.get('/api/video/clip.mp4', headers={'Range': f'bytes={len(CONTENT)}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+
+
+def test_overlapping_ranges_are_merged(client):
+    response = client.get('/api/video/clip.mp4', headers={'Range': 'bytes=50-99,0-59'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[0:100]
+
+
+def test_multiple_ranges(client):
+    response = client.get('/api/video/clip.mp4', headers={'Range': 'bytes=0-9,100-109'})
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert CONTENT[0:10] in response.data and CONTENT[100:110] in response.data
+    assert int(response.headers['Content-Length']) == len(response.data)
+
+
+
+def validators(client):
+    """ETag and Last-Modified of the test video"""
+    response = client.get('/api/video/clip.mp4')
+    return response.headers['ETag'], response.headers['Last-Modified']
+
+
+@pytest.mark.parametrize('headers', [{'If-None-Match': '{etag}'}, {'If-None-Match': 'W/{etag}'},
+                                     {'If-None-Match': '"other", {etag}'}, {'If-None-Match': '*'},
+                                     {'If-Modified-Since': '{modified}'}])
+def test_current_copy_gets_304(client, headers):
+    etag, modified = validators(client)
+    headers = {name: value.format(etag=etag, modified=modified) for name, value in headers.items()}
+    response = client.get('/api/video/clip.mp4', headers={**headers, 'Range': 'bytes=0-9'})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since(client):
+    etag, modified = validators(client)
+    response = client.get('/api/video/clip.mp4', headers={'If-None-Match': '"other"', 'If-Modified-Since': modified})
+    assert response.status_code == 200
+    assert response.data == CONTENT
+
+
+@pytest.mark.parametrize('headers', [{'If-Match': '"other"'}, {'If-Match': 'W/{etag}'},
+                                     {'If-Unmodified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'}])
+def test_failed_precondition_gets_412(client, headers):
+    etag, modified = validators(client)
+    headers = {name: value.format(etag=etag) for name, value in headers.items()}
+    response = client.get('/api/video/clip.mp4', headers=headers)
+    assert response.status_code == 412
+    assert response.data == b''
+
+
+@pytest.mark.parametrize('headers', [{'If-Match': '{etag}'}, {'If-Match': '*'}, {'If-Unmodified-Since': '{modified}'}])
+def test_met_precondition_sends_the_video(client, headers):
+    etag, modified = validators(client)
+    headers = {name: value.format(etag=etag, modified=modified) for name, value in headers.items()}
+    response = client.get('/api/video/clip.mp4', headers={**headers, 'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[:10]
+
+
+@pytest.mark.parametrize('if_range', ['{etag}', '{modified}'])
+def test_current_if_range_gets_the_range(client, if_range):
+    etag, modified = validators(client)
+    response = client.get('/api/video/clip.mp4', headers={'Range': 'bytes=100-199',
+                                                          'If-Range': if_range.format(etag=etag, modified=modified)})
+    assert response.status_code == 206
+    assert response.data == CONTENT[100:200]
+
+
+@pytest.mark.parametrize('if_range', ['"stale"', 'W/{etag}', 'Thu, 01 Jan 1970 00:00:00 GMT'])
+def test_stale_or_weak_if_range_gets_the_full_file(client, if_range):
+    etag, modified = validators(client)
+    response = client.get('/api/video/clip.mp4', headers={'Range': 'bytes=100-199',
+                                                          'If-Range': if_range.format(etag=etag)})
+    assert response.status_code == 200
+    assert 'Content-Range' not in response.headers
+    assert response.data == CONTENT
+
+def test_range_file_stops_at_the_range_end(tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(CONTENT)
+    video_file = open(path, 'rb')
+    video_file.seek(100)
+    body = web_server.RangeFile(video_file, 50)
+    assert body.read(30) == CONTENT[100:130]
+    assert body.read() == CONTENT[130:150]
+    assert body.read(4096) == b''
+    assert body.fileno() == video_file.fileno()
+    body.close()
+    assert video_file.closed
+
+
+BODIES = [('bytes=100-199', 206, slice(100, 200)), ('bytes=5000-', 206, slice(5000, None)),
+          ('bytes=-10', 206, slice(-10, None)), (None, 200, slice(None))]
+
+
+@pytest.mark.parametrize('header, status, part', BODIES, ids=['range', 'open', 'suffix', 'full'])
+def test_file_wrapper_body(client, header, status, part):
+    wrapped = []
+    
+    def file_wrapper(filelike, blksize):
+        wrapped.append(filelike)
+        return FileWrapper(filelike, blksize)
+    
+    response = client.get('/api/video/clip.mp4', headers={'Range': header} if header else {},
+                          environ_overrides={'wsgi.file_wrapper': file_wrapper})
+    expected = CONTENT[part]
+    assert response.status_code == status
+    assert int(response.headers['Content-Length']) == len(expected)
+    # The wrapper reads CHUNK_SIZE blocks; RangeFile keeps them inside the range
+    assert response.data == expected
+    assert isinstance(wrapped[0], web_server.RangeFile)
+
+
+@pytest.fixture
+def dev_server(client):
+    """Werkzeug dev server, which exposes its socket for sendfile(), on a free port"""
+    server = make_server('127.0.0.1', 0, web_server.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+@pytest.mark.parametrize('header, status, part', BODIES, ids=['range', 'open', 'suffix', 'full'])
+def test_sendfile_body(dev_server, header, status, part):
+    request = urllib.request.Request(f'{dev_server}/api/video/clip.mp4', headers={'Range': header} if header else {})
+    expected = CONTENT[part]
+    with urllib.request.urlopen(request, timeout=5) as response:
+        assert response.status == status
+        assert int(response.headers['Content-Length']) == len(expected)
+        assert response.read() == expected
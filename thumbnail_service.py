@@ -0,0 +1,225 @@
+"""
+Thumbnail Service
+Poster frames and seek-preview sprite sheets for the web video library,
+extracted with OpenCV on a background worker pool and cached on disk.
+Requests only ever read finished images; a missing one is queued for the
+workers and reported as pending.
+"""
+
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+class ThumbnailService:
+    """Generates and caches the poster and sprite sheet of each video"""
+    
+    KINDS = ('poster', 'sprite')
+    SEEK_SECONDS = 10  # Gaps between wanted frames longer than this are seeked over
+    
+    def __init__(self, cache_folder, workers=2, poster_width=320, tile_size=(160, 90),
+                 columns=10, rows=10, quality=80):
+        """
+        Initialize service
+        
+        Args:
+            cache_folder: Folder the images are written to
+            workers: Background extraction threads
+            poster_width: Width of the poster frame (height follows the video)
+            tile_size: (width, height) of each sprite tile; frames are letterboxed into it
+            columns: Sprite tiles per row
+            rows: Sprite rows; columns * rows frames are taken evenly over the video
+            quality: JPEG quality of both images
+        """
+        self.cache_folder = cache_folder
+        self.poster_width = poster_width
+        self.tile_width, self.tile_height = tile_size
+        self.columns = columns
+        self.rows = rows
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Thumbnail')
+        self.lock = threading.Lock()
+        
+        # Cache keys by state
+        self.ready = set()
+        self.pending = set()
+        self.failed = set()
+        
+        os.makedirs(cache_folder, exist_ok=True)
+    
+    def annotate(self, video):
+        """Store a video's cache key and prefix in its metadata (a VideoCatalog annotate hook)"""
+        video['preview_key'] = self.make_key(video)
+        video['preview_prefix'] = self.make_prefix(video)
+    
+    def key(self, video):
+        """Return the cache key of a video, as stored by annotate() or computed"""
+        return video.get('preview_key') or self.make_key(video)
+    
+    def prefix(self, video):
+        """Return the file name prefix shared by every cached version of a video"""
+        return video.get('preview_prefix') or self.make_prefix(video)
+    
+    def make_key(self, video):
+        """Compute the cache key of a video: its name and ETag (size and mtime) plus the image settings"""
+        settings = (self.poster_width, self.tile_width, self.tile_height, self.columns, self.rows, self.quality)
+        return hashlib.sha1(f'{video["filename"]}\0{video["etag"]}\0{settings}'.encode()).hexdigest()[:20]
+    
+    def make_prefix(self, video):
+        """Compute the file name prefix of a video"""
+        return hashlib.sha1(video['filename'].encode()).hexdigest()[:16]
+    
+    def path(self, video, kind, key=None):
+        """Return the cache path of a video's poster or sprite"""
+        return os.path.join(self.cache_folder, f'{self.prefix(video)}_{key or self.key(video)}_{kind}.jpg')
+    
+    def lookup(self, video, kind):
+        """
+        Find a video's poster or sprite, queueing its extraction if needed
+        
+        Returns:
+            ('ready', path), ('pending', None) or ('failed', None)
+        """
+        key = self.key(video)
+        if key in self.ready or self.cached(video, key):
+            return 'ready', self.path(video, kind, key)
+        if key in self.failed:
+            return 'failed', None
+        self.schedule(video, key)
+        return 'pending', None
+    
+    def cached(self, video, key):
+        """Check the disk for images written earlier (or by another process)"""
+        if all(os.path.exists(self.path(video, kind, key)) for kind in self.KINDS):
+            self.ready.add(key)
+            return True
+        return False
+    
+    def prefetch(self, videos):
+        """Queue extraction for every video whose images are not cached yet"""
+        for video in videos:
+            key = self.key(video)
+            if key in self.ready or key in self.pending or key in self.failed or self.cached(video, key):
+                continue
+            self.schedule(video, key)
+    
+    def schedule(self, video, key):
+        """Queue one video on the worker pool (once per key)"""
+        with self.lock:
+            if key in self.pending or key in self.ready or key in self.failed:
+                return
+            self.pending.add(key)
+        self.executor.submit(self.generate, video, key)
+    
+    def generate(self, video, key):
+        """Extract and store a video's images (runs on a worker)"""
+        try:
+            poster, sprite = self.extract(video['path'])
+            self.write(self.path(video, 'poster', key), poster)
+            self.write(self.path(video, 'sprite', key), sprite)
+            self.ready.add(key)
+            self.prune(video, key)
+        except Exception as e:
+            print(f"[THUMBNAIL] Could not create previews of {video['filename']}: {e}")
+            self.failed.add(key)
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+    
+    def write(self, path, data):
+        """Write a file atomically"""
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    
+    def prune(self, video, key):
+        """Delete cached images of earlier versions of a video"""
+        prefix = f'{self.prefix(video)}_'
+        for name in os.listdir(self.cache_folder):
+            if name.startswith(prefix) and not name.startswith(f'{prefix}{key}_'):
+                try:
+                    os.remove(os.path.join(self.cache_folder, name))
+                except OSError:
+                    pass
+    
+    def letterbox(self, frame):
+        """Fit a frame into one sprite tile, keeping its aspect ratio"""
+        height, width = frame.shape[:2]
+        scale = min(self.tile_width / width, self.tile_height / height)
+        w, h = max(1, round(width * scale)), max(1, round(height * scale))
+        tile = np.zeros((self.tile_height, self.tile_width, 3), dtype=np.uint8)
+        x, y = (self.tile_width - w) // 2, (self.tile_height - h) // 2
+        tile[y:y + h, x:x + w] = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+        return tile
+    
+    def read_frames(self, cap, indices, fps):
+        """
+        Decode the frames at the given indices in one forward pass
+        
+        Seeking makes the decoder restart at the previous keyframe, which in
+        sparsely keyed files costs more than decoding straight through, so
+        only gaps longer than SEEK_SECONDS are seeked over.
+        
+        Returns:
+            Dictionary of index -> frame (indices that could not be read are missing)
+        """
+        frames = {}
+        position = 0  # Index of the frame the next grab() returns
+        for index in sorted(set(indices)):
+            if index - position > self.SEEK_SECONDS * fps:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                position = index
+            while position < index and cap.grab():
+                position += 1
+            ok, frame = cap.read()
+            position += 1
+            if not ok:
+                break
+            frames[index] = frame
+        return frames
+    
+    def extract(self, video_path):
+        """
+        Read the poster frame and the sprite frames of a video
+        
+        Returns:
+            (poster JPEG, sprite JPEG)
+        """
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError('cannot open video')
+        
+        try:
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if frame_count <= 0:
+                raise ValueError('unknown frame count')
+            
+            # A tenth of the way in skips fade-ins and title cards; tile i shows
+            # the middle of the i-th of columns * rows equal parts of the video
+            count = self.columns * self.rows
+            poster_index = frame_count // 10
+            tile_indices = [min(int((i + 0.5) * frame_count / count), frame_count - 1) for i in range(count)]
+            frames = self.read_frames(cap, [poster_index] + tile_indices, cap.get(cv2.CAP_PROP_FPS) or 25)
+        finally:
+            cap.release()
+        
+        if not frames:
+            raise ValueError('no frame could be decoded')
+        poster = frames.get(poster_index, next(iter(frames.values())))
+        height, width = poster.shape[:2]
+        poster = cv2.resize(poster, (self.poster_width, max(2, round(height * self.poster_width / width) // 2 * 2)),
+                            interpolation=cv2.INTER_AREA)
+        
+        sprite = np.zeros((self.rows * self.tile_height, self.columns * self.tile_width, 3), dtype=np.uint8)
+        for i, index in enumerate(tile_indices):
+            if index in frames:
+                x, y = (i % self.columns) * self.tile_width, (i // self.columns) * self.tile_height
+                sprite[y:y + self.tile_height, x:x + self.tile_width] = self.letterbox(frames[index])
+        
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        return cv2.imencode('.jpg', poster, params)[1].tobytes(), cv2.imencode('.jpg', sprite, params)[1].tobytes()
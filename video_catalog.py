@@ -0,0 +1,178 @@
+"""
+Video Catalog
+In-process cache of the videos folder: the sorted listing and, per file,
+its size, mtime, MIME type and ETag. The folder is only scanned again when
+it changes, which an inotify watcher reports where inotify_simple is
+installed; otherwise the folder's mtime is compared on each lookup.
+"""
+
+import os
+import time
+import mimetypes
+import threading
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None  # Optional: without it the folder mtime is checked instead
+
+
+class VideoCatalog:
+    """Cached listing and metadata of the video files in one folder"""
+    
+    def __init__(self, folder, extensions, max_age=30.0, use_inotify=True, annotate=None):
+        """
+        Initialize catalog (the folder is scanned on first use)
+        
+        Args:
+            folder: Folder holding the videos
+            extensions: File extensions listed, lowercase with the dot (e.g. '.mp4')
+            max_age: Seconds after which the folder is scanned again even if it
+                     looks unchanged; a file rewritten in place does not change
+                     the folder's mtime
+            use_inotify: Watch the folder with inotify when inotify_simple is installed
+            annotate: Called with the metadata of each new or changed file
+                      during a scan, to add derived fields (e.g. cache keys)
+        """
+        self.folder = folder
+        self.extensions = set(extensions)
+        self.max_age = max_age
+        self.use_inotify = use_inotify and INotify is not None
+        self.annotate = annotate
+        self.lock = threading.Lock()
+        
+        self.entries = {}  # Filename -> metadata
+        self.listing = []  # Public metadata, sorted by name
+        self.version = 0  # Incremented by every scan
+        self.added = {}  # Filename -> metadata of files new or changed since pop_added()
+        self.folder_mtime = None
+        self.scanned_at = None
+        self.changed = True  # Set by the inotify watcher
+        self.watcher_pid = None
+    
+    def start_watcher(self):
+        """Watch the folder with inotify; once per process, since threads do not survive gunicorn's fork"""
+        self.watcher_pid = os.getpid()
+        try:
+            inotify = INotify()
+            inotify.add_watch(self.folder, flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO |
+                              flags.CLOSE_WRITE | flags.ATTRIB | flags.DELETE_SELF | flags.MOVE_SELF)
+        except OSError as e:
+            print(f'[CATALOG] inotify unavailable ({e}), checking folder mtime instead')
+            self.use_inotify = False
+            return
+        
+        thread = threading.Thread(target=self.watch, args=(inotify,), name='VideoCatalogWatcher', daemon=True)
+        thread.start()
+        self.changed = True
+    
+    def watch(self, inotify):
+        """Mark the catalog changed whenever the folder reports events"""
+        while True:
+            if inotify.read():
+                self.changed = True
+    
+    def scan(self):
+        """Read the folder and rebuild the metadata"""
+        entries = {}
+        try:
+            with os.scandir(self.folder) as folder:
+                for entry in folder:
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    if ext not in self.extensions or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+                    previous = self.entries.get(entry.name)
+                    if previous is not None and previous['etag'] == etag:
+                        # Unchanged: keep the entry and whatever was derived from it
+                        entries[entry.name] = previous
+                        continue
+                    
+                    video = {
+                        'filename': entry.name,
+                        'name': os.path.splitext(entry.name)[0],
+                        'size': stat.st_size,
+                        'size_mb': round(stat.st_size / (1024 * 1024), 2),
+                        'extension': ext[1:].upper(),
+                        'path': entry.path,
+                        'mtime': stat.st_mtime,
+                        'mime_type': mimetypes.guess_type(entry.name)[0] or 'video/mp4',
+                        # Size and nanosecond mtime change whenever the content does
+                        'etag': etag
+                    }
+                    if self.annotate is not None:
+                        self.annotate(video)
+                    entries[entry.name] = video
+                    self.added[entry.name] = video
+        except FileNotFoundError:
+            pass
+        
+        public = ('filename', 'name', 'size', 'size_mb', 'extension')
+        self.entries = entries
+        self.listing = [{key: entry[key] for key in public}
+                        for entry in sorted(entries.values(), key=lambda x: x['name'])]
+        self.added = {name: video for name, video in self.added.items() if name in entries}
+        self.version += 1
+    
+    def refresh(self):
+        """Scan the folder again if it may have changed since the last scan"""
+        if self.use_inotify and self.watcher_pid != os.getpid():
+            with self.lock:
+                if self.watcher_pid != os.getpid():
+                    self.start_watcher()
+        
+        folder_mtime = None
+        if self.use_inotify:
+            stale = self.changed
+        else:
+            try:
+                folder_mtime = os.stat(self.folder).st_mtime_ns
+            except OSError:
+                pass
+            stale = folder_mtime != self.folder_mtime
+        
+        now = time.monotonic()
+        if not stale and self.scanned_at is not None and now - self.scanned_at < self.max_age:
+            return
+        
+        with self.lock:
+            # Cleared before scanning, so changes made during the scan are picked up next time
+            self.changed = False
+            self.folder_mtime = folder_mtime
+            self.scan()
+            self.scanned_at = now
+    
+    def videos(self):
+        """Return the listing (filename, name, size, size_mb, extension), sorted by name"""
+        self.refresh()
+        return self.listing
+    
+    def snapshot(self):
+        """
+        Return the listing and metadata of one scan, refreshing once
+        
+        Returns:
+            (version, listing, entries); version changes with every scan, so
+            callers can cache what they derive from the other two
+        """
+        self.refresh()
+        with self.lock:
+            return self.version, self.listing, self.entries
+    
+    def pop_added(self):
+        """Return the metadata of files found new or changed since the last call"""
+        with self.lock:
+            added, self.added = list(self.added.values()), {}
+        return added
+    
+    def get(self, filename):
+        """
+        Return the metadata of one video
+        
+        Returns:
+            Dictionary with the listing fields plus path, mtime, mime_type and
+            etag, or None if the folder has no such video
+        """
+        self.refresh()
+        return self.entries.get(filename)
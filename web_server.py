@@ -4,43 +4,53 @@ Serves videos from assets/videos folder via HTTP with a YouTube-like web interfa
 """
 
 import os
-import mimetypes
-from flask import Flask, render_template, Response, request, jsonify, send_from_directory
+import re
+import secrets
+from flask import Flask, render_template, Response, request, jsonify, send_from_directory, send_file
+from werkzeug.http import http_date, unquote_etag
+from urllib.parse import quote
 from pathlib import Path
 import json
 
+from video_catalog import VideoCatalog
+from thumbnail_service import ThumbnailService
+from web_video_converter import VIDEOS_FOLDER, VIDEO_EXTENSIONS, HLS_FOLDER, HLS_PLAYLIST
+
 app = Flask(__name__)
 
-# Configuration
-VIDEOS_FOLDER = os.path.join(os.path.dirname(__file__), 'assets', 'videos')
+# Configuration (VIDEOS_FOLDER, VIDEO_EXTENSIONS and HLS_FOLDER come from web_video_converter)
 CHUNK_SIZE = 1024 * 1024  # 1MB chunks for streaming
+CATALOG_MAX_AGE = 30  # Seconds before the videos folder is rescanned even if unchanged
+VIDEO_CACHE_CONTROL = 'public, max-age=3600'  # Clients and CDNs revalidate with the ETag after this
+MAX_RANGES = 16  # Ranges allowed in one request; more are answered with the whole file
+THUMBNAILS_FOLDER = os.path.join(os.path.dirname(__file__), 'assets', 'thumbnails')
+THUMBNAIL_WORKERS = 2  # Background threads extracting posters and sprites
+THUMBNAIL_WIDTH = 320  # Poster frame width
+SPRITE_TILE_SIZE = (160, 90)  # Seek-preview tile (width, height)
+SPRITE_COLUMNS = 10  # Sprite sheet grid; columns * rows frames evenly over the video
+SPRITE_ROWS = 10
+PREVIEW_CACHE_CONTROL = 'public, max-age=31536000, immutable'  # Preview URLs carry their version
+HLS_PLAYLIST_CACHE_CONTROL = 'no-cache'  # Replaced when a video is segmented again; revalidated by ETag
+HLS_SEGMENT_CACHE_CONTROL = 'public, max-age=31536000, immutable'  # Segment paths carry the source version
+BYTE_POSITION = re.compile(r'[0-9]+')  # ASCII digits only; str.isdigit() also takes e.g. '²'
 
 # Ensure videos folder exists
 os.makedirs(VIDEOS_FOLDER, exist_ok=True)
 
+# Posters and seek-preview sprites, extracted off the request path
+thumbnails = ThumbnailService(THUMBNAILS_FOLDER, workers=THUMBNAIL_WORKERS, poster_width=THUMBNAIL_WIDTH,
+                              tile_size=SPRITE_TILE_SIZE, columns=SPRITE_COLUMNS, rows=SPRITE_ROWS)
+
+# Listing and file metadata, rescanned only when the folder changes; each
+# new or changed file gets its preview cache key once, at scan time
+catalog = VideoCatalog(VIDEOS_FOLDER, VIDEO_EXTENSIONS, max_age=CATALOG_MAX_AGE, annotate=thumbnails.annotate)
+
+# /api/videos response body, rebuilt only after the catalog rescans
+video_listing = {'version': None, 'body': None}
+
 def get_video_files():
     """Get list of all video files in the assets/videos folder"""
-    video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv', '.m4v']
-    videos = []
-    
-    if not os.path.exists(VIDEOS_FOLDER):
-        return videos
-    
-    for filename in os.listdir(VIDEOS_FOLDER):
-        file_path = os.path.join(VIDEOS_FOLDER, filename)
-        if os.path.isfile(file_path):
-            ext = os.path.splitext(filename)[1].lower()
-            if ext in video_extensions:
-                file_size = os.path.getsize(file_path)
-                videos.append({
-                    'filename': filename,
-                    'name': os.path.splitext(filename)[0],
-                    'size': file_size,
-                    'size_mb': round(file_size / (1024 * 1024), 2),
-                    'extension': ext[1:].upper()
-                })
-    
-    return sorted(videos, key=lambda x: x['name'])
+    return catalog.videos()
 
 
 def get_video_stream(video_path, start=0, end=None):
@@ -65,6 +75,243 @@ def get_video_stream(video_path, start=0, end=None):
             yield data
 
 
+class RangeFile:
+    """
+    File object that reads at most length bytes from its current position
+    
+    Handed to wsgi.file_wrapper: gunicorn sends it with sendfile() through
+    fileno() where it can, and otherwise iterates the wrapper, which then
+    stops at the end of the range instead of reading on to EOF.
+    """
+    
+    def __init__(self, video_file, length):
+        """Wrap an open file positioned at the start of the range"""
+        self.file = video_file
+        self.remaining = length
+    
+    def read(self, size=-1):
+        """Read up to size bytes, never past the end of the range"""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+    
+    def fileno(self):
+        """Return the file descriptor gunicorn sends from"""
+        return self.file.fileno()
+    
+    def close(self):
+        """Close the file"""
+        self.file.close()
+
+
+def sendfile_stream(sock, video_path, start, length):
+    """Send a byte range straight from the page cache to the client socket (dev server)"""
+    with open(video_path, 'rb') as video_file:
+        # An empty chunk makes the server send the status line and headers first
+        yield b''
+        sock.sendfile(video_file, start, length)
+
+
+def file_body(video_path, start, length):
+    """
+    Response body for bytes start..start+length-1 of a file, sent by the
+    kernel (sendfile) where the WSGI server allows it
+    
+    Under gunicorn the file is handed over as wsgi.file_wrapper, positioned at
+    start; gunicorn sends Content-Length bytes from there with sendfile(), or
+    reads them through RangeFile where it cannot (SSL, --no-sendfile). The
+    Werkzeug dev server has no file wrapper but exposes its socket, so the
+    range is sent on it directly. Other servers get the chunked generator.
+    """
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None:
+        video_file = open(video_path, 'rb')
+        video_file.seek(start)
+        return file_wrapper(RangeFile(video_file, length), CHUNK_SIZE)
+    
+    sock = request.environ.get('werkzeug.socket')
+    if sock is not None:
+        return sendfile_stream(sock, video_path, start, length)
+    
+    return get_video_stream(video_path, start, start + length - 1)
+
+
+def preview_url(video, kind):
+    """URL of a video's poster or sprite, versioned so it can be cached forever"""
+    route = 'thumbnail' if kind == 'poster' else 'sprite'
+    return f"/api/{route}/{quote(video['filename'])}?v={thumbnails.key(video)}"
+
+
+def serve_preview(filename, kind):
+    """Send a video's poster or sprite, or 202 while it is still being extracted"""
+    video = catalog.get(filename)
+    
+    if video is None:
+        return jsonify({'success': False, 'error': 'Video not found'}), 404
+    
+    state, path = thumbnails.lookup(video, kind)
+    
+    if state == 'pending':
+        response = jsonify({'success': False, 'pending': True})
+        response.status_code = 202
+        response.headers['Retry-After'] = '2'
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    if state == 'failed':
+        return jsonify({'success': False, 'error': 'No preview available'}), 404
+    
+    response = send_file(path, mimetype='image/jpeg', conditional=True)
+    # Only the versioned URL is immutable; a bare one must pick up new versions
+    if request.args.get('v') == thumbnails.key(video):
+        response.headers['Cache-Control'] = PREVIEW_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def add_validators(response, video):
+    """Add the ETag, Last-Modified and caching headers of a video"""
+    response.headers.add('ETag', video['etag'])
+    response.headers.add('Last-Modified', http_date(int(video['mtime'])))
+    response.headers.add('Cache-Control', VIDEO_CACHE_CONTROL)
+
+
+def check_preconditions(video):
+    """
+    Evaluate the request's conditional headers in RFC 7232 order
+    
+    Returns:
+        412 if a precondition failed, 304 if the client's copy is current,
+        or None to send the video
+    """
+    etag = unquote_etag(video['etag'])[0]
+    mtime = int(video['mtime'])
+    
+    if request.if_match:
+        if not request.if_match.contains(etag):
+            return 412
+    elif request.if_unmodified_since and mtime > request.if_unmodified_since.timestamp():
+        return 412
+    
+    if request.if_none_match:
+        if request.if_none_match.contains_weak(etag):
+            return 304
+    elif request.if_modified_since and mtime <= request.if_modified_since.timestamp():
+        return 304
+    
+    return None
+
+
+def parse_byte_ranges(header):
+    """
+    Parse a Range header (e.g. "bytes=0-99,200-,-500")
+    
+    Ranges may overlap and come in any order. A suffix range (-500) is
+    returned as (None, 500), an open range (200-) as (200, None).
+    
+    Returns:
+        List of (start, end) pairs, or None if there is no valid bytes range set
+    """
+    if not header:
+        return None
+    units, _, spec = header.partition('=')
+    if units.strip().lower() != 'bytes':
+        return None
+    
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, dash, end = (value.strip() for value in part.partition('-'))
+        if (not dash or (start and not BYTE_POSITION.fullmatch(start)) or
+                (end and not BYTE_POSITION.fullmatch(end))):
+            return None
+        if not start:
+            if not end:
+                return None
+            ranges.append((None, int(end)))
+        elif end and int(end) < int(start):
+            return None
+        else:
+            ranges.append((int(start), int(end) if end else None))
+    return ranges or None
+
+
+def requested_ranges(video):
+    """
+    Resolve the Range header against a video (RFC 7233)
+    
+    Returns:
+        None to send the whole file (no or unusable Range header, or an
+        If-Range that no longer matches), an empty list if no range can be
+        satisfied, otherwise sorted, merged (start, end) byte positions
+    """
+    byte_ranges = parse_byte_ranges(request.headers.get('Range'))
+    if byte_ranges is None:
+        return None
+    
+    # If-Range: the ranges only apply to the representation the client already has
+    if_range = request.if_range
+    if if_range.etag is not None:
+        # Only a strong ETag can validate a range
+        weak = request.headers.get('If-Range', '').startswith('W/')
+        if weak or if_range.etag != unquote_etag(video['etag'])[0]:
+            return None
+    elif if_range.date is not None and int(video['mtime']) != if_range.date.timestamp():
+        return None
+    
+    size = video['size']
+    ranges = []
+    for start, end in byte_ranges:
+        if start is None:
+            # Suffix range: the last end bytes
+            if end == 0:
+                continue
+            start, end = max(0, size - end), size - 1
+        else:
+            end = size - 1 if end is None else min(end, size - 1)
+        if start < size:
+            ranges.append((start, end))
+    
+    # Overlapping or adjacent ranges are sent once
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def multipart_body(video, ranges, boundary):
+    """
+    Build a multipart/byteranges body
+    
+    Returns:
+        (generator of body chunks, total length in bytes)
+    """
+    heads = [(f'\r\n--{boundary}\r\nContent-Type: {video["mime_type"]}\r\n'
+              f'Content-Range: bytes {start}-{end}/{video["size"]}\r\n\r\n').encode()
+             for start, end in ranges]
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    length = sum(map(len, heads)) + sum(end - start + 1 for start, end in ranges) + len(tail)
+    
+    def generate():
+        for head, (start, end) in zip(heads, ranges):
+            yield head
+            yield from get_video_stream(video['path'], start, end)
+        yield tail
+    
+    return generate(), length
+
+
 @app.route('/')
 def index():
     """Main page - video browser"""
@@ -74,80 +321,146 @@ def index():
 @app.route('/api/videos')
 def api_videos():
     """API endpoint to get list of available videos"""
-    videos = get_video_files()
-    return jsonify({
-        'success': True,
-        'count': len(videos),
-        'videos': videos
-    })
+    version, videos, entries = catalog.snapshot()
+    
+    # Start extracting previews of new videos before the page asks for them
+    thumbnails.prefetch(catalog.pop_added())
+    
+    if video_listing['version'] != version:
+        # Built once per scan, compact as jsonify would send it
+        video_listing['body'] = app.json.dumps({
+            'success': True,
+            'count': len(videos),
+            'videos': [dict(video, thumbnail=preview_url(entries[video['filename']], 'poster'),
+                            sprite=preview_url(entries[video['filename']], 'sprite'))
+                       for video in videos]
+        }, separators=(',', ':'))
+        video_listing['version'] = version
+    
+    return app.response_class(video_listing['body'], mimetype='application/json')
+
+
+@app.route('/api/thumbnail/<path:filename>')
+def video_thumbnail(filename):
+    """Poster frame of a video (JPEG)"""
+    return serve_preview(filename, 'poster')
+
+
+@app.route('/api/sprite/<path:filename>')
+def video_sprite(filename):
+    """Seek-preview sprite sheet of a video (JPEG, SPRITE_COLUMNS x SPRITE_ROWS tiles)"""
+    return serve_preview(filename, 'sprite')
 
 
 @app.route('/api/video/<path:filename>')
 def stream_video(filename):
-    """Stream video with support for range requests (seeking)"""
-    video_path = os.path.join(VIDEOS_FOLDER, filename)
+    """Stream video with support for conditional and range requests (seeking)"""
+    video = catalog.get(filename)
     
-    if not os.path.exists(video_path):
+    if video is None:
         return jsonify({'success': False, 'error': 'Video not found'}), 404
     
-    file_size = os.path.getsize(video_path)
+    video_path = video['path']
+    file_size = video['size']
+    
+    # 304 / 412 from If-Match, If-Unmodified-Since, If-None-Match, If-Modified-Since
+    status = check_preconditions(video)
+    if status is not None:
+        response = Response(status=status)
+        add_validators(response, video)
+        return response
     
-    # Get range header if present
-    range_header = request.headers.get('Range')
+    ranges = requested_ranges(video)
     
-    if range_header:
-        # Parse range header (e.g., "bytes=0-1023")
-        byte_range = range_header.replace('bytes=', '').split('-')
-        start = int(byte_range[0]) if byte_range[0] else 0
-        end = int(byte_range[1]) if byte_range[1] else file_size - 1
+    if ranges is None:
+        # Full content
+        response = Response(
+            file_body(video_path, 0, file_size),
+            200,
+            mimetype=video['mime_type'],
+            direct_passthrough=True
+        )
+        response.headers.add('Content-Length', str(file_size))
         
-        # Ensure end doesn't exceed file size
-        end = min(end, file_size - 1)
-        length = end - start + 1
+    elif not ranges:
+        # None of the ranges overlaps the file
+        response = Response(status=416)
+        response.headers.add('Content-Range', f'bytes */{file_size}')
         
-        # Create response with partial content
+    elif len(ranges) == 1:
+        # Single range: partial content
+        start, end = ranges[0]
+        length = end - start + 1
         response = Response(
-            get_video_stream(video_path, start, end),
+            file_body(video_path, start, length),
             206,  # Partial Content
-            mimetype=mimetypes.guess_type(filename)[0] or 'video/mp4',
+            mimetype=video['mime_type'],
             direct_passthrough=True
         )
-        
         response.headers.add('Content-Range', f'bytes {start}-{end}/{file_size}')
-        response.headers.add('Accept-Ranges', 'bytes')
         response.headers.add('Content-Length', str(length))
         
     else:
-        # Full content
+        # Several ranges: one multipart/byteranges body
+        boundary = secrets.token_hex(16)
+        body, length = multipart_body(video, ranges, boundary)
         response = Response(
-            get_video_stream(video_path),
-            200,
-            mimetype=mimetypes.guess_type(filename)[0] or 'video/mp4',
+            body,
+            206,
+            mimetype=f'multipart/byteranges; boundary={boundary}',
             direct_passthrough=True
         )
-        
-        response.headers.add('Content-Length', str(file_size))
-        response.headers.add('Accept-Ranges', 'bytes')
+        response.headers.add('Content-Length', str(length))
     
-    # Add caching headers
-    response.headers.add('Cache-Control', 'public, max-age=3600')
+    response.headers.add('Accept-Ranges', 'bytes')
+    add_validators(response, video)
+    return response
+
+
+@app.route('/api/hls/<path:filename>/' + HLS_PLAYLIST)
+def hls_playlist(filename):
+    """HLS media playlist of a video (see web_video_converter.py --hls)"""
+    if catalog.get(filename) is None:
+        return jsonify({'success': False, 'error': 'Video not found'}), 404
+    
+    folder = os.path.join(HLS_FOLDER, filename)
+    if not os.path.isfile(os.path.join(folder, HLS_PLAYLIST)):
+        return jsonify({'success': False, 'error': 'Video has not been segmented for HLS'}), 404
+    
+    response = send_from_directory(folder, HLS_PLAYLIST, mimetype='application/vnd.apple.mpegurl')
+    response.headers['Cache-Control'] = HLS_PLAYLIST_CACHE_CONTROL
+    return response
+
+
+@app.route('/api/hls/<path:filename>/<version>/<segment>')
+def hls_segment(filename, version, segment):
+    """One HLS segment; its path changes whenever the source does, so it is cached forever"""
+    if catalog.get(filename) is None or version.startswith('.') or not segment.endswith('.ts'):
+        return jsonify({'success': False, 'error': 'Segment not found'}), 404
     
+    response = send_from_directory(os.path.join(HLS_FOLDER, filename, version), segment, mimetype='video/mp2t')
+    response.headers['Cache-Control'] = HLS_SEGMENT_CACHE_CONTROL
     return response
 
 
 @app.route('/watch/<path:filename>')
 def watch_video(filename):
     """Video player page"""
-    video_path = os.path.join(VIDEOS_FOLDER, filename)
+    video = catalog.get(filename)
     
-    if not os.path.exists(video_path):
+    if video is None:
         return "Video not found", 404
     
     video_info = {
         'filename': filename,
-        'name': os.path.splitext(filename)[0],
-        'size': os.path.getsize(video_path),
-        'extension': os.path.splitext(filename)[1][1:].upper()
+        'name': video['name'],
+        'size': video['size'],
+        'extension': video['extension'],
+        'sprite': preview_url(video, 'sprite'),
+        'sprite_columns': SPRITE_COLUMNS,
+        'sprite_rows': SPRITE_ROWS,
+        'sprite_tile_width': SPRITE_TILE_SIZE[0],
+        'sprite_tile_height': SPRITE_TILE_SIZE[1]
     }
     
     return render_template('player.html', video=video_info)
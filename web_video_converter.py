@@ -1,13 +1,26 @@
 """
 Video Format Converter for Web Streaming
-Converts videos to web-compatible MP4 format
+Converts videos to web-compatible MP4 format, or to HLS segments and playlists
 """
 
 import cv2
 import sys
 import os
+import math
+import shutil
 from pathlib import Path
 
+# Library layout, shared with web_server.py; relative to this file, not the working directory
+VIDEOS_FOLDER = os.path.join(os.path.dirname(__file__), 'assets', 'videos')
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv', '.m4v']
+
+# HLS output
+HLS_FOLDER = os.path.join(os.path.dirname(__file__), 'assets', 'hls')
+HLS_SEGMENT_DURATION = 4  # Target seconds per segment (cut at the next keyframe)
+HLS_PLAYLIST = 'index.m3u8'
+TS_PACKET_SIZE = 188
+TS_CHUNK_PACKETS = 4096  # Packets read at a time when cutting segments (768 KiB)
+
 
 def convert_to_web_format(input_file, output_file=None):
     """
@@ -86,6 +99,272 @@ def convert_to_web_format(input_file, output_file=None):
     return True
 
 
+def open_ts_writer(ts_file, fps, size):
+    """
+    Open an H.264 MPEG-TS writer
+    
+    Safari and hls.js (Media Source Extensions) only decode H.264 in HLS, so
+    there is no fallback codec: segments in anything else would be served
+    but not play.
+    
+    Returns:
+        The writer, or None if this OpenCV build has no H.264 encoder
+    """
+    out = cv2.VideoWriter(ts_file, cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*'avc1'), fps, size)
+    if out.isOpened():
+        return out
+    out.release()
+    return None
+
+
+def ts_payload_offset(packet):
+    """Return where the payload of a 188-byte TS packet starts"""
+    if packet[3] & 0x20:  # Adaptation field present
+        return 5 + packet[4]
+    return 4
+
+
+def ts_random_access(packet):
+    """Return True if a TS packet's adaptation field marks a keyframe"""
+    return bool(packet[3] & 0x20) and packet[4] > 0 and bool(packet[5] & 0x40)
+
+
+def pes_pts(payload):
+    """Return the PTS (90 kHz) of a PES packet header, or None if it has none"""
+    if len(payload) < 14 or payload[:3] != b'\x00\x00\x01' or not payload[7] & 0x80:
+        return None
+    b = payload[9:14]
+    return ((b[0] >> 1) & 0x07) << 30 | b[1] << 22 | (b[2] >> 1) << 15 | b[3] << 7 | b[4] >> 1
+
+
+def split_transport_stream(ts_file, output_dir, segment_duration, fps, chunk_packets=TS_CHUNK_PACKETS):
+    """
+    Cut an MPEG-TS file into HLS segments at keyframes
+    
+    A segment ends at the first keyframe at least segment_duration seconds
+    after it started. Each segment starts with the stream's PAT and PMT, so
+    it can be decoded on its own, and timestamps run on across segments.
+    The file is read chunk_packets packets at a time and segments are
+    written as they are cut, so memory use does not grow with the video.
+    
+    Args:
+        ts_file: Transport stream to cut
+        output_dir: Folder the segment_NNNNN.ts files are written to
+        segment_duration: Target seconds per segment
+        fps: Frame rate (for the length of the last frame)
+        chunk_packets: 188-byte packets read at a time
+    
+    Returns:
+        List of (segment file name, duration in seconds)
+    
+    Raises:
+        ValueError: If the file is not a transport stream with a video stream
+    """
+    segments = []
+    pat = pmt = None
+    pmt_pid = video_pid = None
+    start_pts = last_pts = None
+    
+    def open_segment():
+        out = open(os.path.join(output_dir, f'segment_{len(segments):05d}.ts'), 'wb')
+        if pat is not None and pmt is not None:
+            out.write(pat)
+            out.write(pmt)
+        return out
+    
+    def close_segment(out, end_pts):
+        out.close()
+        segments.append((os.path.basename(out.name), (end_pts - start_pts) / 90000))
+    
+    with open(ts_file, 'rb') as f:
+        # The first segment gets the PAT and PMT from the stream itself
+        out = open_segment()
+        try:
+            while True:
+                chunk = f.read(TS_PACKET_SIZE * chunk_packets)
+                usable = len(chunk) - len(chunk) % TS_PACKET_SIZE
+                if not usable:
+                    break
+                
+                view = memoryview(chunk)
+                written = 0  # Packets before this offset are in a segment file
+                for i in range(0, usable, TS_PACKET_SIZE):
+                    if chunk[i] != 0x47:
+                        raise ValueError('not an MPEG transport stream')
+                    pid = (chunk[i + 1] & 0x1F) << 8 | chunk[i + 2]
+                    
+                    if pid == video_pid:
+                        if not chunk[i + 1] & 0x40:
+                            continue  # Not the start of a video PES packet
+                        packet = chunk[i:i + TS_PACKET_SIZE]
+                        pts = pes_pts(packet[ts_payload_offset(packet):])
+                        if pts is None:
+                            continue
+                        if (ts_random_access(packet) and start_pts is not None
+                                and pts - start_pts >= segment_duration * 90000):
+                            out.write(view[written:i])
+                            written = i
+                            close_segment(out, pts)
+                            out = open_segment()
+                            start_pts = None
+                        if start_pts is None:
+                            start_pts = pts
+                        last_pts = pts if last_pts is None else max(last_pts, pts)
+                    
+                    elif video_pid is None and pid in (0, pmt_pid):
+                        # PAT (PID 0) gives the PMT's PID; the PMT gives the video stream's PID
+                        packet = chunk[i:i + TS_PACKET_SIZE]
+                        section = packet[ts_payload_offset(packet) + 1 + packet[ts_payload_offset(packet)]:]
+                        if pid == 0 and pat is None:
+                            pat = packet
+                            pmt_pid = next((section[j + 2] & 0x1F) << 8 | section[j + 3]
+                                           for j in range(8, 8 + ((section[1] & 0x0F) << 8 | section[2]) - 9, 4)
+                                           if section[j] << 8 | section[j + 1])
+                        elif pid == pmt_pid and pmt is None:
+                            pmt = packet
+                            es = 12 + ((section[10] & 0x0F) << 8 | section[11])
+                            video_pid = (section[es + 1] & 0x1F) << 8 | section[es + 2]
+                
+                out.write(view[written:usable])
+        finally:
+            out.close()
+    
+    if video_pid is None:
+        raise ValueError('no video stream in the transport stream')
+    if start_pts is None:
+        os.remove(out.name)  # Nothing of the video after the last cut
+    else:
+        close_segment(out, last_pts + round(90000 / fps))
+    return segments
+
+
+def write_hls_playlist(path, segments, prefix=''):
+    """Write a VOD media playlist for the given (file name, duration) segments"""
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{math.ceil(max(duration for _, duration in segments))}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD'
+    ]
+    for name, duration in segments:
+        lines.append(f'#EXTINF:{duration:.6f},')
+        lines.append(f'{prefix}{name}')
+    lines.append('#EXT-X-ENDLIST')
+    
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+
+
+def segment_for_hls(input_file, output_root=None, segment_duration=HLS_SEGMENT_DURATION):
+    """
+    Encode a video to MPEG-TS and cut it into HLS segments with a playlist
+    
+    Output goes to <output_root>/<video file name>/: index.m3u8 and a
+    <version>/ folder of segments, where the version changes with the source
+    file's size and mtime. Segment URLs therefore never change content and
+    can be cached forever; only the playlist is replaced.
+    
+    Args:
+        input_file: Path to input video file
+        output_root: Folder holding the HLS output of all videos (default assets/hls)
+        segment_duration: Target seconds per segment
+    """
+    if not os.path.exists(input_file):
+        print(f"Error: Input file '{input_file}' not found")
+        return False
+    
+    stat = os.stat(input_file)
+    version = f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+    video_dir = os.path.join(output_root or HLS_FOLDER, os.path.basename(input_file))
+    segment_dir = os.path.join(video_dir, version)
+    
+    print(f"Segmenting: {input_file}")
+    print(f"Output: {video_dir} ({segment_duration}s segments)")
+    print()
+    
+    cap = cv2.VideoCapture(input_file)
+    if not cap.isOpened():
+        print(f"Error: Cannot open video file '{input_file}'")
+        return False
+    
+    # Built under a dot name (never served) and renamed when complete, so a
+    # failed run leaves neither a half-built folder nor a broken playlist
+    build_dir = os.path.join(video_dir, f'.{version}.partial')
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+    segments = []
+    try:
+        segments = encode_and_split(cap, build_dir, segment_duration)
+    finally:
+        cap.release()
+        if not segments:
+            # Failed or interrupted: leave nothing behind
+            shutil.rmtree(build_dir, ignore_errors=True)
+            try:
+                os.rmdir(video_dir)  # Only removed if no earlier version is in it
+            except OSError:
+                pass
+    if not segments:
+        return False
+    
+    shutil.rmtree(segment_dir, ignore_errors=True)
+    os.rename(build_dir, segment_dir)
+    write_hls_playlist(os.path.join(video_dir, HLS_PLAYLIST), segments, prefix=f'{version}/')
+    
+    # Segments of earlier versions are no longer listed
+    for name in os.listdir(video_dir):
+        if name != version and not name.startswith('.') and os.path.isdir(os.path.join(video_dir, name)):
+            shutil.rmtree(os.path.join(video_dir, name), ignore_errors=True)
+    
+    print(f"\nSegmenting complete! {len(segments)} segments, playlist: {os.path.join(video_dir, HLS_PLAYLIST)}")
+    return True
+
+
+def encode_and_split(cap, segment_dir, segment_duration):
+    """
+    Encode an opened video to one MPEG-TS stream and cut it into segments
+    
+    Returns:
+        List of (segment file name, duration in seconds); empty on failure
+    
+    Raises:
+        ValueError: If the encoded stream cannot be cut
+    """
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    
+    # Encode the whole video as one stream, so timestamps are continuous, then cut it
+    ts_file = os.path.join(segment_dir, 'full.ts')
+    out = open_ts_writer(ts_file, fps, (width, height))
+    if out is None:
+        print("Error: This OpenCV build has no H.264 encoder, which HLS players require")
+        return []
+    
+    frame_num = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        out.write(frame)
+        frame_num += 1
+        if frame_num % 30 == 0 and frame_count:
+            print(f"Encoding: {frame_num}/{frame_count} frames ({frame_num / frame_count * 100:.1f}%)", end='\r')
+    out.release()
+    
+    try:
+        segments = split_transport_stream(ts_file, segment_dir, segment_duration, fps)
+    finally:
+        os.remove(ts_file)
+    if not segments:
+        print("\nError: No frames could be encoded")
+    return segments
+
+
 def create_sample_video(output_file='assets/videos/sample_video.mp4', duration=10, fps=24):
     """
     Create a sample test video
@@ -172,14 +451,37 @@ def main():
         print("Usage:")
         print("  python web_video_converter.py <input_video>")
         print("  python web_video_converter.py --sample")
+        print("  python web_video_converter.py --hls [input_video] [segment_seconds]")
         print()
         print("Examples:")
         print("  python web_video_converter.py myvideo.avi")
         print("  python web_video_converter.py --sample")
+        print("  python web_video_converter.py --hls assets/videos/myvideo.mp4")
+        print("  python web_video_converter.py --hls          (every video in assets/videos)")
         print()
         return
     
-    if sys.argv[1] == '--sample':
+    if sys.argv[1] == '--hls':
+        # HLS segments and playlist for one video, or for the whole library
+        args = sys.argv[2:]
+        segment_duration = HLS_SEGMENT_DURATION
+        if args and args[-1].replace('.', '', 1).isdigit():
+            segment_duration = float(args.pop())
+        
+        if args:
+            inputs = args
+        else:
+            inputs = [os.path.join(VIDEOS_FOLDER, name) for name in sorted(os.listdir(VIDEOS_FOLDER))
+                      if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS]
+        
+        for input_file in inputs:
+            # One broken video must not stop the rest of the library
+            try:
+                segment_for_hls(input_file, segment_duration=segment_duration)
+            except Exception as e:
+                print(f"\nError: Could not segment '{input_file}': {e}")
+            print()
+    elif sys.argv[1] == '--sample':
         # Create sample video
         duration = 15
         if len(sys.argv) > 2: